@@ -6,51 +6,50 @@ AI 异常检测器 (简化版)
 
 import time
 import math
+import itertools
 from typing import Dict, Any, List
 from collections import deque
 
+import numpy as np
+
+from telemetry_format import METRIC_FIELDS, INTEGER_FIELDS
+from rule_engine import RuleEngine
+from rolling_stats import RollingStats
+
 class AnomalyDetector:
     """异常检测器"""
     
-    def __init__(self):
-        # 检测阈值 - 降低阈值使异常更容易被检测
-        self.risk_threshold = 30.0  # 从70降到30
-        self.anomaly_threshold = 40.0  # 从80降到40
+    def __init__(self, clock=None, rules_path: str = None, baseline_windows=(),
+                 ewma_alphas=()):
+        """
+        Args:
+            clock: 时间源（默认真实时间，可注入 sim_clock.VirtualClock）
+            rules_path: 规则配置文件，默认 configs/detection_rules.json
+            baseline_windows: 额外维护的基线窗口长度（样本数），如 (60, 3600)；规则评分不使用基线，
+                              默认不维护（每个样本省去滚动统计的更新）
+            ewma_alphas: 基线 EWMA 平滑系数
+        """
+        self.clock = clock or time
         
-        # 特征权重
-        self.weights = {
-            'packets_per_sec': 0.2,
-            'bytes_per_sec': 0.15,
-            'active_connections': 0.25,
-            'dropped_packets': 0.3,
-            'cpu_usage': 0.1
-        }
+        # 评分阈值、分类规则和置信度表由规则引擎从配置编译，可热更新
+        self.rule_engine = RuleEngine(rules_path)
         
-        # 历史数据窗口
+        # 历史数据窗口，每项保存样本及其计算时的风险评分和分类
+        # {'metrics': 指标字典, 'risk_score': 未经防御折减的评分, 'anomaly_type': 分类}
         self.history_window = deque(maxlen=10)
         
-        # 异常类型定义
-        self.anomaly_patterns = {
-            'ddos_attack': {
-                'packets_per_sec_threshold': 5000,
-                'connections_threshold': 500,
-                'weight': 0.4
-            },
-            'resource_exhaustion': {
-                'cpu_threshold': 80.0,
-                'memory_threshold': 85.0,
-                'error_threshold': 20,
-                'weight': 0.3
-            },
-            'packet_loss': {
-                'dropped_packets_threshold': 50,
-                'weight': 0.3
-            },
-            'suspicious_behavior': {
-                'encryption_ratio_threshold': 0.8,
-                'weight': 0.2
-            }
-        }
+        # 流量突增窗口：之前 window-1 个样本的包速率（Python 标量，不经过 NumPy）
+        self._surge_prior = self.rule_engine.table.surge_window - 1
+        self._surge_pps = deque(maxlen=max(self._surge_prior, 1))
+        
+        # 可选的长期基线（流式滚动统计，每个样本 O(1) 更新），与规则表无关，规则热更新时保留
+        self.baseline_windows = ()
+        self.ewma_alphas = tuple(ewma_alphas)
+        self.rolling_stats = None
+        # 检测时（更新基线之前）计算样本偏离的基线窗口，结果写入 baseline_zscore，见 track_deviation
+        self.deviation_window = None
+        self.deviation_min_samples = 1
+        self.enable_baseline(*baseline_windows)
         
         # 统计信息
         self.detection_stats = {
@@ -60,193 +59,307 @@ class AnomalyDetector:
             'last_detection_time': 0
         }
     
-    def detect_anomaly(self, metrics: Dict[str, Any], defense_controller=None) -> Dict[str, Any]:
+    def enable_baseline(self, *lengths: int):
+        """
+        增加长期基线窗口（样本数）。已有窗口的状态保留，新窗口从下一个样本开始累积
+        """
+        lengths = tuple(length for length in lengths if length not in self.baseline_windows)
+        if not lengths:
+            return
+        self.baseline_windows = tuple(sorted(self.baseline_windows + lengths))
+        stats = RollingStats(windows=self.baseline_windows, ewma_alphas=self.ewma_alphas)
+        if self.rolling_stats is not None:
+            stats.windows.update(self.rolling_stats.windows)
+            stats.ewma = self.rolling_stats.ewma
+            stats.count = self.rolling_stats.count
+            stats.total_min = self.rolling_stats.total_min
+            stats.total_max = self.rolling_stats.total_max
+        self.rolling_stats = stats
+    
+    def track_deviation(self, length: int, min_samples: int = 1):
+        """
+        每次检测时先计算样本相对基线窗口的偏离，再把样本计入基线，结果写入 baseline_zscore
+        （事后调用 baseline_deviation 时样本已在基线中，偏离被低估）
+        Args:
+            length: 基线窗口长度（未启用时自动启用）
+            min_samples: 基线至少需要的样本数，不足时 baseline_zscore 为 inf
+        """
+        self.enable_baseline(length)
+        self.deviation_window = length
+        self.deviation_min_samples = min_samples
+    
+    def _resize_surge_window(self, table):
+        """规则热更新改变突增窗口时，保留已有的包速率（不足时从历史窗口补齐）"""
+        self._surge_prior = table.surge_window - 1
+        recent = [hist['metrics']['packets_per_sec'] for hist in self.history_window]
+        self._surge_pps = deque(recent[-self._surge_prior:] if self._surge_prior else (),
+                                maxlen=max(self._surge_prior, 1))
+    
+    def _surge_average(self, current_pps: float, table):
+        """当前样本与之前 window-1 个样本的平均包速率，历史不足时返回 None"""
+        if table.surge_window - 1 != self._surge_prior:
+            self._resize_surge_window(table)
+        if self._surge_prior == 0:
+            return current_pps
+        if len(self._surge_pps) < self._surge_prior:
+            return None
+        return (sum(self._surge_pps) + current_pps) / table.surge_window
+    
+    @property
+    def risk_threshold(self) -> float:
+        return self.rule_engine.table.risk_threshold
+    
+    @property
+    def anomaly_threshold(self) -> float:
+        return self.rule_engine.table.anomaly_threshold
+    
+    def detect_anomaly(self, metrics: Dict[str, Any], defense_controller=None,
+                       values: List[float] = None) -> Dict[str, Any]:
         """
         检测异常
+        Args:
+            metrics: 网络指标
+            defense_controller: 防御控制器
+            values: 已提取的特征（RuleEngine.feature_values 的结果），由检测流水线传入时不再重复提取
         """
-        current_time = time.time()
-        self.history_window.append(metrics)
-        risk_score = self._calculate_risk_score(metrics)
-        # 新增：防御激活时风险分数降低
-        if defense_controller is not None and getattr(defense_controller, 'defense_active', False):
-            risk_score = max(risk_score - 60, 0)
-        anomaly_type = self._classify_anomaly(metrics, risk_score)
-        is_anomaly = risk_score > self.anomaly_threshold
-        confidence = self._calculate_confidence(metrics, risk_score)
+        current_time = self.clock.time()
+        # 整个检测过程使用同一张规则表，热更新只影响下一次检测
+        table = self.rule_engine.table
+        if values is None:
+            values = RuleEngine.feature_values(metrics)
+        raw_score = self._calculate_risk_score(metrics, values, table)
+        risk_score = raw_score
+        # 模拟防御效果时（未接入防御执行），防御激活后风险分数降低
+        if defense_controller is not None and getattr(defense_controller, 'score_penalty_active', False):
+            risk_score = max(risk_score - table.defense_penalty, 0)
+        anomaly_type = RuleEngine.classify(values, risk_score, table)
+        is_anomaly = risk_score > table.anomaly_threshold
+        self.history_window.append({
+            'metrics': metrics,
+            'risk_score': raw_score,
+            'anomaly_type': anomaly_type
+        })
+        if self._surge_prior:
+            self._surge_pps.append(values[0])
+        baseline_zscore = None
+        if self.rolling_stats is not None:
+            if self.deviation_window is not None:
+                baseline_zscore = self._zscore(values[:len(METRIC_FIELDS)], self.deviation_min_samples,
+                                               self.deviation_window)
+            self.rolling_stats.update(values[:len(METRIC_FIELDS)])
+        confidence = self._calculate_confidence(risk_score, anomaly_type, table)
         if is_anomaly:
             self.detection_stats['total_detections'] += 1
             self.detection_stats['last_detection_time'] = current_time
-        return {
+        result = {
             'is_anomaly': is_anomaly,
             'risk_score': risk_score,
             'confidence': confidence,
             'anomaly_type': anomaly_type,
             'timestamp': current_time,
-            'features': self._extract_features(metrics)
+            'features': self._extract_features(metrics, values)
         }
+        if baseline_zscore is not None:
+            result['baseline_zscore'] = baseline_zscore
+        return result
     
-    def _calculate_risk_score(self, metrics: Dict[str, Any]) -> float:
-        """计算风险评分 (0-100)"""
-        risk_score = 0.0
-        
-        # 基于丢包率的风险
-        if metrics['dropped_packets'] > 20:
-            risk_score += 40
-        elif metrics['dropped_packets'] > 10:
-            risk_score += 25
-        elif metrics['dropped_packets'] > 5:
-            risk_score += 15
-        elif metrics['dropped_packets'] > 2:
-            risk_score += 8
-        else:
-            risk_score += 2  # 基础风险
+    def detect_batch(self, samples: np.ndarray, sequential: bool = False,
+                     defense_controller=None) -> Dict[str, Any]:
+        """
+        批量检测异常
+        Args:
+            samples: (N, 9) 指标矩阵，列顺序见 METRIC_FIELDS
+            sequential: True 表示同一设备按时间排列的样本（接续并更新历史窗口），
+                        False 表示同一时刻的 N 个不同设备（各自视为无历史）
+            defense_controller: 防御控制器
+        Returns:
+            与 detect_anomaly 逐条结果一致的数组: risk_score, is_anomaly, confidence, anomaly_type
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, len(METRIC_FIELDS))
+        n = len(samples)
+        current_time = self.clock.time()
+        table = self.rule_engine.table
+        pps = samples[:, 0]
+        static_scores = RuleEngine.batch_static_scores(samples, table)
         
-        # 基于连接数的风险
-        if metrics['active_connections'] > 500:
-            risk_score += 35
-        elif metrics['active_connections'] > 200:
-            risk_score += 25
-        elif metrics['active_connections'] > 100:
-            risk_score += 15
-        elif metrics['active_connections'] > 50:
-            risk_score += 8
+        surge_window = table.surge_window
+        history_length = table.confidence_history_length
+        if sequential:
+            # 接续已有历史：流量突增取滚动窗口中的样本，置信度取历史窗口中的评分
+            if surge_window - 1 != self._surge_prior:
+                self._resize_surge_window(table)
+            if self._surge_prior > 0:
+                prior_pps = np.array(self._surge_pps, dtype=np.float64)
+                surge_ready = len(prior_pps) + np.arange(n) + 1 >= surge_window
+            else:
+                prior_pps = np.empty(0)
+                surge_ready = np.ones(n, dtype=bool)
+            all_pps = np.concatenate([prior_pps, pps])
+            pps_idx = np.arange(n) + len(prior_pps)
+            # 按时间顺序累加，整数包速率与滚动和逐条结果一致
+            total = np.zeros(n, dtype=np.float64)
+            for k in range(surge_window - 1, -1, -1):
+                total += all_pps[np.maximum(pps_idx - k, 0)]
+            recent_avg = total / surge_window
+            surge = np.where(surge_ready, RuleEngine.batch_surge_scores(pps, recent_avg, table),
+                             table.surge_points[0])
+            
+            prior = list(self.history_window)[-(history_length - 1):] if history_length > 1 else []
+            idx = np.arange(n) + len(prior)
+            window_len = np.minimum(self.history_window.maxlen, len(self.history_window) + np.arange(n) + 1)
         else:
-            risk_score += 3  # 基础风险
+            surge = table.surge_points[0]
         
-        # 基于CPU使用率的风险
-        if metrics['cpu_usage'] > 70:
-            risk_score += 30
-        elif metrics['cpu_usage'] > 60:
-            risk_score += 20
-        elif metrics['cpu_usage'] > 50:
-            risk_score += 12
-        elif metrics['cpu_usage'] > 40:
-            risk_score += 6
-        else:
-            risk_score += 2  # 基础风险
+        raw_score = np.minimum(table.max_score, static_scores + surge)
+        risk_score = raw_score
+        if defense_controller is not None and getattr(defense_controller, 'score_penalty_active', False):
+            risk_score = np.maximum(risk_score - table.defense_penalty, 0)
         
-        # 基于错误计数的风险
-        if metrics['error_count'] > 10:
-            risk_score += 35
-        elif metrics['error_count'] > 5:
-            risk_score += 25
-        elif metrics['error_count'] > 2:
-            risk_score += 15
-        elif metrics['error_count'] > 0:
-            risk_score += 8
-        else:
-            risk_score += 2  # 基础风险
+        anomaly_type = RuleEngine.batch_classify(RuleEngine.batch_features(samples), risk_score, table)
+        is_anomaly = risk_score > table.anomaly_threshold
         
-        # 基于流量突增的风险
-        if len(self.history_window) >= 3:
-            recent_avg = sum([h['packets_per_sec'] for h in list(self.history_window)[-3:]]) / 3
-            current_pps = metrics['packets_per_sec']
-            if current_pps > recent_avg * 2:
-                risk_score += 30
-            elif current_pps > recent_avg * 1.5:
-                risk_score += 20
-            elif current_pps > recent_avg * 1.2:
-                risk_score += 10
-            else:
-                risk_score += 3  # 基础风险
-        else:
-            risk_score += 3  # 基础风险
+        # 置信度（历史部分使用各样本自身入窗时的评分）
+        recent_anomalies = has_history = None
+        if sequential:
+            has_history = window_len >= history_length
+            all_raw = np.concatenate([np.array([h['risk_score'] for h in prior], dtype=np.float64), raw_score])
+            above = all_raw > table.risk_threshold
+            recent_anomalies = np.zeros(n, dtype=np.int64)
+            for k in range(history_length):
+                recent_anomalies += has_history & above[np.maximum(idx - k, 0)]
+        confidence = RuleEngine.batch_confidence(risk_score, anomaly_type, recent_anomalies, has_history, table)
         
-        # 限制最大风险分数
-        return min(100.0, risk_score)
-    
-    def _classify_anomaly(self, metrics: Dict[str, Any], risk_score: float) -> str:
-        """分类异常类型"""
-        # 首先检查是否真的是异常（基于风险评分）
-        if risk_score <= self.anomaly_threshold:
-            return "normal"
+        if sequential:
+            if self._surge_prior:
+                self._surge_pps.extend(pps[-self._surge_prior:].astype(np.int64).tolist())
+            if self.rolling_stats is not None:
+                self.rolling_stats.update_block(samples)
+            tail = slice(-self.history_window.maxlen, None)
+            for row, score, kind in zip(samples[tail], raw_score[tail].tolist(), anomaly_type[tail].tolist()):
+                self.history_window.append({
+                    'metrics': self._row_to_metrics(row),
+                    'risk_score': score,
+                    'anomaly_type': kind
+                })
         
-        # DDoS攻击检测
-        if (metrics['packets_per_sec'] > self.anomaly_patterns['ddos_attack']['packets_per_sec_threshold'] and
-            metrics['active_connections'] > self.anomaly_patterns['ddos_attack']['connections_threshold']):
-            return "ddos_attack"
+        detections = int(np.count_nonzero(is_anomaly))
+        if detections:
+            self.detection_stats['total_detections'] += detections
+            self.detection_stats['last_detection_time'] = current_time
         
-        # 资源耗尽检测
-        if (metrics['cpu_usage'] > self.anomaly_patterns['resource_exhaustion']['cpu_threshold'] or
-            metrics['memory_usage'] > self.anomaly_patterns['resource_exhaustion']['memory_threshold'] or
-            metrics['error_count'] > self.anomaly_patterns['resource_exhaustion']['error_threshold']):
-            return "resource_exhaustion"
+        return {
+            'is_anomaly': is_anomaly,
+            'risk_score': risk_score,
+            'confidence': confidence,
+            'anomaly_type': anomaly_type,
+            'timestamp': current_time
+        }
+    
+    def _row_to_metrics(self, row: np.ndarray) -> Dict[str, Any]:
+        """将指标行转换为历史窗口使用的字典"""
+        metrics = dict(zip(METRIC_FIELDS, row.tolist()))
+        for name in INTEGER_FIELDS:
+            metrics[name] = int(metrics[name])
+        return metrics
+    
+    def _calculate_risk_score(self, metrics: Dict[str, Any], values: List[float] = None,
+                              table=None) -> float:
+        """计算风险评分 (0-100)"""
+        table = table or self.rule_engine.table
+        if values is None:
+            values = RuleEngine.feature_values(metrics)
         
-        # 丢包异常检测
-        if metrics['dropped_packets'] > self.anomaly_patterns['packet_loss']['dropped_packets_threshold']:
-            return "packet_loss"
+        # 丢包、连接数、CPU、错误计数的分段评分
+        risk_score = RuleEngine.static_score(values, table)
         
-        # 可疑行为检测
-        if metrics['encryption_hits'] + metrics['decryption_hits'] > 0:
-            encryption_ratio = metrics['encryption_hits'] / (metrics['encryption_hits'] + metrics['decryption_hits'])
-            if encryption_ratio > self.anomaly_patterns['suspicious_behavior']['encryption_ratio_threshold']:
-                return "suspicious_behavior"
+        # 基于流量突增的风险（之前 window-1 个样本的滚动和 + 当前样本）
+        recent_avg = self._surge_average(metrics['packets_per_sec'], table)
+        risk_score += RuleEngine.surge_score(metrics['packets_per_sec'], recent_avg, table)
         
-        # 基于风险评分的通用分类（只有在超过阈值时）
-        if risk_score > 90:
-            return "critical_anomaly"
-        elif risk_score > 80:
-            return "high_risk_anomaly"
-        elif risk_score > 60:
-            return "medium_risk_anomaly"
-        elif risk_score > 40:
-            return "low_risk_anomaly"
-        else:
-            return "normal"
+        # 限制最大风险分数
+        return min(table.max_score, risk_score)
+    
+    def _classify_anomaly(self, metrics: Dict[str, Any], risk_score: float) -> str:
+        """分类异常类型"""
+        return RuleEngine.classify(RuleEngine.feature_values(metrics), risk_score, self.rule_engine.table)
     
-    def _calculate_confidence(self, metrics: Dict[str, Any], risk_score: float) -> float:
+    def _calculate_confidence(self, risk_score: float, anomaly_type: str, table=None) -> float:
         """计算检测置信度 (0-1)"""
-        confidence = 0.5  # 基础置信度
+        table = table or self.rule_engine.table
         
-        # 基于历史数据的置信度调整
-        if len(self.history_window) >= 5:
+        # 基于历史数据的置信度调整（使用各样本入窗时已计算的评分）
+        recent_anomalies = None
+        if len(self.history_window) >= table.confidence_history_length:
             recent_anomalies = 0
-            for hist in list(self.history_window)[-5:]:
-                if self._calculate_risk_score(hist) > self.risk_threshold:
+            for hist in itertools.islice(reversed(self.history_window), table.confidence_history_length):
+                if hist['risk_score'] > table.risk_threshold:
                     recent_anomalies += 1
-            
-            # 如果最近有多个异常，增加置信度
-            if recent_anomalies >= 3:
-                confidence += 0.3
-            elif recent_anomalies >= 1:
-                confidence += 0.1
-        
-        # 基于风险评分的置信度调整
-        if risk_score > 90:
-            confidence += 0.3
-        elif risk_score > 80:
-            confidence += 0.2
-        elif risk_score > 70:
-            confidence += 0.1
         
-        # 基于异常类型的置信度调整
-        anomaly_type = self._classify_anomaly(metrics, risk_score)
-        if anomaly_type in ['ddos_attack', 'resource_exhaustion']:
-            confidence += 0.2
-        elif anomaly_type in ['packet_loss', 'suspicious_behavior']:
-            confidence += 0.1
-        
-        return min(1.0, confidence)
+        return RuleEngine.confidence(risk_score, anomaly_type, recent_anomalies, table)
     
-    def _extract_features(self, metrics: Dict[str, Any]) -> Dict[str, float]:
-        """提取特征用于分析"""
+    def _extract_features(self, metrics: Dict[str, Any], values: List[float] = None) -> Dict[str, float]:
+        """提取特征用于分析（传入 values 时直接取已提取的特征，不再查字典）"""
+        if values is None:
+            values = RuleEngine.feature_values(metrics)
+        encryption_hits, decryption_hits = values[4], values[5]
         return {
-            'packets_per_sec': metrics['packets_per_sec'],
-            'bytes_per_sec': metrics['bytes_per_sec'],
-            'active_connections': metrics['active_connections'],
-            'dropped_packets': metrics['dropped_packets'],
-            'cpu_usage': metrics['cpu_usage'],
-            'memory_usage': metrics['memory_usage'],
-            'error_count': metrics['error_count'],
-            'encryption_ratio': (metrics['encryption_hits'] / (metrics['encryption_hits'] + metrics['decryption_hits'] + 1))
+            'packets_per_sec': values[0],
+            'bytes_per_sec': values[1],
+            'active_connections': values[2],
+            'dropped_packets': values[3],
+            'cpu_usage': values[6],
+            'memory_usage': values[7],
+            'error_count': values[8],
+            'encryption_ratio': (encryption_hits / (encryption_hits + decryption_hits + 1))
         }
     
     def update_thresholds(self, risk_threshold: float = None, anomaly_threshold: float = None):
-        """更新检测阈值"""
+        """更新检测阈值（重新编译规则表并原子替换）"""
+        overrides = {}
         if risk_threshold is not None:
-            self.risk_threshold = risk_threshold
+            overrides['risk_threshold'] = risk_threshold
         if anomaly_threshold is not None:
-            self.anomaly_threshold = anomaly_threshold
+            overrides['anomaly_threshold'] = anomaly_threshold
+        if overrides:
+            self.rule_engine.update(**overrides)
+    
+    def reload_rules(self, rules_path: str = None):
+        """从配置文件热加载规则"""
+        self.rule_engine.reload(rules_path)
+    
+    def baseline_deviation(self, metrics: Dict[str, Any], min_samples: int = 1, length: int = None) -> float:
+        """
+        样本相对基线窗口的偏离程度：各指标 |x - 均值| / 标准差 的最大值
+        Args:
+            metrics: 网络指标
+            min_samples: 基线至少需要的样本数，不足时返回 inf（视为无法判断）
+            length: 基线窗口长度，默认最长的基线窗口；未启用该窗口时返回 inf
+        """
+        return self._zscore([metrics[name] for name in METRIC_FIELDS], min_samples, length)
+    
+    def _zscore(self, values, min_samples: int, length: int = None) -> float:
+        if self.rolling_stats is None:
+            return float('inf')
+        if length is None:
+            length = max(self.baseline_windows)
+        if length not in self.rolling_stats.windows:
+            return float('inf')
+        window = self.rolling_stats.window(length)
+        if window.count < min_samples:
+            return float('inf')
+        deviation = np.abs(np.asarray(values, dtype=np.float64) - window.total / window.count)
+        std = np.sqrt(window.variance())
+        # 标准差为 0 的指标：与均值相同时偏离为 0，否则为 inf
+        zscore = np.divide(deviation, std, out=np.where(deviation > 0, np.inf, 0.0), where=std > 0)
+        return float(zscore.max())
+    
+    def get_baseline(self, length: int = None) -> Dict[str, Dict[str, float]]:
+        """基线窗口的各指标统计（均值、标准差、最小值、最大值），默认最长的基线窗口；未启用基线时为空"""
+        if self.rolling_stats is None:
+            return {}
+        if length is None:
+            length = max(self.baseline_windows)
+        return self.rolling_stats.get_summary(length)
     
     def get_statistics(self) -> Dict[str, Any]:
         """获取检测统计信息"""
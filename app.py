@@ -5,12 +5,19 @@ from flask import Flask, render_template, jsonify, request
 from telemetry_simulator import TelemetrySimulator
 from anomaly_detector import AnomalyDetector
 from defense_controller import DefenseController
+from defense_enforcer import DefenseEnforcer
+from rule_dispatcher import RuleDispatcher
+from telemetry_format import METRIC_FIELDS, INTEGER_FIELDS
 from integrate_ai_detector import HybridAnomalyDetector
+from detection_pipeline import DetectionPipeline
+import os
 import threading
 import time
 import json
 import logging
 
+import numpy as np
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,9 +28,23 @@ app = Flask(__name__)
 telemetry_simulator = None
 anomaly_detector = None
 defense_controller = None
+# 防御执行：把生效规则作用到模拟指标上（位于模拟器和检测器之间）
+defense_enforcer = None
 simulation_thread = None
 running = False
 
+# 时间源（默认真实时间，可替换为 sim_clock.VirtualClock 加速运行）
+clock = time
+
+# 防御规则日志目录（相对应用目录，与启动时的工作目录无关），重启后从中恢复仍然有效的规则
+DEFENSE_JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "defense_journal")
+
+# 模拟循环的 tick 时长（秒），也是防御执行令牌桶的补充周期
+SIMULATION_TICK = 1.0
+
+# 每个 tick 等待 AI 分支的时限（秒），超时则本 tick 使用规则评分并标记为降级
+HYBRID_AI_DEADLINE = 0.25
+
 # 全局数据存储
 current_metrics = {}
 current_risk_score = 0
@@ -32,37 +53,59 @@ system_status = "normal"
 
 # 新增：全局变量
 hybrid_detector = None
+# 检测流水线（特征 → 规则 → AI 融合 → 防御），每个 tick 只评分一次
+detection_pipeline = None
 
 # 初始化组件
-def initialize_components():
-    """初始化所有组件"""
-    global telemetry_simulator, anomaly_detector, defense_controller
+def initialize_components(clock_source=None, journal_dir=None):
+    """初始化所有组件（journal_dir 为 None 时不持久化防御规则，可在启动时用 open_defense_journal 打开）"""
+    global telemetry_simulator, anomaly_detector, defense_controller, defense_enforcer, clock, detection_pipeline
     
     logger.info("初始化系统组件...")
     
+    # 设置时间源
+    clock = clock_source or time
+    
     # 初始化数据模拟器
-    telemetry_simulator = TelemetrySimulator()
+    telemetry_simulator = TelemetrySimulator(clock=clock)
     
     # 初始化异常检测器
-    anomaly_detector = AnomalyDetector()
+    anomaly_detector = AnomalyDetector(clock=clock)
     
-    # 初始化防御控制器，传入模拟器
-    defense_controller = DefenseController(simulator=telemetry_simulator)
+    # 初始化防御控制器，规则经下发队列安装到防御执行模型（单设备，目标 'local' 对应第 0 行）
+    if defense_controller is not None:
+        defense_controller.close()
+    defense_enforcer = DefenseEnforcer(1, target_rows={'local': 0})
+    defense_controller = DefenseController(simulator=telemetry_simulator, clock=clock,
+                                           dispatcher=RuleDispatcher(defense_enforcer), journal_dir=journal_dir)
     
     # 新增：设置模拟器的防御控制器引用
     telemetry_simulator.set_defense_controller(defense_controller)
     
+    # AI 检测器初始化前只使用规则评分
+    detection_pipeline = DetectionPipeline(anomaly_detector, defense_controller=defense_controller)
+    
     logger.info("所有组件初始化完成")
 
-# 立即初始化组件
+def open_defense_journal(journal_dir=DEFENSE_JOURNAL_DIR):
+    """打开防御规则日志并恢复有效规则；只在服务进程启动时调用，导入模块不会打开日志"""
+    defense_controller.open_journal(journal_dir)
+
+# 立即初始化组件（不打开防御规则日志）
 initialize_components()
 
 # 3. 初始化AI检测器
 def initialize_ai_detector():
-    global hybrid_detector
+    global hybrid_detector, detection_pipeline
     model_path = "models/anomaly_lstm.pth"
     config_path = "configs/ai_model_config.json"
-    hybrid_detector = HybridAnomalyDetector(ai_model_path=model_path, config_path=config_path)
+    if hybrid_detector is not None:
+        hybrid_detector.close()
+    # 与流水线共用规则检测器，同一样本只评分一次；AI 分支与规则分支并发执行
+    hybrid_detector = HybridAnomalyDetector(ai_model_path=model_path, config_path=config_path, clock=clock,
+                                            rule_detector=anomaly_detector, ai_deadline=HYBRID_AI_DEADLINE)
+    detection_pipeline = DetectionPipeline(anomaly_detector, hybrid_detector=hybrid_detector,
+                                           defense_controller=defense_controller)
 
 initialize_ai_detector()
 
@@ -84,7 +127,7 @@ def get_metrics():
         'metrics': current_metrics,
         'risk_score': current_risk_score,
         'status': system_status,
-        'timestamp': int(time.time())
+        'timestamp': int(clock.time())
     })
 
 @app.route('/api/alerts')
@@ -104,9 +147,18 @@ def get_defense_status():
         status = defense_controller.get_status()
         # 添加防御模式信息
         status['mode'] = defense_controller.mode
+        status['enforcement'] = defense_enforcer.get_stats()
         return jsonify(status)
     return jsonify({'active': False, 'rules': [], 'mode': 'auto'})
 
+@app.route('/api/defense/stats')
+def get_defense_stats():
+    """获取防御统计聚合（近 5/10 分钟触发数、按动作/优先级的有效规则数、防御效果）"""
+    global defense_controller
+    if defense_controller:
+        return jsonify(defense_controller.get_defense_stats())
+    return jsonify({'total_active_rules': 0, 'active_by_action': {}, 'triggers_5m': 0, 'triggers_10m': 0})
+
 @app.route('/api/defense/trigger', methods=['POST'])
 def trigger_defense():
     """手动触发防御"""
@@ -282,7 +334,7 @@ def add_test_alert():
             'low_risk_anomaly': '检测到低风险异常'
         }
         
-        current_time = int(time.time())
+        current_time = int(clock.time())
         risk_score = risk_scores.get(alert_type, 50.0)
         message = messages.get(alert_type, f'检测到异常: {alert_type}')
         
@@ -311,89 +363,97 @@ def add_test_alert():
         logger.error(f"添加测试告警失败: {e}")
         return jsonify({'success': False, 'message': f'添加测试告警失败: {str(e)}'})
 
+def enforce_defense(metrics, dt=SIMULATION_TICK):
+    """把当前生效的防御规则作用到一个 tick 的模拟指标上（原地修改指标字典）"""
+    row = np.array([[metrics[name] for name in METRIC_FIELDS]], dtype=np.float64)
+    defense_enforcer.enforce(row, dt)
+    for name, value in zip(METRIC_FIELDS, row[0].tolist()):
+        metrics[name] = int(value) if name in INTEGER_FIELDS else value
+    return metrics
+
+def simulation_step():
+    """执行一次 模拟 → 防御执行 → 检测 → 防御 循环"""
+    global current_metrics, current_risk_score, current_alerts, system_status
+    
+    # 获取模拟数据，生效的防御规则（限速、丢弃、连接数上限）先作用到指标上
+    metrics = enforce_defense(telemetry_simulator.get_metrics())
+    current_metrics = metrics
+    
+    # 检测流水线：规则评分 → AI 评分与融合 → 防御（自动模式），告警使用融合结果
+    result = detection_pipeline.process(metrics)['result']
+    
+    # 确保风险评分正确更新
+    current_risk_score = float(result.get('risk_score', 0))
+    
+    # 更新系统状态
+    if current_risk_score > 70:
+        system_status = "critical"
+    elif current_risk_score > 50:
+        system_status = "warning"
+    else:
+        system_status = "normal"
+    
+    # 检测异常和正常状态，都要生成通知
+    is_anomaly = result.get('is_anomaly', False)
+    anomaly_type = result.get('anomaly_type', 'normal')
+    current_time = int(clock.time())
+    
+    if is_anomaly and anomaly_type != 'normal' and current_risk_score > 40:
+        # 添加异常告警（避免重复告警）
+        # 检查最近5秒内是否已有相同类型的告警
+        recent_alerts = [a for a in current_alerts if current_time - a['timestamp'] < 5 and a['type'] == anomaly_type]
+        
+        if not recent_alerts:
+            alert = {
+                'timestamp': current_time,
+                'type': anomaly_type,
+                'risk_score': current_risk_score,
+                'message': f"检测到异常: {anomaly_type}, 风险评分: {current_risk_score:.1f}"
+            }
+            current_alerts.append(alert)
+            logger.info(f"添加异常告警: {anomaly_type}, 风险评分: {current_risk_score}")
+    
+    else:
+        # 系统正常时，定期添加正常状态通知（每20秒一次）
+        recent_normal_alerts = [a for a in current_alerts if current_time - a['timestamp'] < 20 and a['type'] == 'normal']
+        
+        if not recent_normal_alerts:
+            normal_alert = {
+                'timestamp': current_time,
+                'type': 'normal',
+                'risk_score': current_risk_score,
+                'message': f"系统运行正常，风险评分: {current_risk_score:.1f}"
+            }
+            current_alerts.append(normal_alert)
+            logger.info(f"添加正常状态通知: 风险评分: {current_risk_score}")
+    
+    # 清理超过30秒的旧告警
+    current_time = int(clock.time())
+    current_alerts = [a for a in current_alerts if current_time - a['timestamp'] < 30]
+    
+    # 保持最近10条告警
+    if len(current_alerts) > 10:
+        current_alerts = current_alerts[-10:]
+
 def simulation_loop():
     """模拟循环"""
-    global running, current_metrics, current_risk_score, current_alerts, system_status
-    
     logger.info("模拟循环已启动")
     
     while running:
         try:
-            # 获取模拟数据
-            metrics = telemetry_simulator.get_metrics()
-            current_metrics = metrics
-            
-            # 异常检测，传入防御控制器
-            result = anomaly_detector.detect_anomaly(metrics, defense_controller=defense_controller)
-            
-            # 确保风险评分正确更新
-            current_risk_score = float(result.get('risk_score', 0))
-            
-            # 更新系统状态
-            if current_risk_score > 70:
-                system_status = "critical"
-            elif current_risk_score > 50:
-                system_status = "warning"
-            else:
-                system_status = "normal"
-            
-            # 检测异常和正常状态，都要生成通知
-            is_anomaly = result.get('is_anomaly', False)
-            anomaly_type = result.get('anomaly_type', 'normal')
-            current_time = int(time.time())
-            
-            if is_anomaly and anomaly_type != 'normal' and current_risk_score > 40:
-                # 检查是否需要触发防御（自动模式）
-                if defense_controller.mode == "auto":
-                    defense_controller.trigger_defense(current_risk_score, anomaly_type)
-                
-                # 添加异常告警（避免重复告警）
-                # 检查最近5秒内是否已有相同类型的告警
-                recent_alerts = [a for a in current_alerts if current_time - a['timestamp'] < 5 and a['type'] == anomaly_type]
-                
-                if not recent_alerts:
-                    alert = {
-                        'timestamp': current_time,
-                        'type': anomaly_type,
-                        'risk_score': current_risk_score,
-                        'message': f"检测到异常: {anomaly_type}, 风险评分: {current_risk_score:.1f}"
-                    }
-                    current_alerts.append(alert)
-                    logger.info(f"添加异常告警: {anomaly_type}, 风险评分: {current_risk_score}")
-            
-            else:
-                # 系统正常时，定期添加正常状态通知（每20秒一次）
-                recent_normal_alerts = [a for a in current_alerts if current_time - a['timestamp'] < 20 and a['type'] == 'normal']
-                
-                if not recent_normal_alerts:
-                    normal_alert = {
-                        'timestamp': current_time,
-                        'type': 'normal',
-                        'risk_score': current_risk_score,
-                        'message': f"系统运行正常，风险评分: {current_risk_score:.1f}"
-                    }
-                    current_alerts.append(normal_alert)
-                    logger.info(f"添加正常状态通知: 风险评分: {current_risk_score}")
-            
-            # 清理超过30秒的旧告警
-            current_time = int(time.time())
-            current_alerts = [a for a in current_alerts if current_time - a['timestamp'] < 30]
-            
-            # 保持最近10条告警
-            if len(current_alerts) > 10:
-                current_alerts = current_alerts[-10:]
-            
-            # 调用AI检测器
-            ai_result = hybrid_detector.detect_anomaly(metrics, defense_controller)
+            simulation_step()
             
-            # 等待1秒
-            time.sleep(1)
+            # 等待一个 tick
+            clock.sleep(SIMULATION_TICK)
             
         except Exception as e:
             logger.error(f"模拟循环错误: {e}")
-            time.sleep(1)
+            clock.sleep(1)
 
 if __name__ == '__main__':
+    # 调试模式下重载器的监控进程也会执行这里，只在实际提供服务的子进程中打开防御规则日志
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        open_defense_journal()
     # 启动Flask应用
     logger.info("启动Web服务器...")
     app.run(host='0.0.0.0', port=5002, debug=True) 
\ No newline at end of file
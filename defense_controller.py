@@ -6,40 +6,62 @@
 
 import time
 import json
+import threading
 from typing import Dict, Any, List
 from collections import deque
 
+from rule_store import RuleStore
+from rule_dispatcher import RuleDispatcher
+from strategy_compiler import load_strategies, StrategyTemplate, ActionTemplate
+from defense_journal import DefenseJournal
+from rolling_stats import WindowedCounter
+
+# 优先级排序，用于判断已有规则是否覆盖新的触发
+PRIORITY_RANK = {'low': 0, 'medium': 1, 'high': 2}
+
+# 近期活动统计窗口（秒）：摘要中的近期活动、防御效果评分
+RECENT_ACTIVITY_WINDOW = 300
+EFFECTIVENESS_WINDOW = 600
+
 class DefenseController:
     """防御控制器"""
     
-    def __init__(self, simulator=None):
-        # 防御规则
-        self.defense_rules = []
-        self.max_rules = 100
+    def __init__(self, simulator=None, clock=None, hold_down: float = 10.0, coalesce: bool = True,
+                 dispatcher: RuleDispatcher = None, strategies_path: str = None, journal_dir: str = None,
+                 simulated_mitigation: bool = False):
+        """
+        Args:
+            simulator: 联动的 Telemetry 模拟器
+            clock: 时间源（默认真实时间，可注入 sim_clock.VirtualClock）
+            hold_down: 抑制窗口（秒），窗口内同一目标的同类触发且风险未升高时不再处理
+            coalesce: 是否合并等价规则（同动作、同目标的有效规则就地延长或升级，而不是重复下发）
+            dispatcher: 规则下发队列，默认使用进程内 Flow 表模拟器作为后端
+            strategies_path: 防御策略配置文件，默认 configs/defense_strategies.json
+            journal_dir: 防御规则日志目录，指定时持久化规则变更，启动时从快照和日志恢复有效规则
+            simulated_mitigation: 是否模拟防御效果（旧行为）：防御激活时直接关闭模拟器异常，
+                检测器按 defense_penalty 扣减风险评分。规则由 DefenseEnforcer 作用到指标上时应保持关闭
+        """
+        self.clock = clock or time
+        self.hold_down = hold_down
+        # 检测线程与 Web 线程共用控制器：规则变更、过期清理和日志读写都在同一把锁内完成
+        self._lock = threading.RLock()
+        self.coalesce = coalesce
         
-        # 防御策略
-        self.defense_strategies = {
-            'ddos_attack': {
-                'actions': ['rate_limit', 'connection_limit', 'drop_suspicious'],
-                'priority': 'high',
-                'duration': 300  # 5分钟
-            },
-            'resource_exhaustion': {
-                'actions': ['cpu_throttle', 'memory_limit', 'error_monitoring'],
-                'priority': 'medium',
-                'duration': 180  # 3分钟
-            },
-            'packet_loss': {
-                'actions': ['retry_mechanism', 'buffer_optimization'],
-                'priority': 'low',
-                'duration': 120  # 2分钟
-            },
-            'suspicious_behavior': {
-                'actions': ['traffic_analysis', 'encryption_monitoring'],
-                'priority': 'medium',
-                'duration': 240  # 4分钟
-            }
-        }
+        # 防御规则（按 ID、过期时间、动作、优先级索引）
+        self.max_rules = 50000
+        self.rule_store = RuleStore(max_rules=self.max_rules)
+        # 规则异步批量下发到 Flow 表，不占用检测线程
+        self.dispatcher = dispatcher or RuleDispatcher()
+        # (动作, 目标) -> 最近下发的规则 ID，用于查找等价规则
+        self._rules_by_target = {}
+        # (异常类型, 目标) -> (最近处理时间, 风险评分)，用于抑制窗口
+        self._last_handled = {}
+        self._last_handled_limit = 1024
+        # 规则变更日志（可选），重启后恢复仍然有效的规则
+        self.journal = None
+        
+        # 防御策略（启动时编译为模板，生成规则时按风险评分填充参数）
+        self.load_strategies(strategies_path)
         
         # 防御状态
         self.defense_active = False
@@ -51,205 +73,258 @@ class DefenseController:
             'total_triggers': 0,
             'successful_defenses': 0,
             'failed_defenses': 0,
-            'last_defense_time': 0
+            'last_defense_time': 0,
+            'suppressed_triggers': 0,
+            'rules_issued': 0,
+            'rules_extended': 0,
+            'rules_upgraded': 0
         }
         
         # 规则历史
         self.rule_history = deque(maxlen=50)
+        # 产生新规则或升级规则的触发次数，按 10 秒分桶（查询近期活动 O(1)）
+        self.recent_triggers = WindowedCounter(windows=(RECENT_ACTIVITY_WINDOW, EFFECTIVENESS_WINDOW),
+                                               bucket_width=10.0)
         
         # 新增：防御模式，auto/手动
         self.mode = "auto"  # "auto" 或 "manual"
         
         # 新增：与模拟器联动
         self.simulator = simulator
+        self.simulated_mitigation = simulated_mitigation
+        
+        if journal_dir:
+            self.open_journal(journal_dir)
+    
+    def open_journal(self, journal_dir: str):
+        """
+        打开防御规则日志并恢复其中仍然有效的规则（可在构造后调用，如 Web 服务启动时）
+        Args:
+            journal_dir: 防御规则日志目录
+        """
+        with self._lock:
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = DefenseJournal(journal_dir)
+            self._recover_rules()
+    
+    def _recover_rules(self):
+        """从日志恢复有效规则，重建合并索引并重新下发到 Flow 表"""
+        rules = self.journal.recover()
+        for evicted in self.rule_store.restore(rules, last_sequence=self.journal.last_sequence):
+            self.journal.record_remove(evicted['id'])
+            self._unindex_rule(evicted)
+        for rule in self.rule_store:
+            self._rules_by_target[(rule['action'], rule.get('target', 'local'))] = rule['id']
+            self.dispatcher.submit_install(rule)
+        if len(self.rule_store):
+            self.defense_active = True
+            print(f"已从防御日志恢复 {len(self.rule_store)} 条规则")
+        # 恢复期间已过期的规则按正常流程删除并记入日志
+        self._expire_rules(self.clock.time())
+    
+    def _checkpoint(self):
+        """日志累计足够多的事件后写快照并截断日志，保证恢复时间有界"""
+        if self.journal is not None and self.journal.needs_snapshot:
+            self.journal.snapshot(self.rule_store)
+    
+    @property
+    def score_penalty_active(self) -> bool:
+        """检测器是否应按 defense_penalty 扣减风险评分（仅模拟防御效果且防御已激活时）"""
+        return self.simulated_mitigation and self.defense_active
     
     def set_mode(self, mode):
-        assert mode in ("auto", "manual")
-        self.mode = mode
-        print(f"防御模式已切换为: {mode}")
+        with self._lock:
+            assert mode in ("auto", "manual")
+            self.mode = mode
+            print(f"防御模式已切换为: {mode}")
+    
+    def load_strategies(self, config_path: str = None):
+        """加载并编译防御策略，配置有误时保留当前策略并抛出 ValueError"""
+        with self._lock:
+            self._strategy_set = load_strategies(config_path)
+            self.defense_strategies = {name: template.spec
+                                       for name, template in self._strategy_set.strategies.items()}
     
-    def trigger_defense(self, risk_score: float, anomaly_type: str = None):
-        """触发防御机制"""
-        current_time = time.time()
+    def set_hold_down(self, seconds: float):
+        """设置抑制窗口（秒），0 表示不抑制"""
+        with self._lock:
+            self.hold_down = max(0.0, seconds)
+    
+    def trigger_defense(self, risk_score: float, anomaly_type: str = None, target: str = 'local'):
+        """
+        触发防御机制
+        Args:
+            risk_score: 风险评分
+            anomaly_type: 异常类型，未知类型时按风险评分选择策略
+            target: 防御目标（设备/端口标识），等价规则按 (动作, 目标) 合并
+        """
+        with self._lock:
+            current_time = self.clock.time()
         
-        # 确定防御策略
-        if anomaly_type and anomaly_type in self.defense_strategies:
-            strategy = self.defense_strategies[anomaly_type]
-        else:
-            # 基于风险评分选择策略
-            if risk_score > 90:
-                strategy = self.defense_strategies['ddos_attack']
-            elif risk_score > 80:
-                strategy = self.defense_strategies['resource_exhaustion']
-            elif risk_score > 70:
-                strategy = self.defense_strategies['packet_loss']
-            else:
-                strategy = self.defense_strategies['suspicious_behavior']
+            # 确定防御策略（未知类型时基于风险评分选择）
+            strategy = self._strategy_set.select(anomaly_type, risk_score)
         
-        # 生成防御规则
-        rules = self._generate_defense_rules(strategy, risk_score)
+            # 抑制窗口：持续异常期间同一目标的重复触发直接忽略，风险升高时仍然处理
+            trigger_key = (anomaly_type, target)
+            last_handled = self._last_handled.get(trigger_key)
+            if (self.coalesce and last_handled is not None and self.defense_active and
+                    current_time - last_handled[0] < self.hold_down and risk_score <= last_handled[1]):
+                self.defense_stats['suppressed_triggers'] += 1
+                return True
+            self._last_handled[trigger_key] = (current_time, risk_score)
         
-        # 应用规则
-        success = self._apply_defense_rules(rules)
+            # 生成防御规则（已有等价规则的动作就地延长或升级）
+            if self.coalesce:
+                self._expire_rules(current_time)
+                rules, extended, upgraded = self._coalesce_defense_rules(strategy, risk_score, target, current_time)
+            else:
+                rules, extended, upgraded = self._generate_defense_rules(strategy, risk_score, target, current_time), [], []
         
-        # 更新状态
-        self.defense_active = True
-        self.last_trigger_time = current_time
-        self.current_strategy = strategy
+            # 应用规则
+            success = self._apply_defense_rules(rules)
         
-        # 更新统计信息
-        self.defense_stats['total_triggers'] += 1
-        self.defense_stats['last_defense_time'] = current_time
+            # 更新状态
+            self.defense_active = True
+            self.last_trigger_time = current_time
+            self.current_strategy = strategy.spec
         
-        if success:
-            self.defense_stats['successful_defenses'] += 1
-        else:
-            self.defense_stats['failed_defenses'] += 1
+            # 更新统计信息
+            self.defense_stats['total_triggers'] += 1
+            self.defense_stats['last_defense_time'] = current_time
+            self.defense_stats['rules_extended'] += len(extended)
+            self.defense_stats['rules_upgraded'] += len(upgraded)
         
-        # 记录规则历史
-        rule_record = {
-            'timestamp': current_time,
-            'risk_score': risk_score,
-            'anomaly_type': anomaly_type,
-            'strategy': strategy,
-            'rules': rules,
-            'success': success
-        }
-        self.rule_history.append(rule_record)
+            if success:
+                self.defense_stats['successful_defenses'] += 1
+            else:
+                self.defense_stats['failed_defenses'] += 1
+            self._checkpoint()
         
-        print(f"防御已触发: 风险评分={risk_score:.1f}, 策略={strategy['actions']}")
+            # 记录规则历史（仅延长有效期的触发不记录）
+            if rules or upgraded:
+                rule_record = {
+                    'timestamp': current_time,
+                    'risk_score': risk_score,
+                    'anomaly_type': anomaly_type,
+                    'strategy': strategy.spec,
+                    'rules': rules + upgraded,
+                    'success': success
+                }
+                self.rule_history.append(rule_record)
+                self.recent_triggers.add(current_time)
+                print(f"防御已触发: 风险评分={risk_score:.1f}, 策略={strategy.spec['actions']}")
         
-        # 新增：防御激活后关闭模拟器异常
-        if self.simulator is not None:
-            self.simulator.anomaly_mode = False
-            self.simulator.anomaly_type = "normal"
-            print("防御激活，模拟器异常已关闭，系统恢复正常")
+            # 模拟防御效果时，防御激活后直接关闭模拟器异常
+            if self.simulated_mitigation and self.simulator is not None:
+                self.simulator.anomaly_mode = False
+                self.simulator.anomaly_type = "normal"
+                print("防御激活，模拟器异常已关闭，系统恢复正常")
         
-        return success
+            return success
     
-    def _generate_defense_rules(self, strategy: Dict[str, Any], risk_score: float) -> List[Dict[str, Any]]:
-        """生成防御规则"""
-        rules = []
+    def _coalesce_defense_rules(self, strategy: StrategyTemplate, risk_score: float, target: str,
+                                current_time: float):
+        """
+        按 (动作, 目标) 合并规则
+        Returns:
+            (需要新下发的规则, 就地延长的规则, 就地升级的规则)
+        """
+        new_rules, extended, upgraded = [], [], []
+        expires_time = current_time + strategy.duration
+        severity = (PRIORITY_RANK.get(strategy.priority, 0), risk_score)
         
-        for action in strategy['actions']:
-            rule = {
-                'id': f"rule_{int(time.time())}_{len(rules)}",
-                'action': action,
-                'priority': strategy['priority'],
-                'created_time': time.time(),
-                'expires_time': time.time() + strategy['duration'],
-                'conditions': self._get_action_conditions(action, risk_score),
-                'parameters': self._get_action_parameters(action, risk_score)
-            }
-            rules.append(rule)
+        for template in strategy.actions:
+            action = template.action
+            rule = self.rule_store.get(self._rules_by_target.get((action, target)))
+            if rule is None:
+                new_rules.append(self._build_rule(template, strategy, risk_score, target, current_time))
+                continue
+            
+            updates = {'expires_time': max(rule['expires_time'], expires_time)}
+            if (PRIORITY_RANK.get(rule['priority'], 0), rule.get('risk_score', 0)) < severity:
+                # 新触发更严重：就地升级优先级和参数
+                updates.update({
+                    'priority': strategy.priority,
+                    'risk_score': risk_score,
+                    'conditions': template.fill_conditions(risk_score),
+                    'parameters': template.fill_parameters(risk_score),
+                    'updated_time': current_time
+                })
+                self.rule_store.update(rule['id'], updates)
+                self.dispatcher.submit_install(rule)
+                if self.journal is not None:
+                    self.journal.record_update(rule['id'], updates)
+                upgraded.append(rule)
+                print(f"规则已升级: {action} (优先级: {strategy.priority})")
+            else:
+                self.rule_store.update(rule['id'], updates)
+                if self.journal is not None:
+                    self.journal.record_update(rule['id'], updates)
+                extended.append(rule)
         
-        return rules
+        return new_rules, extended, upgraded
     
-    def _get_action_conditions(self, action: str, risk_score: float) -> Dict[str, Any]:
-        """获取动作条件"""
-        conditions = {
-            'rate_limit': {
-                'packets_per_sec_threshold': 1000 + risk_score * 10,
-                'bytes_per_sec_threshold': 1000000 + risk_score * 10000
-            },
-            'connection_limit': {
-                'max_connections': max(50, 200 - risk_score * 2),
-                'connection_timeout': 30
-            },
-            'drop_suspicious': {
-                'suspicious_patterns': ['high_frequency', 'large_packets', 'encrypted_traffic'],
-                'drop_probability': min(0.8, risk_score / 100)
-            },
-            'cpu_throttle': {
-                'max_cpu_usage': max(30, 80 - risk_score * 0.5),
-                'throttle_duration': 60
-            },
-            'memory_limit': {
-                'max_memory_usage': max(40, 70 - risk_score * 0.3),
-                'cleanup_interval': 30
-            },
-            'error_monitoring': {
-                'error_threshold': max(5, 20 - risk_score * 0.2),
-                'monitoring_interval': 10
-            },
-            'retry_mechanism': {
-                'max_retries': 3,
-                'retry_delay': 1
-            },
-            'buffer_optimization': {
-                'buffer_size': max(1024, 8192 - risk_score * 50),
-                'optimization_interval': 15
-            },
-            'traffic_analysis': {
-                'analysis_depth': 'deep' if risk_score > 80 else 'normal',
-                'sampling_rate': max(0.1, 1.0 - risk_score / 100)
-            },
-            'encryption_monitoring': {
-                'encryption_ratio_threshold': 0.7,
-                'monitoring_interval': 5
-            }
-        }
-        
-        return conditions.get(action, {})
+    def _expire_rules(self, current_time: float):
+        """清理过期规则及其合并索引"""
+        for rule in self.rule_store.expire(current_time):
+            self.dispatcher.submit_remove(rule['id'])
+            if self.journal is not None:
+                self.journal.record_remove(rule['id'])
+            self._unindex_rule(rule)
+        if len(self._last_handled) > self._last_handled_limit:
+            # 清理已过抑制窗口的记录，阈值随存活记录数翻倍以保证均摊 O(1)
+            self._last_handled = {key: value for key, value in self._last_handled.items()
+                                  if current_time - value[0] < self.hold_down}
+            self._last_handled_limit = max(1024, 2 * len(self._last_handled))
+        self._checkpoint()
     
-    def _get_action_parameters(self, action: str, risk_score: float) -> Dict[str, Any]:
-        """获取动作参数"""
-        parameters = {
-            'rate_limit': {
-                'limit_type': 'packet_rate',
-                'limit_value': max(100, 1000 - risk_score * 5)
-            },
-            'connection_limit': {
-                'limit_type': 'connection_count',
-                'limit_value': max(10, 100 - risk_score)
-            },
-            'drop_suspicious': {
-                'drop_type': 'selective',
-                'drop_rate': min(0.9, risk_score / 100)
-            },
-            'cpu_throttle': {
-                'throttle_type': 'percentage',
-                'throttle_value': min(50, risk_score * 0.5)
-            },
-            'memory_limit': {
-                'limit_type': 'percentage',
-                'limit_value': min(30, risk_score * 0.3)
-            },
-            'error_monitoring': {
-                'monitoring_type': 'real_time',
-                'alert_threshold': max(1, 10 - risk_score * 0.1)
-            },
-            'retry_mechanism': {
-                'retry_type': 'exponential_backoff',
-                'max_delay': 5
-            },
-            'buffer_optimization': {
-                'optimization_type': 'dynamic',
-                'target_efficiency': 0.8
-            },
-            'traffic_analysis': {
-                'analysis_type': 'behavioral',
-                'learning_rate': 0.1
-            },
-            'encryption_monitoring': {
-                'monitoring_type': 'ratio_based',
-                'alert_threshold': 0.8
-            }
+    def _unindex_rule(self, rule: Dict[str, Any]):
+        """规则过期或被淘汰后，从合并索引中删除（索引已指向更新的规则时保留）"""
+        key = (rule['action'], rule.get('target', 'local'))
+        if self._rules_by_target.get(key) == rule['id']:
+            del self._rules_by_target[key]
+    
+    def _build_rule(self, template: ActionTemplate, strategy: StrategyTemplate, risk_score: float,
+                    target: str, current_time: float) -> Dict[str, Any]:
+        """按动作模板填充单条防御规则"""
+        return {
+            'id': self.rule_store.next_id(current_time),
+            'action': template.action,
+            'target': target,
+            'priority': strategy.priority,
+            'risk_score': risk_score,
+            'created_time': current_time,
+            'expires_time': current_time + strategy.duration,
+            'conditions': template.fill_conditions(risk_score),
+            'parameters': template.fill_parameters(risk_score)
         }
-        
-        return parameters.get(action, {})
+    
+    def _generate_defense_rules(self, strategy: StrategyTemplate, risk_score: float,
+                                target: str = 'local', current_time: float = None) -> List[Dict[str, Any]]:
+        """生成防御规则（整个策略共用一次取时）"""
+        if current_time is None:
+            current_time = self.clock.time()
+        return [self._build_rule(template, strategy, risk_score, target, current_time)
+                for template in strategy.actions]
     
     def _apply_defense_rules(self, rules: List[Dict[str, Any]]) -> bool:
         """应用防御规则"""
         try:
             # 模拟规则下发到 DPU
             for rule in rules:
-                # 添加到规则列表
-                self.defense_rules.append(rule)
-                
-                # 保持规则数量限制
-                if len(self.defense_rules) > self.max_rules:
-                    self.defense_rules.pop(0)
+                # 添加到规则存储（超出容量时淘汰最早的规则），再异步下发到 Flow 表
+                evicted = self.rule_store.add(rule)
+                if self.journal is not None:
+                    self.journal.record_install(rule)
+                if evicted is not None:
+                    self.dispatcher.submit_remove(evicted['id'])
+                    if self.journal is not None:
+                        self.journal.record_remove(evicted['id'])
+                    self._unindex_rule(evicted)
+                self.dispatcher.submit_install(rule)
+                self._rules_by_target[(rule['action'], rule.get('target', 'local'))] = rule['id']
+                self.defense_stats['rules_issued'] += 1
                 
                 print(f"规则已下发: {rule['action']} (优先级: {rule['priority']})")
             
@@ -261,77 +336,93 @@ class DefenseController:
     
     def get_status(self) -> Dict[str, Any]:
         """获取防御状态"""
-        # 清理过期规则
-        current_time = time.time()
-        active_rules = [rule for rule in self.defense_rules if rule['expires_time'] > current_time]
-        self.defense_rules = active_rules
+        with self._lock:
+            # 清理过期规则
+            self._expire_rules(self.clock.time())
         
-        return {
-            'active': self.defense_active,
-            'current_strategy': self.current_strategy,
-            'active_rules_count': len(active_rules),
-            'total_rules': len(self.defense_rules),
-            'last_trigger_time': self.last_trigger_time,
-            'stats': self.defense_stats,
-            'recent_rules': list(self.rule_history)[-5:] if self.rule_history else []
-        }
+            return {
+                'active': self.defense_active,
+                'current_strategy': self.current_strategy,
+                'active_rules_count': len(self.rule_store),
+                'total_rules': len(self.rule_store),
+                'last_trigger_time': self.last_trigger_time,
+                'stats': dict(self.defense_stats),
+                'dispatch': self.dispatcher.get_stats(),
+                'journal': self.journal.get_stats() if self.journal is not None else None,
+                'recent_rules': list(self.rule_history)[-5:] if self.rule_history else []
+            }
     
     def clear_rules(self):
         """清除所有规则"""
-        self.defense_rules.clear()
-        self.defense_active = False
-        self.current_strategy = None
-        print("所有防御规则已清除")
+        with self._lock:
+            for rule in self.rule_store:
+                self.dispatcher.submit_remove(rule['id'])
+            self.rule_store.clear()
+            if self.journal is not None:
+                self.journal.record_clear()
+            self._rules_by_target.clear()
+            self._last_handled.clear()
+            self.defense_active = False
+            self.current_strategy = None
+            print("所有防御规则已清除")
     
     def get_rule_by_id(self, rule_id: str) -> Dict[str, Any]:
         """根据ID获取规则"""
-        for rule in self.defense_rules:
-            if rule['id'] == rule_id:
-                return rule
-        return {}
+        with self._lock:
+            return self.rule_store.get(rule_id) or {}
     
     def update_rule(self, rule_id: str, updates: Dict[str, Any]) -> bool:
         """更新规则"""
-        for rule in self.defense_rules:
-            if rule['id'] == rule_id:
-                rule.update(updates)
-                print(f"规则已更新: {rule_id}")
-                return True
-        return False
+        with self._lock:
+            if not self.rule_store.update(rule_id, updates):
+                return False
+            if self.journal is not None:
+                self.journal.record_update(rule_id, updates)
+            print(f"规则已更新: {rule_id}")
+            return True
     
     def get_defense_summary(self) -> Dict[str, Any]:
         """获取防御摘要"""
-        current_time = time.time()
-        active_rules = [rule for rule in self.defense_rules if rule['expires_time'] > current_time]
+        with self._lock:
+            current_time = self.clock.time()
+            self._expire_rules(current_time)
         
-        # 按动作类型统计
-        action_stats = {}
-        for rule in active_rules:
-            action = rule['action']
-            if action not in action_stats:
-                action_stats[action] = 0
-            action_stats[action] += 1
+            return {
+                'total_active_rules': len(self.rule_store),
+                'action_distribution': self.rule_store.count_by_action(),
+                'defense_effectiveness': self._calculate_effectiveness(current_time),
+                'recent_activity': self.recent_triggers.count(RECENT_ACTIVITY_WINDOW, current_time)
+            }
+    
+    def get_defense_stats(self) -> Dict[str, Any]:
+        """
+        获取防御统计聚合（均为增量维护，开销与规则数和历史长度无关）
+        """
+        with self._lock:
+            current_time = self.clock.time()
+            self._expire_rules(current_time)
         
-        return {
-            'total_active_rules': len(active_rules),
-            'action_distribution': action_stats,
-            'defense_effectiveness': self._calculate_effectiveness(),
-            'recent_activity': len([r for r in self.rule_history if current_time - r['timestamp'] < 300])
-        }
+            return {
+                'total_active_rules': len(self.rule_store),
+                'active_by_action': self.rule_store.count_by_action(),
+                'active_by_priority': self.rule_store.count_by_priority(),
+                'triggers_5m': self.recent_triggers.count(RECENT_ACTIVITY_WINDOW, current_time),
+                'triggers_10m': self.recent_triggers.count(EFFECTIVENESS_WINDOW, current_time),
+                'defense_effectiveness': self._calculate_effectiveness(current_time),
+                'stats': dict(self.defense_stats)
+            }
     
-    def _calculate_effectiveness(self) -> float:
+    def _calculate_effectiveness(self, current_time: float = None) -> float:
         """计算防御效果"""
         if self.defense_stats['total_triggers'] == 0:
             return 0.0
         
         success_rate = self.defense_stats['successful_defenses'] / self.defense_stats['total_triggers']
         
-        # 考虑最近的活动
-        recent_triggers = 0
-        current_time = time.time()
-        for record in self.rule_history:
-            if current_time - record['timestamp'] < 600:  # 最近10分钟
-                recent_triggers += 1
+        # 考虑最近10分钟的活动
+        if current_time is None:
+            current_time = self.clock.time()
+        recent_triggers = self.recent_triggers.count(EFFECTIVENESS_WINDOW, current_time)
         
         # 如果最近有活动，增加效果评分
         if recent_triggers > 0:
@@ -343,19 +434,21 @@ class DefenseController:
 
     # 新增：手动触发防御的接口
     def manual_trigger(self, risk_score: float, anomaly_type: str = None):
-        if self.mode == "manual":
-            return self.trigger_defense(risk_score, anomaly_type)
-        else:
-            print("当前为自动模式，手动触发无效")
-            return False
+        with self._lock:
+            if self.mode == "manual":
+                return self.trigger_defense(risk_score, anomaly_type)
+            else:
+                print("当前为自动模式，手动触发无效")
+                return False
 
     # 新增：重置防御状态，允许新的异常检测
     def reset_defense_state(self):
         """重置防御状态，允许新的异常检测"""
-        self.defense_active = False
-        self.current_strategy = None
-        self.last_trigger_time = 0
-        print("防御状态已重置，允许新的异常检测")
+        with self._lock:
+            self.defense_active = False
+            self.current_strategy = None
+            self.last_trigger_time = 0
+            print("防御状态已重置，允许新的异常检测")
 
     # 新增：通知新的异常触发
     def notify_new_anomaly(self, anomaly_type: str):
@@ -366,23 +459,32 @@ class DefenseController:
     # 新增：关闭防御
     def disable_defense(self):
         """关闭防御系统"""
-        self.defense_active = False
-        self.current_strategy = None
-        self.last_trigger_time = 0
-        print("防御系统已关闭")
-        return True
+        with self._lock:
+            self.defense_active = False
+            self.current_strategy = None
+            self.last_trigger_time = 0
+            print("防御系统已关闭")
+            return True
+
+    def close(self):
+        """关闭防御规则日志（之后不再持久化规则变更）"""
+        with self._lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
 
     # 新增：获取防御状态描述
     def get_defense_status_description(self):
         """获取防御状态描述"""
-        if self.defense_active:
-            if self.current_strategy:
-                actions = ', '.join(self.current_strategy['actions'])
-                return f"已激活 - {actions}"
+        with self._lock:
+            if self.defense_active:
+                if self.current_strategy:
+                    actions = ', '.join(self.current_strategy['actions'])
+                    return f"已激活 - {actions}"
+                else:
+                    return "已激活 - 无策略"
             else:
-                return "已激活 - 无策略"
-        else:
-            return "未激活"
+                return "未激活"
 
 # 测试代码
 if __name__ == "__main__":
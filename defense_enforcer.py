@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+防御执行模型
+位于模拟器和检测器之间，把当前生效的防御规则作为数组运算作用到每个 tick 的指标矩阵上，
+使防御真正压低模拟流量，而不是直接关闭模拟器异常
+
+    drop_suspicious   按 drop_probability 二项抽样丢弃报文
+    rate_limit        每设备一个令牌桶，速率为 packets_per_sec_threshold，桶深为 1 秒的令牌；
+                      字节速率不超过 bytes_per_sec_threshold
+    connection_limit  活跃连接数不超过 max_connections
+
+字节数按放行报文的比例同步缩放（平均包长不变）。被策略丢弃的报文计入 policed_packets，
+不计入 dropped_packets（后者表示设备自身的丢包）。
+
+DefenseEnforcer 实现 FlowRuleBackend 接口，可直接作为 RuleDispatcher 的后端，
+也可以包装另一个后端（如 FlowTableEmulator）同时下发。
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from telemetry_format import METRIC_FIELDS
+from flow_table_emulator import FlowRuleBackend
+
+logger = logging.getLogger(__name__)
+
+PPS = METRIC_FIELDS.index('packets_per_sec')
+BPS = METRIC_FIELDS.index('bytes_per_sec')
+CONNECTIONS = METRIC_FIELDS.index('active_connections')
+
+# 动作 -> (规则中取值的位置, 字段名, 多条规则时取最严格值的方向)
+ENFORCED_ACTIONS = {
+    'rate_limit': ('conditions', 'packets_per_sec_threshold', min),
+    'connection_limit': ('conditions', 'max_connections', min),
+    'drop_suspicious': ('conditions', 'drop_probability', max)
+}
+
+
+class DefenseEnforcer(FlowRuleBackend):
+    """向量化防御执行模型"""
+
+    def __init__(self, n_devices: int, backend: FlowRuleBackend = None, target_rows: Dict[Any, int] = None,
+                 device_prefix: str = 'dev', seed: Optional[int] = None):
+        """
+        Args:
+            n_devices: 设备数（指标矩阵行数）
+            backend: 同时下发的下游后端（可选），确认结果以下游为准
+            target_rows: 规则目标到行号的显式映射，如 {'local': 0}
+            device_prefix: 目标名称形如 f"{device_prefix}{行号}" 时自动映射到该行，整数目标直接作为行号
+            seed: drop_suspicious 抽样的随机种子
+        """
+        self.n_devices = n_devices
+        self.backend = backend
+        self.target_rows = dict(target_rows or {})
+        self.device_prefix = device_prefix
+        self.rng = np.random.default_rng(seed)
+
+        # 每设备的生效参数（无规则时为 inf / 0，即不限制）
+        self.rate_pps = np.full(n_devices, np.inf)
+        self.rate_bps = np.full(n_devices, np.inf)
+        self.max_connections = np.full(n_devices, np.inf)
+        self.drop_probability = np.zeros(n_devices)
+        self.tokens = np.zeros(n_devices)
+
+        # rule_id -> (行号, 动作)；(行号, 动作) -> {rule_id: 规则}，同一设备多条同类规则时取最严格值
+        self._rule_index: Dict[str, tuple] = {}
+        self._active: Dict[tuple, Dict[str, Dict[str, Any]]] = {}
+        # 规则由下发线程更新，执行在模拟线程中进行
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'ticks': 0,
+            'rules_applied': 0,
+            'rules_unmapped': 0,
+            'policed_packets': 0.0,
+            'shaped_devices': 0,
+            'total_enforce_time': 0.0
+        }
+
+    # ---- 规则下发（FlowRuleBackend） ----
+
+    def row_for(self, target: Any) -> Optional[int]:
+        """规则目标对应的行号，无法映射时返回 None"""
+        row = self.target_rows.get(target)
+        if row is None:
+            if isinstance(target, (int, np.integer)):
+                row = int(target)
+            elif isinstance(target, str) and target.startswith(self.device_prefix) and \
+                    target[len(self.device_prefix):].isdigit():
+                row = int(target[len(self.device_prefix):])
+        if row is None or not 0 <= row < self.n_devices:
+            return None
+        return row
+
+    def install_batch(self, rules: List[Dict[str, Any]]) -> Dict[str, bool]:
+        with self._lock:
+            for rule in rules:
+                if rule.get('action') not in ENFORCED_ACTIONS:
+                    continue
+                row = self.row_for(rule.get('target', 'local'))
+                if row is None:
+                    self.stats['rules_unmapped'] += 1
+                    continue
+                key = (row, rule['action'])
+                previous = self._rule_index.get(rule['id'])
+                if previous is not None and previous != key:
+                    self._detach(rule['id'])
+                self._rule_index[rule['id']] = key
+                self._active.setdefault(key, {})[rule['id']] = rule
+                self._refresh(key)
+                self.stats['rules_applied'] += 1
+
+        if self.backend is not None:
+            return self.backend.install_batch(rules)
+        return {rule['id']: True for rule in rules}
+
+    def remove_batch(self, rule_ids: List[str]) -> Dict[str, bool]:
+        with self._lock:
+            for rule_id in rule_ids:
+                self._detach(rule_id)
+        if self.backend is not None:
+            return self.backend.remove_batch(rule_ids)
+        return {rule_id: True for rule_id in rule_ids}
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+    def _detach(self, rule_id: str):
+        key = self._rule_index.pop(rule_id, None)
+        if key is None:
+            return
+        bucket = self._active.get(key)
+        if bucket is not None:
+            bucket.pop(rule_id, None)
+            if not bucket:
+                del self._active[key]
+        self._refresh(key)
+
+    def _refresh(self, key: tuple):
+        """重新计算某设备某动作的生效参数"""
+        row, action = key
+        section, field, strictest = ENFORCED_ACTIONS[action]
+        rules = self._active.get(key)
+        values = [rule.get(section, {}).get(field) for rule in rules.values()] if rules else []
+        values = [value for value in values if value is not None]
+
+        if action == 'rate_limit':
+            if values:
+                rate = strictest(values)
+                if not np.isfinite(self.rate_pps[row]):
+                    # 新启用的令牌桶初始为满
+                    self.tokens[row] = rate
+                self.rate_pps[row] = rate
+                self.tokens[row] = min(self.tokens[row], rate)
+                bps = [rule.get(section, {}).get('bytes_per_sec_threshold') for rule in rules.values()]
+                bps = [value for value in bps if value is not None]
+                self.rate_bps[row] = min(bps) if bps else np.inf
+            else:
+                self.rate_pps[row] = np.inf
+                self.rate_bps[row] = np.inf
+        elif action == 'connection_limit':
+            self.max_connections[row] = strictest(values) if values else np.inf
+        elif action == 'drop_suspicious':
+            self.drop_probability[row] = strictest(values) if values else 0.0
+
+    # ---- 执行 ----
+
+    def enforce(self, metrics: np.ndarray, dt: float = 1.0) -> np.ndarray:
+        """
+        把生效规则作用到一个 tick 的指标矩阵上（原地修改）
+        Args:
+            metrics: (n_devices, 9) 指标矩阵，列顺序见 METRIC_FIELDS
+            dt: 本 tick 的时长（秒），用于令牌桶补充
+        Returns:
+            修改后的 metrics
+        """
+        start = time.perf_counter()
+        offered = metrics[:, PPS].copy()
+
+        with self._lock:
+            # drop_suspicious：按概率丢弃报文
+            dropping = np.flatnonzero(self.drop_probability > 0)
+            if dropping.size:
+                packets = (metrics[dropping, PPS] * dt).astype(np.int64)
+                dropped = self.rng.binomial(packets, self.drop_probability[dropping])
+                metrics[dropping, PPS] = (packets - dropped) / dt
+
+            # rate_limit：令牌桶
+            limited = np.flatnonzero(np.isfinite(self.rate_pps))
+            if limited.size:
+                rate = self.rate_pps[limited]
+                tokens = np.minimum(rate, self.tokens[limited] + rate * dt)
+                admitted = np.minimum(metrics[limited, PPS] * dt, tokens)
+                self.tokens[limited] = tokens - admitted
+                metrics[limited, PPS] = np.floor(admitted / dt)
+
+            # 字节数随放行报文比例缩放，再受字节速率上限约束
+            shaped = offered > metrics[:, PPS]
+            if shaped.any():
+                ratio = metrics[shaped, PPS] / offered[shaped]
+                metrics[shaped, BPS] = np.floor(metrics[shaped, BPS] * ratio)
+            if limited.size:
+                metrics[limited, BPS] = np.minimum(metrics[limited, BPS], self.rate_bps[limited])
+
+            # connection_limit：连接数上限
+            np.minimum(metrics[:, CONNECTIONS], np.floor(self.max_connections), out=metrics[:, CONNECTIONS])
+
+        self.stats['ticks'] += 1
+        self.stats['policed_packets'] += float((offered - metrics[:, PPS]).sum() * dt)
+        self.stats['shaped_devices'] = int(np.count_nonzero(shaped))
+        self.stats['total_enforce_time'] += time.perf_counter() - start
+        return metrics
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['active_rules'] = len(self._rule_index)
+        stats['rate_limited_devices'] = int(np.count_nonzero(np.isfinite(self.rate_pps)))
+        stats['connection_limited_devices'] = int(np.count_nonzero(np.isfinite(self.max_connections)))
+        stats['dropping_devices'] = int(np.count_nonzero(self.drop_probability))
+        stats['avg_enforce_time'] = stats['total_enforce_time'] / stats['ticks'] if stats['ticks'] else 0.0
+        return stats
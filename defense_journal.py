@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+防御规则日志
+以追加写的二进制日志记录规则安装、更新和删除事件，定期把有效规则压缩为快照并截断日志，
+重启时加载最近的快照并重放其后的日志，恢复有效规则集合
+
+文件布局（目录下两个文件）:
+    snapshot.bin  16 字节文件头 + 一条记录: {"rules": [...], "last_sequence": 已用最大规则 ID 序号}
+    journal.log   16 字节文件头 + N 条事件记录
+    文件头: magic(4s) + version(H) + 保留(2x) + generation(Q)
+    记录:   length(I) + crc32(I) + JSON 负载（小端）
+
+恢复时间有界: 快照大小不超过有效规则数，日志长度不超过 snapshot_interval 条事件。
+快照先写临时文件再原子替换；日志的 generation 小于快照时说明日志已被快照覆盖，直接丢弃。
+日志尾部写了一半的记录（进程崩溃）在恢复时截断。
+
+规则 ID 序号的高水位（快照中的 last_sequence 与其后日志中安装过的规则 ID）一并恢复，
+重启前已过期或删除的规则 ID 不会被重新发出。
+"""
+
+import os
+import json
+import zlib
+import struct
+import logging
+from typing import Dict, Any, List, Iterable, Optional
+
+from rule_store import id_sequence
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'DPUS'
+JOURNAL_MAGIC = b'DPUJ'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sH2xQ')
+RECORD_HEADER = struct.Struct('<II')
+
+SNAPSHOT_FILE = 'snapshot.bin'
+JOURNAL_FILE = 'journal.log'
+
+# 事件类型
+INSTALL = 'install'
+UPDATE = 'update'
+REMOVE = 'remove'
+CLEAR = 'clear'
+
+
+def _json_default(value):
+    # NumPy 标量（检测器产生的风险评分等）转为 Python 内置类型
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_record(payload: Dict[str, Any]) -> bytes:
+    data = json.dumps(payload, separators=(',', ':'), default=_json_default).encode('utf-8')
+    return RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data
+
+
+def _read_records(data: bytes, offset: int):
+    """逐条解析记录，产出 (负载, 记录结束偏移)，遇到不完整或校验失败的记录时停止"""
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if end > len(data):
+            return
+        payload = data[start:end]
+        if zlib.crc32(payload) != crc:
+            return
+        try:
+            yield json.loads(payload.decode('utf-8')), end
+        except ValueError:
+            return
+        offset = end
+
+
+def _read_header(data: bytes, magic: bytes) -> Optional[int]:
+    """校验文件头，返回 generation，文件头无效时返回 None"""
+    if len(data) < FILE_HEADER.size:
+        return None
+    file_magic, version, generation = FILE_HEADER.unpack_from(data)
+    if file_magic != magic or version != FILE_VERSION:
+        return None
+    return generation
+
+
+class DefenseJournal:
+    """追加写的防御规则日志"""
+
+    def __init__(self, directory: str, snapshot_interval: int = 10000, fsync: bool = False):
+        """
+        Args:
+            directory: 日志目录（不存在时创建）
+            snapshot_interval: 日志累计多少条事件后建议做一次快照
+            fsync: 每条事件是否 fsync（默认只 flush 到操作系统，进程崩溃不丢失，掉电可能丢失尾部）
+        """
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+
+        self.generation = 0
+        self.events_since_snapshot = 0
+        # 已安装过的规则 ID 的最大序号（恢复后供 RuleStore.restore 推进 ID 序号）
+        self.last_sequence = 0
+        self._file = None
+
+        self.stats = {
+            'events_written': 0,
+            'snapshots': 0,
+            'recovered_rules': 0,
+            'replayed_events': 0,
+            'truncated_bytes': 0
+        }
+
+    # ---- 恢复 ----
+
+    def recover(self) -> List[Dict[str, Any]]:
+        """
+        加载快照并重放日志，返回恢复的规则列表（按原加入顺序），之后打开日志继续追加
+        """
+        rules: Dict[str, Dict[str, Any]] = {}
+        self.last_sequence = 0
+
+        snapshot_generation = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+            generation = _read_header(data, SNAPSHOT_MAGIC)
+            snapshot = next(_read_records(data, FILE_HEADER.size), None) if generation is not None else None
+            if snapshot is None:
+                logger.error(f"Defense snapshot is corrupt, ignoring: {self.snapshot_path}")
+            else:
+                snapshot_generation = generation
+                # 引入 last_sequence 之前的快照按其中的有效规则推算
+                self.last_sequence = snapshot[0].get('last_sequence', 0)
+                for rule in snapshot[0]['rules']:
+                    rules[rule['id']] = rule
+                    self.last_sequence = max(self.last_sequence, id_sequence(rule['id']))
+
+        self.generation = snapshot_generation
+        replayed = 0
+        valid_end = None
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+            generation = _read_header(data, JOURNAL_MAGIC)
+            if generation is not None and generation >= snapshot_generation:
+                self.generation = generation
+                valid_end = FILE_HEADER.size
+                for event, end in _read_records(data, FILE_HEADER.size):
+                    self._apply(rules, event)
+                    if event['op'] == INSTALL:
+                        self.last_sequence = max(self.last_sequence, id_sequence(event['rule']['id']))
+                    replayed += 1
+                    valid_end = end
+                if valid_end < len(data):
+                    self.stats['truncated_bytes'] += len(data) - valid_end
+                    logger.warning(f"Truncating {len(data) - valid_end} bytes of torn journal tail")
+
+        if valid_end is None:
+            # 没有可用日志（首次启动或日志已被快照覆盖），以当前 generation 新建
+            self._start_journal(self.generation)
+        else:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_end)
+            self._file = open(self.journal_path, 'ab')
+
+        self.events_since_snapshot = replayed
+        self.stats['replayed_events'] = replayed
+        self.stats['recovered_rules'] = len(rules)
+        logger.info(f"Defense journal recovered {len(rules)} rules ({replayed} events replayed)")
+        return list(rules.values())
+
+    @staticmethod
+    def _apply(rules: Dict[str, Dict[str, Any]], event: Dict[str, Any]):
+        op = event['op']
+        if op == INSTALL:
+            rule = event['rule']
+            # 重新安装的规则移到末尾，保持与 RuleStore 相同的加入顺序
+            rules.pop(rule['id'], None)
+            rules[rule['id']] = rule
+        elif op == UPDATE:
+            rule = rules.get(event['rule_id'])
+            if rule is not None:
+                rule.update(event['updates'])
+        elif op == REMOVE:
+            rules.pop(event['rule_id'], None)
+        elif op == CLEAR:
+            rules.clear()
+
+    # ---- 追加 ----
+
+    def _start_journal(self, generation: int):
+        """原子地创建只含文件头的新日志"""
+        if self._file is not None:
+            self._file.close()
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(FILE_HEADER.pack(JOURNAL_MAGIC, FILE_VERSION, generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._file = open(self.journal_path, 'ab')
+
+    def _append(self, event: Dict[str, Any]):
+        if self._file is None:
+            raise RuntimeError("DefenseJournal.recover() must be called before appending")
+        self._file.write(_encode_record(event))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.events_since_snapshot += 1
+        self.stats['events_written'] += 1
+
+    def record_install(self, rule: Dict[str, Any]):
+        """记录规则安装（新规则或整条覆盖）"""
+        self._append({'op': INSTALL, 'rule': rule})
+        self.last_sequence = max(self.last_sequence, id_sequence(rule['id']))
+
+    def record_update(self, rule_id: str, updates: Dict[str, Any]):
+        """记录规则字段更新（延长有效期、升级优先级等）"""
+        self._append({'op': UPDATE, 'rule_id': rule_id, 'updates': updates})
+
+    def record_remove(self, rule_id: str):
+        """记录规则删除（过期、淘汰或手动删除）"""
+        self._append({'op': REMOVE, 'rule_id': rule_id})
+
+    def record_clear(self):
+        """记录清空全部规则"""
+        self._append({'op': CLEAR})
+
+    # ---- 快照 ----
+
+    @property
+    def needs_snapshot(self) -> bool:
+        return self.events_since_snapshot >= self.snapshot_interval
+
+    def snapshot(self, rules: Iterable[Dict[str, Any]]):
+        """
+        把当前有效规则写成快照并截断日志
+        Args:
+            rules: 当前全部有效规则（按加入顺序）
+        """
+        generation = self.generation + 1
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(FILE_HEADER.pack(SNAPSHOT_MAGIC, FILE_VERSION, generation))
+            f.write(_encode_record({'rules': list(rules), 'last_sequence': self.last_sequence}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # 快照已落盘：此后即使在新建日志前崩溃，旧日志的 generation 较小，恢复时会被丢弃
+        self.generation = generation
+        self._start_journal(generation)
+        self.events_since_snapshot = 0
+        self.stats['snapshots'] += 1
+
+    def close(self):
+        """关闭日志文件"""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'generation': self.generation,
+            'events_since_snapshot': self.events_since_snapshot
+        }
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+检测流水线
+每个 tick 按阶段依次执行，后一阶段只消费前一阶段的输出:
+
+    features  从指标字典提取一次特征向量，同时写入 AI 特征模式的预分配行
+    rules     规则评分（复用特征，不再重复提取）
+    ai        AI 评分并与规则评分融合（复用规则结果，规则检测器不再对同一样本评分）。
+              混合检测器设置了 ai_deadline 时，AI 分支在规则阶段之前提交到后台线程并发执行，
+              本阶段只等待到截止时间，超时的 tick 使用规则评分并标记 degraded。
+              启用级联检测时先由规则评分决定是否需要 AI，AI 分支在本阶段按需提交
+    defense   按融合结果触发防御（自动模式）
+
+告警仍由调用方根据返回的融合结果生成。
+"""
+
+import time
+import logging
+from typing import Dict, Any
+
+from telemetry_format import METRIC_FIELDS
+from rule_engine import RuleEngine
+from src.ai_engine.training.feature_schema import FEATURE_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('features', 'rules', 'ai', 'defense')
+
+# AI 特征模式与规则特征的前 len(METRIC_FIELDS) 列顺序一致时直接复制，否则按模式重新提取
+_SHARED_LAYOUT = FEATURE_SCHEMA.fields == METRIC_FIELDS
+
+
+class DetectionPipeline:
+    """规则检测 + AI 检测 + 防御的单一流水线"""
+
+    def __init__(self, rule_detector, hybrid_detector=None, defense_controller=None,
+                 defense_threshold: float = 40):
+        """
+        Args:
+            rule_detector: 规则检测器（AnomalyDetector），应与 hybrid_detector.rule_detector 为同一实例
+            hybrid_detector: 混合检测器（HybridAnomalyDetector），为 None 时只使用规则评分
+            defense_controller: 防御控制器，为 None 时不触发防御
+            defense_threshold: 融合风险评分超过该值且判定为异常时触发防御
+        """
+        if hybrid_detector is not None and hybrid_detector.rule_detector is not rule_detector:
+            logger.warning("Hybrid detector uses its own rule detector; rule history will diverge")
+        self.rule_detector = rule_detector
+        self.hybrid_detector = hybrid_detector
+        self.defense_controller = defense_controller
+        self.defense_threshold = defense_threshold
+        # 每个样本写入同一行，下游各阶段按需复制
+        self._feature_row = FEATURE_SCHEMA.new_row()
+
+        self.stats = {
+            'ticks': 0,
+            'defense_triggers': 0,
+            'degraded_ticks': 0,
+            'stage_time': {stage: 0.0 for stage in STAGES}
+        }
+
+    def process(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        对一个样本执行整条流水线
+        Args:
+            metrics: 网络指标
+        Returns:
+            {'result': 融合后的检测结果, 'rule_result': 规则检测结果, 'defense_triggered': 是否触发防御}
+        """
+        stage_time = self.stats['stage_time']
+        start = time.perf_counter()
+
+        values = RuleEngine.feature_values(metrics)
+        features = self._feature_row
+        if _SHARED_LAYOUT:
+            features[:] = values[:FEATURE_SCHEMA.size]
+        else:
+            FEATURE_SCHEMA.extract(metrics, out=features)
+        now = time.perf_counter()
+        stage_time['features'] += now - start
+        start = now
+
+        ai_task = None
+        if self.hybrid_detector is not None and not self.hybrid_detector.cascade_enabled:
+            ai_task = self.hybrid_detector.submit_ai(metrics, self.defense_controller, features)
+        rule_result = self.rule_detector.detect_anomaly(metrics, self.defense_controller, values=values)
+        now = time.perf_counter()
+        stage_time['rules'] += now - start
+        start = now
+
+        if self.hybrid_detector is not None:
+            result = self.hybrid_detector.detect_anomaly(metrics, self.defense_controller, rule_result=rule_result,
+                                                         features=features, ai_task=ai_task)
+        else:
+            result = rule_result
+        now = time.perf_counter()
+        stage_time['ai'] += now - start
+        start = now
+
+        defense_triggered = self._defense_stage(result)
+        stage_time['defense'] += time.perf_counter() - start
+
+        self.stats['ticks'] += 1
+        if result.get('degraded'):
+            self.stats['degraded_ticks'] += 1
+        return {
+            'result': result,
+            'rule_result': rule_result,
+            'defense_triggered': defense_triggered
+        }
+
+    def _defense_stage(self, result: Dict[str, Any]) -> bool:
+        """按融合结果触发防御，返回是否触发"""
+        controller = self.defense_controller
+        if controller is None or controller.mode != 'auto':
+            return False
+        risk_score = float(result.get('risk_score', 0))
+        anomaly_type = result.get('anomaly_type', 'normal')
+        if not (result.get('is_anomaly', False) and anomaly_type != 'normal' and risk_score > self.defense_threshold):
+            return False
+        controller.trigger_defense(risk_score, anomaly_type)
+        self.stats['defense_triggers'] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        ticks = self.stats['ticks']
+        return {
+            'ticks': ticks,
+            'defense_triggers': self.stats['defense_triggers'],
+            'degraded_ticks': self.stats['degraded_ticks'],
+            'ai_enabled': self.hybrid_detector is not None,
+            'avg_stage_time': {stage: (total / ticks if ticks else 0.0)
+                               for stage, total in self.stats['stage_time'].items()}
+        }
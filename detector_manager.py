@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+多设备检测器管理
+用一个预分配的 (n_devices, window, 9) 环形数组保存所有设备的历史窗口，
+按设备 ID 寻址，每个 tick 对全部设备做一次向量化规则检测
+
+与为每个设备创建一个 AnomalyDetector（deque + 字典）相比，
+数千台设备只占用数 MB 连续内存，每个 tick 不再创建大量字典对象。
+检测结果与逐设备的 AnomalyDetector.detect_anomaly 一致。
+
+AI 检测的输入序列也从同一个环形数组读取（FEATURE_SCHEMA 与 METRIC_FIELDS 列顺序相同）:
+get_sequences 一次取出多台设备的 (N, 序列长度, 9) 序列，detect_tick 传入预测器时
+对窗口已满的设备做一次批量前向计算，不再为每台设备维护一个 RealTimeDataProcessor。
+"""
+
+import time
+import logging
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from telemetry_format import METRIC_FIELDS
+from rule_engine import RuleEngine
+from src.ai_engine.training.feature_schema import FEATURE_SCHEMA, FEATURE_DTYPE
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceState:
+    """设备登记信息（数组中的槽位和登记时间）"""
+
+    __slots__ = ('device_id', 'slot', 'registered_at')
+
+    def __init__(self, device_id: int, slot: int, registered_at: float):
+        self.device_id = device_id
+        self.slot = slot
+        self.registered_at = registered_at
+
+    def __repr__(self):
+        return f"DeviceState(device_id={self.device_id}, slot={self.slot})"
+
+
+class DetectorManager:
+    """多设备规则检测器"""
+
+    def __init__(self, n_devices: int = 1024, window: int = 10, rules_path: str = None,
+                 rule_engine: RuleEngine = None, clock=None):
+        """
+        Args:
+            n_devices: 预分配的设备数，超过时容量自动翻倍
+            window: 每设备历史窗口长度（与 AnomalyDetector.history_window 一致）
+            rules_path: 规则配置文件
+            rule_engine: 共享的规则引擎（优先于 rules_path）
+            clock: 时间源
+        """
+        self.clock = clock or time
+        self.rule_engine = rule_engine or RuleEngine(rules_path)
+        self.window = window
+        self.capacity = 0
+
+        self.devices: Dict[int, DeviceState] = {}
+        self._free_slots: List[int] = []
+        self._next_slot = 0
+
+        self._metrics = np.zeros((0, window, len(METRIC_FIELDS)), dtype=np.float64)
+        self._raw_scores = np.zeros((0, window), dtype=np.float64)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._position = np.zeros(0, dtype=np.int64)
+        self._detections = np.zeros(0, dtype=np.int64)
+        self._last_detection_time = np.zeros(0, dtype=np.float64)
+        self._grow(max(1, n_devices))
+
+        self.stats = {
+            'ticks': 0,
+            'samples': 0,
+            'total_detections': 0,
+            'ai_predictions': 0
+        }
+
+    # ---- 设备登记 ----
+
+    def _grow(self, capacity: int):
+        """扩容所有按槽位索引的数组"""
+        extra = capacity - self.capacity
+        self._metrics = np.concatenate([self._metrics, np.zeros((extra,) + self._metrics.shape[1:])])
+        self._raw_scores = np.concatenate([self._raw_scores, np.zeros((extra, self.window))])
+        self._count = np.concatenate([self._count, np.zeros(extra, dtype=np.int64)])
+        self._position = np.concatenate([self._position, np.zeros(extra, dtype=np.int64)])
+        self._detections = np.concatenate([self._detections, np.zeros(extra, dtype=np.int64)])
+        self._last_detection_time = np.concatenate([self._last_detection_time, np.zeros(extra)])
+        self.capacity = capacity
+
+    def register(self, device_id: int) -> DeviceState:
+        """登记设备（已登记时直接返回）"""
+        state = self.devices.get(device_id)
+        if state is not None:
+            return state
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            if self._next_slot >= self.capacity:
+                self._grow(self.capacity * 2)
+            slot = self._next_slot
+            self._next_slot += 1
+
+        state = DeviceState(device_id, slot, self.clock.time())
+        self.devices[device_id] = state
+        return state
+
+    def remove(self, device_id: int):
+        """注销设备并回收槽位"""
+        state = self.devices.pop(device_id, None)
+        if state is None:
+            return
+        self._reset_slot(state.slot)
+        self._free_slots.append(state.slot)
+
+    def reset_device(self, device_id: int):
+        """清空设备历史"""
+        state = self.devices.get(device_id)
+        if state is not None:
+            self._reset_slot(state.slot)
+
+    def _reset_slot(self, slot: int):
+        self._metrics[slot] = 0.0
+        self._raw_scores[slot] = 0.0
+        self._count[slot] = 0
+        self._position[slot] = 0
+        self._detections[slot] = 0
+        self._last_detection_time[slot] = 0.0
+
+    def slots_for(self, device_ids: Iterable[int]) -> np.ndarray:
+        """设备 ID 转换为槽位下标（未登记的设备自动登记）"""
+        devices = self.devices
+        return np.fromiter(
+            ((devices.get(device_id) or self.register(device_id)).slot for device_id in device_ids),
+            dtype=np.intp
+        )
+
+    # ---- 检测 ----
+
+    def detect_tick(self, device_ids: Iterable[int], samples: np.ndarray,
+                    defense_controller=None, predictor=None) -> Dict[str, Any]:
+        """
+        对一批设备各检测一个新样本
+        Args:
+            device_ids: 设备 ID 序列，同一 tick 内不能重复
+            samples: (N, 9) 指标矩阵，第 i 行属于 device_ids[i]
+            defense_controller: 防御控制器
+            predictor: AI 预测器（需提供 predict_batch，如 AnomalyPredictor），为 None 时只做规则检测
+        Returns:
+            与 AnomalyDetector.detect_batch 相同结构的数组结果，另附 device_ids；
+            传入 predictor 时另附 prediction_score（窗口未满的设备为 NaN）
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, len(METRIC_FIELDS))
+        device_ids = list(device_ids)
+        if len(device_ids) != len(samples):
+            raise ValueError(f"设备数与样本数不符: {len(device_ids)} != {len(samples)}")
+        slots = self.slots_for(device_ids)
+        if len(np.unique(slots)) != len(slots):
+            raise ValueError("同一 tick 内设备 ID 重复")
+
+        current_time = self.clock.time()
+        table = self.rule_engine.table
+        window = self.window
+        n = len(samples)
+        pps = samples[:, 0]
+        count = self._count[slots]
+        position = self._position[slots]
+
+        # 流量突增：之前 surge_window-1 个样本（按时间从旧到新累加）+ 当前样本
+        surge_window = table.surge_window
+        if surge_window - 1 <= window:
+            total = np.zeros(n, dtype=np.float64)
+            for k in range(surge_window - 1, 0, -1):
+                total += self._metrics[slots, (position - k) % window, 0]
+            total += pps
+            surge = np.where(count >= surge_window - 1,
+                             RuleEngine.batch_surge_scores(pps, total / surge_window, table),
+                             table.surge_points[0])
+        else:
+            surge = np.full(n, table.surge_points[0])
+
+        raw_score = np.minimum(table.max_score, RuleEngine.batch_static_scores(samples, table) + surge)
+        risk_score = raw_score
+        if defense_controller is not None and getattr(defense_controller, 'score_penalty_active', False):
+            risk_score = np.maximum(risk_score - table.defense_penalty, 0)
+
+        anomaly_type = RuleEngine.batch_classify(RuleEngine.batch_features(samples), risk_score, table)
+        is_anomaly = risk_score > table.anomaly_threshold
+
+        # 写入环形窗口
+        self._metrics[slots, position] = samples
+        self._raw_scores[slots, position] = raw_score
+        count = np.minimum(count + 1, window)
+        self._count[slots] = count
+        self._position[slots] = (position + 1) % window
+
+        # 置信度：窗口中最近 history_length 个样本入窗时的评分
+        history_length = table.confidence_history_length
+        has_history = count >= history_length
+        recent_anomalies = np.zeros(n, dtype=np.int64)
+        if history_length <= window:
+            for k in range(history_length):
+                recent_anomalies += has_history & (self._raw_scores[slots, (position - k) % window] >
+                                                   table.risk_threshold)
+        confidence = RuleEngine.batch_confidence(risk_score, anomaly_type, recent_anomalies, has_history, table)
+
+        anomalous = slots[is_anomaly]
+        if len(anomalous):
+            self._detections[anomalous] += 1
+            self._last_detection_time[anomalous] = current_time
+            self.stats['total_detections'] += len(anomalous)
+        self.stats['ticks'] += 1
+        self.stats['samples'] += n
+
+        result = {
+            'device_ids': device_ids,
+            'is_anomaly': is_anomaly,
+            'risk_score': risk_score,
+            'confidence': confidence,
+            'anomaly_type': anomaly_type,
+            'timestamp': current_time
+        }
+        if predictor is not None:
+            result['prediction_score'] = self._predict_slots(slots, predictor)
+        return result
+
+    def _predict_slots(self, slots: np.ndarray, predictor, length: int = None) -> np.ndarray:
+        """对窗口已满的槽位做一次批量前向计算，其余为 NaN"""
+        sequences, ready = self._sequences(slots, length)
+        scores = np.full(len(slots), np.nan)
+        if ready.any():
+            scores[ready] = predictor.predict_batch(sequences[ready])
+            self.stats['ai_predictions'] += int(np.count_nonzero(ready))
+        return scores
+
+    def _sequences(self, slots: np.ndarray, length: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        length = length or self.window
+        if length > self.window:
+            raise ValueError(f"序列长度 {length} 超过历史窗口 {self.window}")
+        if FEATURE_SCHEMA.fields != METRIC_FIELDS:
+            raise ValueError("AI 特征模式与指标列顺序不一致，不能直接读取历史窗口")
+        count = self._count[slots]
+        position = self._position[slots]
+        # 最近 length 个样本，按时间从旧到新
+        order = (position[:, None] - length + np.arange(length)) % self.window
+        sequences = self._metrics[slots[:, None], order].astype(FEATURE_DTYPE)
+        return sequences, count >= length
+
+    def get_sequences(self, device_ids: Iterable[int], length: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        多台设备最近 length 个样本组成的 AI 输入序列
+        Args:
+            device_ids: 设备 ID 序列
+            length: 序列长度，默认等于历史窗口长度
+        Returns:
+            ((N, length, 9) float32 序列, (N,) 窗口是否已满；未满设备的序列含无效的零行)
+        """
+        return self._sequences(self.slots_for(device_ids), length)
+
+    def predict(self, device_ids: Iterable[int], predictor, length: int = None) -> np.ndarray:
+        """多台设备当前窗口的 AI 异常概率（一次批量前向计算），窗口未满的设备为 NaN"""
+        return self._predict_slots(self.slots_for(device_ids), predictor, length)
+
+    def detect(self, device_id: int, metrics: Dict[str, Any], defense_controller=None) -> Dict[str, Any]:
+        """检测单个设备的一个样本，返回与 AnomalyDetector.detect_anomaly 相同的字段"""
+        row = np.fromiter((metrics[name] for name in METRIC_FIELDS), dtype=np.float64, count=len(METRIC_FIELDS))
+        result = self.detect_tick([device_id], row, defense_controller)
+        return {
+            'device_id': device_id,
+            'is_anomaly': bool(result['is_anomaly'][0]),
+            'risk_score': float(result['risk_score'][0]),
+            'confidence': float(result['confidence'][0]),
+            'anomaly_type': str(result['anomaly_type'][0]),
+            'timestamp': result['timestamp']
+        }
+
+    # ---- 查询 ----
+
+    def get_window(self, device_id: int) -> np.ndarray:
+        """设备历史窗口 (count, 9)，按时间从旧到新排列（可作为序列模型的输入）"""
+        state = self.devices[device_id]
+        count = self._count[state.slot]
+        order = (self._position[state.slot] - count + np.arange(count)) % self.window
+        return self._metrics[state.slot, order]
+
+    def get_device_stats(self, device_id: int) -> Optional[Dict[str, Any]]:
+        """单个设备的检测统计"""
+        state = self.devices.get(device_id)
+        if state is None:
+            return None
+        slot = state.slot
+        return {
+            'device_id': device_id,
+            'history_size': int(self._count[slot]),
+            'total_detections': int(self._detections[slot]),
+            'last_detection_time': float(self._last_detection_time[slot]),
+            'registered_at': state.registered_at
+        }
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """管理器整体统计"""
+        table = self.rule_engine.table
+        return {
+            **self.stats,
+            'devices': len(self.devices),
+            'capacity': self.capacity,
+            'window': self.window,
+            'state_bytes': int(self._metrics.nbytes + self._raw_scores.nbytes + self._count.nbytes +
+                               self._position.nbytes + self._detections.nbytes +
+                               self._last_detection_time.nbytes),
+            'current_thresholds': {
+                'risk_threshold': table.risk_threshold,
+                'anomaly_threshold': table.anomaly_threshold
+            }
+        }
+
+
+# 测试代码
+if __name__ == "__main__":
+    from telemetry_simulator import FleetTelemetrySimulator
+
+    n_devices = 5000
+    fleet = FleetTelemetrySimulator(n_devices=n_devices, seed=0)
+    manager = DetectorManager(n_devices=n_devices)
+    device_ids = list(range(100000, 100000 + n_devices))
+
+    fleet.trigger_anomaly('ddos', device_ids=[7, 42])
+    start = time.perf_counter()
+    for tick in range(20):
+        result = manager.detect_tick(device_ids, fleet.get_metrics(1700000000 + tick))
+    elapsed = time.perf_counter() - start
+
+    print(f"{n_devices} 台设备 x 20 tick 耗时 {elapsed:.3f} 秒")
+    print(f"最后一个 tick 的告警设备: {[device_ids[i] for i in np.flatnonzero(result['is_anomaly'])]}")
+    print(f"统计: {manager.get_statistics()}")
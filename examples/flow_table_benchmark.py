@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Flow 规则下发吞吐基准
+以逐级提高的触发速率驱动 DefenseController，经 RuleDispatcher 批量下发到 Flow 表模拟器，
+对比控制器能达到的触发速率、下发确认延迟和表占用率，判断瓶颈在控制器还是 Flow 表
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import contextlib
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim_clock import VirtualClock
+from defense_controller import DefenseController
+from rule_dispatcher import RuleDispatcher
+from flow_table_emulator import FlowTableEmulator, FlowTableService, FlowTableClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATES = (100, 1000, 5000, 20000, 50000)
+
+def run_level(rate: int, duration: float, args, socket_path: str = None) -> dict:
+    """
+    以指定触发速率运行一个级别
+    Args:
+        rate: 目标触发速率（次/秒），每次触发针对一个新目标，产生全新的规则
+        duration: 运行时长（秒）
+    Returns:
+        该级别的统计
+    """
+    emulator = FlowTableEmulator(capacity=args.capacity,
+                                 per_batch_latency=args.per_batch_latency,
+                                 per_rule_latency=args.per_rule_latency)
+    service = None
+    if socket_path:
+        service = FlowTableService(socket_path, emulator)
+        service.start()
+        backend = FlowTableClient(socket_path)
+    else:
+        backend = emulator
+
+    dispatcher = RuleDispatcher(backend, max_batch=args.max_batch, max_delay=args.max_delay)
+    clock = VirtualClock()
+    controller = DefenseController(clock=clock, dispatcher=dispatcher)
+
+    n_triggers = int(rate * duration)
+    interval = 1.0 / rate
+    trigger_time = 0.0
+    start = time.perf_counter()
+    for i in range(n_triggers):
+        # 按目标速率节拍触发，控制器跟不上时不等待
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t0 = time.perf_counter()
+        controller.trigger_defense(80.0 + i % 20, 'ddos_attack', target=f"dev{i % args.targets}")
+        trigger_time += time.perf_counter() - t0
+        clock.advance(interval)
+    issue_elapsed = time.perf_counter() - start
+    backlog = dispatcher.get_stats()['pending']
+
+    dispatcher.flush(timeout=60)
+    drain_elapsed = time.perf_counter() - start
+    dispatch = dispatcher.get_stats()
+    table = emulator.get_stats()
+    dispatcher.stop()
+    if service is not None:
+        service.stop()
+
+    installs = dispatch['installs_acked']
+    return {
+        'target_rate': rate,
+        'achieved_rate': n_triggers / issue_elapsed if issue_elapsed > 0 else 0.0,
+        'trigger_us': trigger_time / n_triggers * 1e6 if n_triggers else 0.0,
+        'rules_installed': installs,
+        'install_throughput': installs / drain_elapsed if drain_elapsed > 0 else 0.0,
+        'backlog_at_end': backlog,
+        'avg_ack_ms': dispatch['avg_ack_latency'] * 1e3,
+        'max_ack_ms': dispatch['max_ack_latency'] * 1e3,
+        'avg_batch': dispatch['avg_batch_size'],
+        'occupancy': table['occupancy'],
+        'rejected_full': table['rejected_full']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Flow 规则下发吞吐基准")
+    parser.add_argument('--rates', type=int, nargs='+', default=DEFAULT_RATES, help="逐级触发速率（次/秒）")
+    parser.add_argument('--duration', type=float, default=2.0, help="每个级别的运行时长（秒）")
+    parser.add_argument('--targets', type=int, default=1000000, help="不同目标数（较小时触发会被合并）")
+    parser.add_argument('--capacity', type=int, default=65536, help="Flow 表容量")
+    parser.add_argument('--per-rule-latency', type=float, default=2e-6, help="每条表项的编程开销（秒）")
+    parser.add_argument('--per-batch-latency', type=float, default=2e-4, help="每个批次的编程开销（秒）")
+    parser.add_argument('--max-batch', type=int, default=256, help="下发批次上限")
+    parser.add_argument('--max-delay', type=float, default=0.005, help="凑批等待时间（秒）")
+    parser.add_argument('--socket', default=None, help="通过 Unix 域套接字服务访问 Flow 表（套接字路径）")
+    args = parser.parse_args()
+
+    results = []
+    for rate in args.rates:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results.append(run_level(rate, args.duration, args, args.socket))
+
+    columns = list(results[0].keys())
+    print(" ".join(f"{c:>18}" for c in columns))
+    for row in results:
+        print(" ".join(f"{row[c]:>18.1f}" if isinstance(row[c], float) else f"{row[c]:>18}" for c in columns))
+
+    for row in results:
+        if row['achieved_rate'] < row['target_rate'] * 0.9:
+            print(f"速率 {row['target_rate']}/s: 控制器成为瓶颈（实际 {row['achieved_rate']:.0f}/s）")
+        elif row['backlog_at_end'] > args.max_batch:
+            print(f"速率 {row['target_rate']}/s: Flow 表编程成为瓶颈（积压 {row['backlog_at_end']} 条）")
+
+if __name__ == "__main__":
+    main()
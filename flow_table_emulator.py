@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+DPU Flow 表模拟器
+在没有 BlueField 硬件时替代硬件 Flow 表，作为规则下发的默认后端
+
+模拟容量有限的 Flow 表：每条表项带优先级、匹配字段和命中计数器，
+支持批量安装/删除，并统计安装延迟和表占用率。
+可以在进程内直接使用，也可以通过 FlowTableService 以 Unix 域套接字服务的形式运行，
+由 FlowTableClient 作为 RuleDispatcher 的后端访问。
+
+套接字协议: 4 字节小端长度 + JSON 请求/响应
+    {"op": "install", "rules": [...]}     -> {"acks": {rule_id: bool}}
+    {"op": "remove", "rule_ids": [...]}   -> {"acks": {rule_id: bool}}
+    {"op": "stats"}                       -> {"stats": {...}}
+"""
+
+import os
+import json
+import time
+import socket
+import struct
+import threading
+import socketserver
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 规则优先级到表项优先级的映射（数值越大越优先）
+PRIORITY_LEVELS = {'low': 1, 'medium': 2, 'high': 3}
+
+# 表项匹配字段，未在规则中给出的字段为通配
+MATCH_FIELDS = ('target', 'src_ip', 'dst_ip', 'protocol', 'dst_port')
+
+MESSAGE_HEADER = struct.Struct('<I')
+
+
+class FlowRuleBackend(ABC):
+    """Flow 规则下发后端接口（未实现全部接口方法的后端在创建时即报错）"""
+
+    @abstractmethod
+    def install_batch(self, rules: List[Dict[str, Any]]) -> Dict[str, bool]:
+        """批量安装（同 ID 已存在时覆盖），返回每条规则的确认结果 {rule_id: 成功与否}"""
+
+    @abstractmethod
+    def remove_batch(self, rule_ids: List[str]) -> Dict[str, bool]:
+        """批量删除，返回每条规则的确认结果（删除不存在的规则视为成功）"""
+
+    def close(self):
+        """释放后端资源"""
+        pass
+
+
+class FlowEntry:
+    """Flow 表项"""
+
+    __slots__ = ('rule_id', 'priority', 'match', 'action', 'parameters', 'installed_time',
+                 'packets', 'bytes', 'hits')
+
+    def __init__(self, rule: Dict[str, Any], installed_time: float):
+        self.rule_id = rule['id']
+        priority = rule.get('priority', 'low')
+        self.priority = PRIORITY_LEVELS.get(priority, priority) if isinstance(priority, str) else int(priority)
+        match = dict(rule.get('match', {}))
+        if 'target' in rule:
+            match.setdefault('target', rule['target'])
+        self.match = {name: match[name] for name in MATCH_FIELDS if name in match}
+        self.action = rule.get('action')
+        self.parameters = rule.get('parameters', {})
+        self.installed_time = installed_time
+        self.packets = 0
+        self.bytes = 0
+        self.hits = 0
+
+    def matches(self, packet: Dict[str, Any]) -> bool:
+        for name, value in self.match.items():
+            if packet.get(name) != value:
+                return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'rule_id': self.rule_id,
+            'priority': self.priority,
+            'match': self.match,
+            'action': self.action,
+            'installed_time': self.installed_time,
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'hits': self.hits
+        }
+
+
+class FlowTableEmulator(FlowRuleBackend):
+    """进程内 Flow 表模拟器（容量有限，满时拒绝新规则）"""
+
+    def __init__(self, capacity: int = 65536, per_batch_latency: float = 0.0,
+                 per_rule_latency: float = 0.0, latency_samples: int = 4096):
+        """
+        Args:
+            capacity: 表项容量
+            per_batch_latency: 每个批次的固定编程开销（秒），模拟硬件提交
+            per_rule_latency: 每条表项的编程开销（秒）
+            latency_samples: 保留的批次延迟样本数（用于分位数统计）
+        """
+        self.capacity = capacity
+        self.per_batch_latency = per_batch_latency
+        self.per_rule_latency = per_rule_latency
+
+        self.table: Dict[str, FlowEntry] = {}
+        # 按匹配目标索引，查找时只扫描同一目标和通配目标的表项
+        self._by_target: Dict[Any, Dict[str, FlowEntry]] = {}
+        self._lock = threading.Lock()
+
+        self._batch_latencies = deque(maxlen=latency_samples)
+        self.stats = {
+            'install_batches': 0,
+            'remove_batches': 0,
+            'installed': 0,
+            'modified': 0,
+            'removed': 0,
+            'rejected_full': 0,
+            'peak_occupancy': 0,
+            'lookups': 0,
+            'lookup_misses': 0,
+            'total_install_time': 0.0
+        }
+
+    def _program(self, n_rules: int):
+        """模拟硬件编程耗时"""
+        delay = self.per_batch_latency + self.per_rule_latency * n_rules
+        if delay > 0:
+            time.sleep(delay)
+
+    def install_batch(self, rules: List[Dict[str, Any]]) -> Dict[str, bool]:
+        start = time.perf_counter()
+        self._program(len(rules))
+        acks = {}
+        with self._lock:
+            now = time.time()
+            for rule in rules:
+                rule_id = rule['id']
+                old = self.table.get(rule_id)
+                if old is None and len(self.table) >= self.capacity:
+                    self.stats['rejected_full'] += 1
+                    acks[rule_id] = False
+                    continue
+                entry = FlowEntry(rule, now)
+                if old is not None:
+                    # 修改表项时保留计数器
+                    entry.packets, entry.bytes, entry.hits = old.packets, old.bytes, old.hits
+                    self._unindex(old)
+                    self.stats['modified'] += 1
+                else:
+                    self.stats['installed'] += 1
+                self.table[rule_id] = entry
+                self._by_target.setdefault(entry.match.get('target'), {})[rule_id] = entry
+                acks[rule_id] = True
+
+            elapsed = time.perf_counter() - start
+            self.stats['install_batches'] += 1
+            self.stats['total_install_time'] += elapsed
+            self.stats['peak_occupancy'] = max(self.stats['peak_occupancy'], len(self.table))
+            self._batch_latencies.append((elapsed, len(rules)))
+        return acks
+
+    def remove_batch(self, rule_ids: List[str]) -> Dict[str, bool]:
+        self._program(len(rule_ids))
+        with self._lock:
+            self.stats['remove_batches'] += 1
+            for rule_id in rule_ids:
+                entry = self.table.pop(rule_id, None)
+                if entry is not None:
+                    self._unindex(entry)
+                    self.stats['removed'] += 1
+        return {rule_id: True for rule_id in rule_ids}
+
+    def _unindex(self, entry: FlowEntry):
+        target = entry.match.get('target')
+        bucket = self._by_target.get(target)
+        if bucket is not None:
+            bucket.pop(entry.rule_id, None)
+            if not bucket:
+                del self._by_target[target]
+
+    def lookup(self, packet: Dict[str, Any], n_packets: int = 1, n_bytes: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        按优先级查找匹配的表项并累加计数器
+        Args:
+            packet: 匹配字段，如 {'target': 'dev1', 'protocol': 'tcp'}
+            n_packets: 本次计入的包数
+            n_bytes: 本次计入的字节数
+        Returns:
+            命中表项的信息，未命中返回 None
+        """
+        with self._lock:
+            self.stats['lookups'] += 1
+            best = None
+            for target in (packet.get('target'), None):
+                for entry in self._by_target.get(target, {}).values():
+                    if (best is None or entry.priority > best.priority) and entry.matches(packet):
+                        best = entry
+            if best is None:
+                self.stats['lookup_misses'] += 1
+                return None
+            best.hits += 1
+            best.packets += n_packets
+            best.bytes += n_bytes
+            return best.to_dict()
+
+    def get_entry(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.table.get(rule_id)
+            return entry.to_dict() if entry is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """表占用率和安装延迟统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['occupancy'] = len(self.table)
+            stats['capacity'] = self.capacity
+            stats['occupancy_ratio'] = len(self.table) / self.capacity if self.capacity else 0.0
+            by_priority = {}
+            for entry in self.table.values():
+                by_priority[entry.priority] = by_priority.get(entry.priority, 0) + 1
+            stats['occupancy_by_priority'] = by_priority
+            samples = list(self._batch_latencies)
+
+        if samples:
+            latencies = sorted(latency for latency, _ in samples)
+            rules = sum(n for _, n in samples)
+            stats['install_latency_p50'] = latencies[len(latencies) // 2]
+            stats['install_latency_p99'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            stats['install_latency_per_rule'] = sum(latencies) / rules if rules else 0.0
+        return stats
+
+
+# ---- Unix 域套接字服务 ----
+
+def _send_message(sock: socket.socket, message: Dict[str, Any]):
+    payload = json.dumps(message).encode('utf-8')
+    sock.sendall(MESSAGE_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, nbytes: int) -> Optional[bytes]:
+    buffer = bytearray()
+    while len(buffer) < nbytes:
+        chunk = sock.recv(nbytes - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def _recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    header = _recv_exact(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exact(sock, MESSAGE_HEADER.unpack(header)[0])
+    if payload is None:
+        return None
+    return json.loads(payload.decode('utf-8'))
+
+
+class _FlowTableRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        emulator = self.server.emulator
+        while True:
+            try:
+                request = _recv_message(self.request)
+            except (ConnectionError, ValueError) as e:
+                logger.warning(f"Flow table client error: {e}")
+                return
+            if request is None:
+                return
+
+            op = request.get('op')
+            if op == 'install':
+                response = {'acks': emulator.install_batch(request.get('rules', []))}
+            elif op == 'remove':
+                response = {'acks': emulator.remove_batch(request.get('rule_ids', []))}
+            elif op == 'stats':
+                response = {'stats': emulator.get_stats()}
+            else:
+                response = {'error': f"unknown op: {op}"}
+            _send_message(self.request, response)
+
+
+class FlowTableService:
+    """Flow 表模拟服务（Unix 域套接字）"""
+
+    def __init__(self, path: str, emulator: FlowTableEmulator = None):
+        self.path = path
+        self.emulator = emulator or FlowTableEmulator()
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, _FlowTableRequestHandler)
+        self.server.daemon_threads = True
+        self.server.emulator = self.emulator
+        self.thread = None
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name='flow-table')
+        self.thread.start()
+        logger.info(f"Flow table service listening on {self.path}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class FlowTableClient(FlowRuleBackend):
+    """通过 Unix 域套接字访问 FlowTableService 的下发后端"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._lock = threading.Lock()
+
+    def _request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            _send_message(self.sock, message)
+            response = _recv_message(self.sock)
+        if response is None:
+            raise ConnectionError("Flow table service closed the connection")
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def install_batch(self, rules: List[Dict[str, Any]]) -> Dict[str, bool]:
+        return self._request({'op': 'install', 'rules': rules})['acks']
+
+    def remove_batch(self, rule_ids: List[str]) -> Dict[str, bool]:
+        return self._request({'op': 'remove', 'rule_ids': rule_ids})['acks']
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._request({'op': 'stats'})['stats']
+
+    def close(self):
+        self.sock.close()
+
+
+# 测试代码
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DPU Flow 表模拟服务")
+    parser.add_argument('--path', default='/tmp/dpu_flow_table.sock', help="Unix 域套接字路径")
+    parser.add_argument('--capacity', type=int, default=65536, help="表项容量")
+    parser.add_argument('--per-rule-latency', type=float, default=0.0, help="每条表项的编程开销（秒）")
+    parser.add_argument('--per-batch-latency', type=float, default=0.0, help="每个批次的编程开销（秒）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = FlowTableService(args.path, FlowTableEmulator(
+        capacity=args.capacity,
+        per_batch_latency=args.per_batch_latency,
+        per_rule_latency=args.per_rule_latency
+    ))
+    service.start()
+    print(f"Flow 表模拟服务已启动: {args.path}，按 Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"表统计: {service.emulator.get_stats()}")
+    except KeyboardInterrupt:
+        service.stop()
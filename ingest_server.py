@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+异步多设备 Telemetry 接入服务
+基于 asyncio 接收多个采集器的并发 TCP 流，每设备独立的有界队列和检测任务
+
+流格式与 telemetry_ingest 的数据报一致：连续的 [批次头 + network_metrics_t 记录] 帧。
+队列满时按策略处理:
+    'drop_oldest'  丢弃该设备最旧的批次，保证检测始终看到最新数据
+    'backpressure' 暂停读取该设备的连接，由 TCP 流控反压到采集器
+两种策略都只影响当前设备，不会阻塞其他设备的检测。'backpressure' 暂停的是整条连接，
+因此该策略下每条连接只能承载一个设备（首帧的 device_id），出现其他设备的帧时关闭连接。
+
+device_id 来自网络，通道数受 max_devices 限制，可用 allowed_devices 指定允许接入的设备；
+超出限制或不在名单内的设备的帧直接丢弃。
+
+检测回调在线程池中执行。每个设备的检测任务串行处理批次，同一设备最多只有一个回调在执行；
+线程池默认按 max_devices 设定上限（线程按需创建，数量不超过同时在处理的设备数），
+因此慢设备只占用自己的线程，不会让其他设备的回调排队。显式指定较小的 max_workers 时，
+超过该数量的慢设备会占满线程池并拖慢其他设备。
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from telemetry_format import NETWORK_METRICS_DTYPE, RECORD_SIZE
+from telemetry_ingest import BATCH_HEADER_STRUCT, BATCH_HEADER_SIZE, encode_batch
+
+logger = logging.getLogger(__name__)
+
+QUEUE_POLICIES = ('drop_oldest', 'backpressure')
+MAX_RECORDS_PER_FRAME = 65536
+
+
+class DeviceChannel:
+    """单设备接入通道：有界队列 + 延迟计数"""
+
+    def __init__(self, device_id: int, queue_size: int):
+        self.device_id = device_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.worker = None
+
+        self.stats = {
+            'batches_received': 0,
+            'records_received': 0,
+            'batches_processed': 0,
+            'records_processed': 0,
+            'batches_dropped': 0,
+            'records_dropped': 0,
+            'backpressure_waits': 0,
+            'handler_errors': 0,
+            'max_queue_depth': 0,
+            'last_received_timestamp': 0,
+            'last_processed_timestamp': 0,
+            'last_receive_time': 0.0
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取通道统计，lag 为已接收与已处理数据的时间戳差"""
+        stats = self.stats.copy()
+        stats['queue_depth'] = self.queue.qsize()
+        stats['lag_seconds'] = max(0, stats['last_received_timestamp'] - stats['last_processed_timestamp'])
+        stats['lag_batches'] = stats['batches_received'] - stats['batches_processed'] - stats['batches_dropped']
+        return stats
+
+
+class AsyncIngestServer:
+    """异步多设备接入服务"""
+
+    def __init__(self, handler: Callable[[int, np.ndarray], None],
+                 host: str = '127.0.0.1', port: int = 0,
+                 queue_size: int = 64, policy: str = 'drop_oldest',
+                 max_workers: int = None, max_devices: int = 4096,
+                 allowed_devices: Iterable[int] = None):
+        """
+        Args:
+            handler: 检测回调 handler(device_id, records)，在线程池中执行
+            host: 监听地址
+            port: 监听端口，0 表示由系统分配
+            queue_size: 每设备队列容量（批次数）
+            policy: 队列满时的策略，'drop_oldest' 或 'backpressure'
+            max_workers: 检测线程池大小，默认等于 max_devices（每个设备至多占用一个线程）
+            max_devices: 最多接入的设备数（通道数上限）
+            allowed_devices: 允许接入的设备 ID，None 表示不限制
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"不支持的队列策略: {policy}")
+
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.policy = policy
+        self.max_devices = max_devices
+        self.allowed_devices = frozenset(allowed_devices) if allowed_devices is not None else None
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or max_devices, thread_name_prefix='ingest')
+        self.channels: Dict[int, DeviceChannel] = {}
+        self.server = None
+
+        self.stats = {
+            'connections': 0,
+            'active_connections': 0,
+            'malformed_frames': 0,
+            'rejected_frames': 0
+        }
+
+    async def start(self):
+        """启动监听"""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Async ingest server listening on {self.host}:{self.port} (policy={self.policy})")
+
+    async def serve_forever(self):
+        """启动并持续运行"""
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self, drain: bool = True):
+        """停止服务，drain 为 True 时等待已入队数据处理完毕"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+        if drain:
+            await asyncio.gather(*(channel.queue.join() for channel in self.channels.values()))
+
+        for channel in self.channels.values():
+            if channel.worker is not None:
+                channel.worker.cancel()
+        await asyncio.gather(*(c.worker for c in self.channels.values() if c.worker), return_exceptions=True)
+        self.executor.shutdown(wait=True)
+
+    def _get_channel(self, device_id: int) -> Optional[DeviceChannel]:
+        """获取或创建设备通道，同时启动该设备的检测任务；设备不允许接入时返回 None"""
+        channel = self.channels.get(device_id)
+        if channel is None:
+            if self.allowed_devices is not None and device_id not in self.allowed_devices:
+                return None
+            if len(self.channels) >= self.max_devices:
+                return None
+            channel = DeviceChannel(device_id, self.queue_size)
+            channel.worker = asyncio.create_task(self._device_worker(channel))
+            self.channels[device_id] = channel
+        return channel
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个采集器连接"""
+        self.stats['connections'] += 1
+        self.stats['active_connections'] += 1
+        peer = writer.get_extra_info('peername')
+        # 'backpressure' 策略下连接绑定的设备
+        bound_device = None
+
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(BATCH_HEADER_SIZE)
+                except asyncio.IncompleteReadError:
+                    break
+
+                device_id, count = BATCH_HEADER_STRUCT.unpack(header)
+                if count > MAX_RECORDS_PER_FRAME:
+                    self.stats['malformed_frames'] += 1
+                    logger.warning(f"Oversized frame from {peer}: {count} records, closing")
+                    break
+
+                if self.policy == 'backpressure':
+                    if bound_device is None:
+                        bound_device = device_id
+                    elif device_id != bound_device:
+                        self.stats['malformed_frames'] += 1
+                        logger.warning(f"Frame for device {device_id} on connection bound to device "
+                                       f"{bound_device} from {peer}, closing")
+                        break
+
+                payload = await reader.readexactly(count * RECORD_SIZE)
+                channel = self._get_channel(device_id)
+                if channel is None:
+                    self.stats['rejected_frames'] += 1
+                    logger.debug(f"Rejected frame for device {device_id} from {peer}")
+                    continue
+                records = np.frombuffer(payload, dtype=NETWORK_METRICS_DTYPE, count=count)
+                await self._enqueue(channel, records)
+        except asyncio.IncompleteReadError:
+            self.stats['malformed_frames'] += 1
+            logger.warning(f"Truncated frame from {peer}")
+        except ConnectionError as e:
+            logger.warning(f"Connection from {peer} lost: {e}")
+        finally:
+            self.stats['active_connections'] -= 1
+            writer.close()
+
+    async def _enqueue(self, channel: DeviceChannel, records: np.ndarray):
+        """按队列策略将批次放入设备队列"""
+        stats = channel.stats
+        stats['batches_received'] += 1
+        stats['records_received'] += len(records)
+        stats['last_receive_time'] = time.time()
+        if len(records):
+            stats['last_received_timestamp'] = int(records['timestamp'][-1])
+
+        if channel.queue.full():
+            if self.policy == 'drop_oldest':
+                dropped = channel.queue.get_nowait()
+                channel.queue.task_done()
+                stats['batches_dropped'] += 1
+                stats['records_dropped'] += len(dropped)
+            else:
+                stats['backpressure_waits'] += 1
+                await channel.queue.put(records)
+                stats['max_queue_depth'] = max(stats['max_queue_depth'], channel.queue.qsize())
+                return
+
+        channel.queue.put_nowait(records)
+        stats['max_queue_depth'] = max(stats['max_queue_depth'], channel.queue.qsize())
+
+    async def _device_worker(self, channel: DeviceChannel):
+        """设备检测任务：串行处理该设备的批次（同一设备至多一个回调在执行），保证单设备内的时间顺序"""
+        loop = asyncio.get_running_loop()
+        stats = channel.stats
+
+        while True:
+            records = await channel.queue.get()
+            try:
+                await loop.run_in_executor(self.executor, self.handler, channel.device_id, records)
+                stats['batches_processed'] += 1
+                stats['records_processed'] += len(records)
+                if len(records):
+                    stats['last_processed_timestamp'] = int(records['timestamp'][-1])
+            except Exception as e:
+                stats['handler_errors'] += 1
+                logger.error(f"Handler failed for device {channel.device_id}: {e}")
+            finally:
+                channel.queue.task_done()
+
+    def get_device_stats(self) -> Dict[int, Dict[str, Any]]:
+        """获取每设备的队列与延迟统计"""
+        return {device_id: channel.get_stats() for device_id, channel in self.channels.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取服务整体统计"""
+        device_stats = self.get_device_stats().values()
+        return {
+            **self.stats,
+            'devices': len(self.channels),
+            'policy': self.policy,
+            'total_records_received': sum(s['records_received'] for s in device_stats),
+            'total_records_dropped': sum(s['records_dropped'] for s in device_stats),
+            'max_lag_seconds': max((s['lag_seconds'] for s in device_stats), default=0)
+        }
+
+
+async def send_stream(host: str, port: int, device_id: int, batches: Iterable[np.ndarray],
+                      interval: float = 0.0):
+    """本地替身采集器：通过 TCP 流发送批次"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for records in batches:
+            writer.write(encode_batch(device_id, records))
+            await writer.drain()
+            if interval:
+                await asyncio.sleep(interval)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+# 测试代码
+if __name__ == "__main__":
+    from telemetry_simulator import FleetTelemetrySimulator
+    from telemetry_format import records_from_matrix
+
+    n_devices = 50
+    slow_device = 3
+
+    def handle(device_id: int, records: np.ndarray):
+        # 模拟被 DDoS 的设备检测变慢
+        if device_id == slow_device:
+            time.sleep(0.05)
+
+    async def main():
+        server = AsyncIngestServer(handle, queue_size=8, policy='drop_oldest')
+        await server.start()
+
+        fleet = FleetTelemetrySimulator(n_devices=n_devices, seed=0)
+        ticks = []
+        for tick in range(100):
+            timestamp = 1700000000 + tick
+            ticks.append(records_from_matrix(fleet.get_metrics(timestamp), timestamp))
+
+        await asyncio.gather(*(
+            send_stream(server.host, server.port, device,
+                        (tick[device:device + 1] for tick in ticks), interval=0.001)
+            for device in range(n_devices)
+        ))
+        await asyncio.sleep(0.2)
+
+        device_stats = server.get_device_stats()
+        print(f"服务统计: {server.get_stats()}")
+        print(f"慢设备 {slow_device}: {device_stats[slow_device]}")
+        print(f"正常设备 0: {device_stats[0]}")
+        await server.stop(drain=False)
+
+    asyncio.run(main())
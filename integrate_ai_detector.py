@@ -10,7 +10,8 @@ import json
 import logging
 import time
 import threading
-from typing import Dict, Optional, List
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional, List, NamedTuple
 import numpy as np
 
 # 添加项目路径
@@ -18,6 +19,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.ai_engine.inference.ai_anomaly_detector import AIAnomalyDetector, AIAnomalyResult
 from src.ai_engine.inference.predictive_analyzer import PredictiveAnalyzer
+from src.ai_engine.training.feature_schema import FEATURE_SCHEMA
 from anomaly_detector import AnomalyDetector
 from telemetry_simulator import TelemetrySimulator
 from defense_controller import DefenseController
@@ -29,16 +31,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 级联检测默认配置（可由 AI 配置文件的 "cascade" 段或构造参数覆盖）
+#   normal_below   规则评分低于该值（默认与规则 anomaly_threshold 相同），且各指标偏离基线
+#                  不超过 max_zscore 个标准差时，判定为正常，跳过 AI
+#   critical_above 规则评分高于该值时直接判定为异常，跳过 AI
+#   min_baseline   基线样本数不足时不按正常提前退出
+DEFAULT_CASCADE = {
+    'enabled': False,
+    'normal_below': 40,
+    'critical_above': 90,
+    'max_zscore': 4.0,
+    'min_baseline': 10,
+    # 计算基线偏离的规则检测器基线窗口（样本数），启用级联时由规则检测器维护
+    'baseline_window': 60
+}
+
+class PendingAI(NamedTuple):
+    """已提交的 AI 分支（future 为 None 表示上一次推理仍未完成，本次未提交）"""
+    future: Optional[Future]
+    deadline_at: float
+
 class HybridAnomalyDetector:
     """混合异常检测器 - 结合规则检测和AI检测"""
     
-    def __init__(self, ai_model_path: str = None, config_path: str = None):
+    def __init__(self, ai_model_path: str = None, config_path: str = None, clock=None,
+                 rule_detector: AnomalyDetector = None, ai_deadline: float = None, cascade: Dict = None):
+        """
+        Args:
+            ai_model_path: LSTM 模型文件
+            config_path: AI 检测器配置文件
+            clock: 时间源（默认真实时间，可注入 sim_clock.VirtualClock）
+            rule_detector: 共享的规则检测器（与检测流水线共用，避免同一样本评分两次）
+            ai_deadline: 每个 tick 等待 AI 分支的时限（秒，按真实时间计）。设置后 AI 分支在后台线程中
+                         与规则分支并发执行，超时的 tick 退回规则评分并标记为降级；None 表示串行执行
+            cascade: 级联检测配置，见 DEFAULT_CASCADE（覆盖 AI 配置文件中的 "cascade" 段）
+        """
+        self.clock = clock or time
+        
         # 初始化规则检测器
-        self.rule_detector = AnomalyDetector()
+        self.rule_detector = rule_detector or AnomalyDetector(clock=clock)
         
         # 初始化AI检测器
         if ai_model_path and os.path.exists(ai_model_path):
-            self.ai_detector = AIAnomalyDetector(model_path=ai_model_path, config_path=config_path)
+            self.ai_detector = AIAnomalyDetector(model_path=ai_model_path, config_path=config_path, clock=clock)
             self.ai_model_loaded = True
         else:
             self.ai_detector = None
@@ -46,7 +81,12 @@ class HybridAnomalyDetector:
             logger.warning("AI model not loaded, using rule-based detection only")
         
         # 初始化预测性分析器
-        self.predictive_analyzer = PredictiveAnalyzer(model_path=ai_model_path)
+        # 与 AI 检测器使用同一推理后端（配置 "backend"）
+        backend = self.ai_detector.predictor.backend if self.ai_detector is not None else 'auto'
+        self.predictive_analyzer = PredictiveAnalyzer(model_path=ai_model_path, clock=clock, backend=backend)
+        
+        # 预分配的特征行（未由检测流水线传入特征时使用）
+        self._feature_row = FEATURE_SCHEMA.new_row()
         
         # 检测模式: 'rule_only', 'ai_only', 'hybrid'
         self.detection_mode = 'hybrid'
@@ -58,43 +98,190 @@ class HybridAnomalyDetector:
         # 检测历史
         self.detection_history = []
         
+        # 并发模式：AI 分支在单个后台线程中执行，上一次推理未完成时不再排队
+        self.ai_deadline = ai_deadline
+        self._executor = None
+        self._inflight: Optional[Future] = None
+        # 最近一次提交到后台线程的任务（推理或排队的样本记录），之后的记录须排在其后
+        self._last_task: Optional[Future] = None
+        # 级联检测：规则评分和基线偏离足以判定时跳过 AI 阶段
+        self.cascade = dict(DEFAULT_CASCADE)
+        if self.ai_detector is not None:
+            self.cascade.update(self.ai_detector.config.get('cascade', {}))
+        self.cascade.update(cascade or {})
+        if self.cascade['enabled']:
+            self.rule_detector.track_deviation(self.cascade['baseline_window'], self.cascade['min_baseline'])
+        
+        self.stats = {
+            'ai_submitted': 0,
+            'ai_timeouts': 0,
+            'ai_skipped': 0,
+            'ai_errors': 0,
+            'degraded': 0,
+            'cascade_checked': 0,
+            'cascade_normal': 0,
+            'cascade_critical': 0
+        }
+        
         logger.info(f"Hybrid Anomaly Detector initialized with mode: {self.detection_mode}")
         logger.info(f"AI model loaded: {self.ai_model_loaded}")
     
-    def detect_anomaly(self, metrics: Dict, defense_controller=None) -> Dict:
+    def detect_anomaly(self, metrics: Dict, defense_controller=None, rule_result: Dict = None,
+                       features: np.ndarray = None, ai_task: PendingAI = None) -> Dict:
         """
         混合异常检测
         Args:
             metrics: 网络指标
             defense_controller: 防御控制器
+            rule_result: 规则检测器对同一样本的结果（由检测流水线传入时不再重复评分）
+            features: 按 FEATURE_SCHEMA 提取的特征行，预测性分析器和 AI 检测器共用
+            ai_task: 调用方已通过 submit_ai 提前提交的 AI 分支（并发模式）
         Returns:
             检测结果
         """
+        if features is None:
+            features = FEATURE_SCHEMA.extract(metrics, out=self._feature_row)
+        
         # 添加数据到预测性分析器
-        self.predictive_analyzer.add_metrics(metrics)
+        self.predictive_analyzer.add_metrics(metrics, features=features)
+        
+        if self.detection_mode == 'rule_only' or self.ai_detector is None:
+            # AI 模型不可用时退回规则检测
+            return self._rule_detection(metrics, defense_controller, rule_result)
         
-        if self.detection_mode == 'rule_only':
-            return self._rule_detection(metrics, defense_controller)
-        elif self.detection_mode == 'ai_only':
-            return self._ai_detection(metrics, defense_controller)
-        else:  # hybrid
-            return self._hybrid_detection(metrics, defense_controller)
-    
-    def _rule_detection(self, metrics: Dict, defense_controller=None) -> Dict:
+        rule = None
+        if ai_task is None and self.cascade_enabled:
+            # 级联：先算规则评分，足以判定时不调用模型
+            rule_result = rule_result or self.rule_detector.detect_anomaly(metrics, defense_controller)
+            rule = self._rule_detection(metrics, defense_controller, rule_result)
+            exit_reason = self._cascade_exit(rule, rule_result.get('baseline_zscore', float('inf')))
+            if exit_reason is not None:
+                self._observe_ai(metrics, features)
+                rule['cascade_exit'] = exit_reason
+                return rule
+        
+        if ai_task is None:
+            ai_task = self.submit_ai(metrics, defense_controller, features)
+        if ai_task is None:
+            # 串行模式
+            ai_result = self._ai_detection(metrics, defense_controller, features)
+            if self.detection_mode == 'ai_only':
+                return ai_result
+            rule = rule or self._rule_detection(metrics, defense_controller, rule_result)
+            return self._hybrid_detection(rule, ai_result)
+        
+        # 并发模式：AI 分支在后台执行期间计算规则分支
+        if self.detection_mode == 'hybrid' and rule is None:
+            rule = self._rule_detection(metrics, defense_controller, rule_result)
+        ai_result, reason = self._wait_ai(ai_task)
+        if ai_result is None:
+            # AI 分支未在时限内完成：本 tick 使用规则评分并标记为降级
+            rule = rule or self._rule_detection(metrics, defense_controller, rule_result)
+            rule['degraded'] = True
+            rule['degraded_reason'] = reason
+            self.stats['degraded'] += 1
+            return rule
+        if self.detection_mode == 'ai_only':
+            return ai_result
+        return self._hybrid_detection(rule, ai_result)
+    
+    @property
+    def cascade_enabled(self) -> bool:
+        """级联检测只在混合模式下生效（ai_only 模式总是调用模型）"""
+        return bool(self.cascade['enabled']) and self.detection_mode == 'hybrid'
+    
+    def _cascade_exit(self, rule: Dict, baseline_zscore: float) -> Optional[str]:
+        """
+        规则评分足以判定时返回 'normal' / 'critical'，否则返回 None（需要 AI 阶段）
+        Args:
+            rule: 规则检测结果
+            baseline_zscore: 样本计入基线之前相对基线的偏离（规则检测结果中的 baseline_zscore）
+        """
+        cascade = self.cascade
+        self.stats['cascade_checked'] += 1
+        if rule['risk_score'] > cascade['critical_above']:
+            self.stats['cascade_critical'] += 1
+            return 'critical'
+        if rule['risk_score'] < cascade['normal_below'] and baseline_zscore <= cascade['max_zscore']:
+            self.stats['cascade_normal'] += 1
+            return 'normal'
+        return None
+    
+    def set_cascade(self, **options):
+        """更新级联检测配置（enabled / normal_below / critical_above / max_zscore / min_baseline / baseline_window）"""
+        unknown = set(options) - set(DEFAULT_CASCADE)
+        if unknown:
+            logger.error(f"Invalid cascade options: {sorted(unknown)}")
+            return
+        self.cascade.update(options)
+        if self.cascade['enabled']:
+            self.rule_detector.track_deviation(self.cascade['baseline_window'], self.cascade['min_baseline'])
+        logger.info(f"Cascade updated: {self.cascade}")
+    
+    def submit_ai(self, metrics: Dict, defense_controller=None, features: np.ndarray = None) -> Optional[PendingAI]:
+        """
+        在后台线程中提交 AI 分支，截止时间从提交时刻起算
+        Returns:
+            PendingAI；串行模式、规则模式或 AI 模型不可用时返回 None
+        """
+        if self.ai_deadline is None or self.ai_detector is None or self.detection_mode == 'rule_only':
+            return None
+        deadline_at = time.perf_counter() + self.ai_deadline
+        if features is None:
+            features = FEATURE_SCHEMA.extract(metrics)
+        else:
+            # 调用方会在下一个 tick 复用该行
+            features = features.copy()
+        if self._inflight is not None and not self._inflight.done():
+            # 上一次推理仍在执行，不排队推理，避免 CPU 紧张时积压使之后每个 tick 都超时；
+            # 样本仍记入 AI 检测器（与级联跳过时相同），保持序列连续
+            self._observe_ai(metrics, features)
+            self.stats['ai_skipped'] += 1
+            return PendingAI(None, deadline_at)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hybrid-ai')
+        self._inflight = self._last_task = self._executor.submit(self._ai_detection, metrics, defense_controller,
+                                                                 features)
+        self.stats['ai_submitted'] += 1
+        return PendingAI(self._inflight, deadline_at)
+    
+    def _observe_ai(self, metrics: Dict, features: np.ndarray):
+        """只记录样本、不推理；后台线程仍有未完成的任务（推理或记录）时排在其后，保持样本顺序"""
+        if self._executor is not None and self._last_task is not None and not self._last_task.done():
+            self._last_task = self._executor.submit(self.ai_detector.observe, metrics, features.copy())
+        else:
+            self.ai_detector.observe(metrics, features)
+    
+    def _wait_ai(self, ai_task: PendingAI):
+        """等待 AI 分支到截止时间，返回 (结果, 降级原因)"""
+        if ai_task.future is None:
+            return None, 'ai_busy'
+        try:
+            return ai_task.future.result(timeout=max(0.0, ai_task.deadline_at - time.perf_counter())), None
+        except FutureTimeoutError:
+            # 推理继续在后台完成（更新 AI 检测器的序列和历史），结果不再使用
+            self.stats['ai_timeouts'] += 1
+            return None, 'ai_timeout'
+        except Exception as e:
+            self.stats['ai_errors'] += 1
+            logger.error(f"AI detection failed: {e}")
+            return None, 'ai_error'
+    
+    def _rule_detection(self, metrics: Dict, defense_controller=None, rule_result: Dict = None) -> Dict:
         """规则检测"""
-        result = self.rule_detector.detect_anomaly(metrics, defense_controller)
+        result = rule_result or self.rule_detector.detect_anomaly(metrics, defense_controller)
         return {
             'risk_score': result['risk_score'],
             'is_anomaly': result['is_anomaly'],
             'anomaly_type': result['anomaly_type'],
             'confidence': result['confidence'],
             'detection_method': 'rule_based',
-            'timestamp': int(time.time())
+            'timestamp': int(self.clock.time())
         }
     
-    def _ai_detection(self, metrics: Dict, defense_controller=None) -> Dict:
+    def _ai_detection(self, metrics: Dict, defense_controller=None, features: np.ndarray = None) -> Dict:
         """AI检测"""
-        result = self.ai_detector.detect_anomaly(metrics, defense_controller)
+        result = self.ai_detector.detect_anomaly(metrics, defense_controller, features=features)
         return {
             'risk_score': result.risk_score,
             'is_anomaly': result.is_anomaly,
@@ -106,14 +293,8 @@ class HybridAnomalyDetector:
             'timestamp': result.timestamp
         }
     
-    def _hybrid_detection(self, metrics: Dict, defense_controller=None) -> Dict:
-        """混合检测"""
-        # 规则检测
-        rule_result = self._rule_detection(metrics, defense_controller)
-        
-        # AI检测
-        ai_result = self._ai_detection(metrics, defense_controller)
-        
+    def _hybrid_detection(self, rule_result: Dict, ai_result: Dict) -> Dict:
+        """混合检测：融合规则检测和 AI 检测的结果"""
         # 加权融合
         hybrid_risk_score = (
             rule_result['risk_score'] * self.rule_weight +
@@ -142,7 +323,7 @@ class HybridAnomalyDetector:
             'ai_score': ai_result['risk_score'],
             'ai_prediction': ai_result['prediction_score'],
             'model_version': ai_result.get('model_version', 'unknown'),
-            'timestamp': int(time.time())
+            'timestamp': int(self.clock.time())
         }
         
         # 添加到历史记录
@@ -192,9 +373,27 @@ class HybridAnomalyDetector:
             'ai_weight': self.ai_weight,
             'ai_model_loaded': self.ai_model_loaded,
             'ai_model_version': self.ai_detector.model_version if self.ai_model_loaded else 'unknown',
-            'history_size': len(self.detection_history)
+            'history_size': len(self.detection_history),
+            'ai_deadline': self.ai_deadline,
+            'cascade': dict(self.cascade),
+            'cascade_skip_rate': self._cascade_skip_rate(),
+            'stats': dict(self.stats)
         }
     
+    def _cascade_skip_rate(self) -> float:
+        """级联检测中跳过模型调用的比例"""
+        checked = self.stats['cascade_checked']
+        if not checked:
+            return 0.0
+        return (self.stats['cascade_normal'] + self.stats['cascade_critical']) / checked
+    
+    def close(self):
+        """停止 AI 分支的后台线程（不等待正在执行的推理）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._last_task = None
+    
     def get_prediction_data(self, hours: int = 24) -> Dict:
         """获取预测数据"""
         return self.predictive_analyzer.predict_attack_probability(hours)
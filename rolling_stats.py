@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+流式滚动统计
+每个样本 O(1) 更新的多窗口统计：滑动均值/方差（Welford）、EWMA、全程最小/最大值
+
+规则检测器（流量突增）和模拟器（最近 N 点统计）共用，
+可同时维护多个窗口长度（如 3 点、1 分钟、1 小时），每次更新的开销与窗口长度无关。
+WindowedCounter 按时间分桶统计最近若干秒内的事件数（防御控制器的近期触发统计）。
+"""
+
+from typing import Dict, Any, Sequence
+
+import numpy as np
+
+from telemetry_format import METRIC_FIELDS
+
+
+class RollingWindow:
+    """单个窗口长度的滑动统计（环形缓冲 + Welford 增量均值/方差）"""
+
+    # 每隔 RESYNC_INTERVAL 次替换从环形缓冲重新计算，消除长期运行的浮点累积误差
+    RESYNC_INTERVAL = 4096
+
+    def __init__(self, length: int, n_metrics: int):
+        if length < 1:
+            raise ValueError(f"窗口长度必须 >= 1: {length}")
+        self.length = length
+        self.buffer = np.zeros((length, n_metrics), dtype=np.float64)
+        self.count = 0
+        self.position = 0
+        self.total = np.zeros(n_metrics, dtype=np.float64)
+        self.mean = np.zeros(n_metrics, dtype=np.float64)
+        self.m2 = np.zeros(n_metrics, dtype=np.float64)
+        self._replacements = 0
+
+    def update(self, values: np.ndarray):
+        """加入一个样本，窗口已满时替换最旧的样本"""
+        if self.count < self.length:
+            self.count += 1
+            self.total += values
+            delta = values - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (values - self.mean)
+        else:
+            old = self.buffer[self.position]
+            diff = values - old
+            old_mean = self.mean.copy()
+            self.total += diff
+            self.mean += diff / self.length
+            self.m2 += diff * (values - self.mean + old - old_mean)
+            self._replacements += 1
+
+        self.buffer[self.position] = values
+        self.position = (self.position + 1) % self.length
+
+        if self._replacements >= self.RESYNC_INTERVAL:
+            self.resync()
+
+    def update_block(self, samples: np.ndarray):
+        """按时间顺序加入多个样本（直接写入环形缓冲后重算累计量）"""
+        if len(samples) >= self.length:
+            self.buffer[:] = samples[-self.length:]
+            self.position = 0
+            self.count = self.length
+        else:
+            rows = (self.position + np.arange(len(samples))) % self.length
+            self.buffer[rows] = samples
+            self.position = (self.position + len(samples)) % self.length
+            self.count = min(self.length, self.count + len(samples))
+        self.resync()
+
+    def resync(self):
+        """从环形缓冲精确重算累计量"""
+        window = self.values()
+        self.total = window.sum(axis=0) if len(window) else np.zeros_like(self.total)
+        self.mean = window.mean(axis=0) if len(window) else np.zeros_like(self.mean)
+        self.m2 = ((window - self.mean) ** 2).sum(axis=0) if len(window) else np.zeros_like(self.m2)
+        self._replacements = 0
+
+    def values(self) -> np.ndarray:
+        """窗口内样本，按时间从旧到新排列"""
+        if self.count < self.length:
+            return self.buffer[:self.count]
+        return np.roll(self.buffer, -self.position, axis=0)
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.length
+
+    def variance(self) -> np.ndarray:
+        """窗口内样本方差（总体方差）"""
+        if self.count == 0:
+            return np.zeros_like(self.m2)
+        return np.maximum(self.m2 / self.count, 0.0)
+
+    def minimum(self) -> np.ndarray:
+        """窗口内最小值（查询时在缓冲上计算，不增加每次更新的开销）"""
+        return self.buffer[:self.count].min(axis=0)
+
+    def maximum(self) -> np.ndarray:
+        """窗口内最大值"""
+        return self.buffer[:self.count].max(axis=0)
+
+    def reset(self):
+        """清空窗口"""
+        self.buffer.fill(0.0)
+        self.count = 0
+        self.position = 0
+        self.total.fill(0.0)
+        self.mean.fill(0.0)
+        self.m2.fill(0.0)
+        self._replacements = 0
+
+
+class RollingStats:
+    """多窗口、多指标的流式统计"""
+
+    def __init__(self, windows: Sequence[int] = (20,), ewma_alphas: Sequence[float] = (),
+                 fields: Sequence[str] = METRIC_FIELDS):
+        """
+        Args:
+            windows: 滑动窗口长度（样本数），如 (3, 60, 3600)
+            ewma_alphas: EWMA 平滑系数，如 (0.1, 0.01)
+            fields: 指标名称，顺序即样本向量的列顺序
+        """
+        self.fields = tuple(fields)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        n_metrics = len(self.fields)
+
+        self.windows = {length: RollingWindow(length, n_metrics) for length in windows}
+        self.ewma = {alpha: np.zeros(n_metrics, dtype=np.float64) for alpha in ewma_alphas}
+
+        self.count = 0
+        self.total_min = np.full(n_metrics, np.inf)
+        self.total_max = np.full(n_metrics, -np.inf)
+
+    def update(self, values: np.ndarray):
+        """加入一个样本向量（列顺序见 fields）"""
+        values = np.asarray(values, dtype=np.float64)
+        for window in self.windows.values():
+            window.update(values)
+
+        if self.count == 0:
+            for ewma in self.ewma.values():
+                ewma[:] = values
+        else:
+            for alpha, ewma in self.ewma.items():
+                ewma += alpha * (values - ewma)
+
+        np.minimum(self.total_min, values, out=self.total_min)
+        np.maximum(self.total_max, values, out=self.total_max)
+        self.count += 1
+
+    def update_metrics(self, metrics: Dict[str, Any]):
+        """加入一个指标字典"""
+        self.update(np.fromiter((metrics[name] for name in self.fields),
+                                dtype=np.float64, count=len(self.fields)))
+
+    def update_block(self, samples: np.ndarray):
+        """按时间顺序加入多个样本（向量化，不逐行更新）"""
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, len(self.fields))
+        if len(samples) == 0:
+            return
+        for window in self.windows.values():
+            window.update_block(samples)
+
+        # EWMA 闭式解: e_n = (1-a)^n * e_0 + sum(a * (1-a)^(n-1-i) * x_i)
+        for alpha, ewma in self.ewma.items():
+            if self.count == 0:
+                ewma[:] = samples[0]
+                rest = samples[1:]
+            else:
+                rest = samples
+            if len(rest):
+                decay = (1.0 - alpha) ** np.arange(len(rest) - 1, -1, -1)
+                ewma[:] = (1.0 - alpha) ** len(rest) * ewma + alpha * (decay @ rest)
+
+        np.minimum(self.total_min, samples.min(axis=0), out=self.total_min)
+        np.maximum(self.total_max, samples.max(axis=0), out=self.total_max)
+        self.count += len(samples)
+
+    def window(self, length: int) -> RollingWindow:
+        return self.windows[length]
+
+    def mean(self, length: int, field: str) -> float:
+        """窗口均值（由窗口和计算，整数计数类指标无舍入误差）"""
+        window = self.windows[length]
+        if window.count == 0:
+            return 0.0
+        return float(window.total[self.field_index[field]]) / window.count
+
+    def window_sum(self, length: int, field: str) -> float:
+        """窗口内样本之和"""
+        return float(self.windows[length].total[self.field_index[field]])
+
+    def get_summary(self, length: int) -> Dict[str, Dict[str, float]]:
+        """指定窗口的各指标统计（均值、标准差、最小值、最大值）"""
+        window = self.windows[length]
+        if window.count == 0:
+            return {}
+        mean = window.total / window.count
+        std = np.sqrt(window.variance())
+        minimum, maximum = window.minimum(), window.maximum()
+        return {
+            name: {
+                'mean': float(mean[i]),
+                'std': float(std[i]),
+                'min': float(minimum[i]),
+                'max': float(maximum[i])
+            }
+            for i, name in enumerate(self.fields)
+        }
+
+    def get_ewma(self, alpha: float) -> Dict[str, float]:
+        """指定平滑系数的 EWMA"""
+        return dict(zip(self.fields, self.ewma[alpha].tolist()))
+
+    def reset(self):
+        """清空全部统计"""
+        for window in self.windows.values():
+            window.reset()
+        for ewma in self.ewma.values():
+            ewma.fill(0.0)
+        self.count = 0
+        self.total_min.fill(np.inf)
+        self.total_max.fill(-np.inf)
+
+
+class WindowedCounter:
+    """
+    按时间分桶的滑动事件计数
+    多个窗口共用一个环形桶数组，每个窗口维护累计和；时间前进时只处理滑出窗口的桶，
+    计数和查询均摊 O(1)。窗口边界精度为一个桶宽。
+    """
+
+    def __init__(self, windows: Sequence[float] = (300, 600), bucket_width: float = 10.0):
+        """
+        Args:
+            windows: 窗口长度（秒），必须是 bucket_width 的整数倍
+            bucket_width: 桶宽（秒）
+        """
+        self.bucket_width = bucket_width
+        self.spans = {}
+        for window in windows:
+            span = int(round(window / bucket_width))
+            if span < 1 or abs(span * bucket_width - window) > 1e-9:
+                raise ValueError(f"窗口长度必须是桶宽的正整数倍: {window}")
+            self.spans[window] = span
+        self.n_buckets = max(self.spans.values())
+        self.buckets = [0] * self.n_buckets
+        self.sums = {window: 0 for window in self.spans}
+        self.current = None
+        self.total = 0
+
+    def _advance(self, now: float):
+        index = int(now // self.bucket_width)
+        if self.current is None:
+            self.current = index
+            return
+        if index <= self.current:
+            # 时间回退时计入当前桶
+            return
+        if index - self.current >= self.n_buckets:
+            self.buckets = [0] * self.n_buckets
+            self.sums = {window: 0 for window in self.spans}
+        else:
+            n = self.n_buckets
+            for bucket in range(self.current + 1, index + 1):
+                # 桶 bucket - span 滑出对应窗口（span == n 时即为将被复用的桶）
+                for window, span in self.spans.items():
+                    self.sums[window] -= self.buckets[(bucket - span) % n]
+                self.buckets[bucket % n] = 0
+        self.current = index
+
+    def add(self, now: float, count: int = 1):
+        """在时刻 now 记录 count 个事件"""
+        self._advance(now)
+        self.buckets[self.current % self.n_buckets] += count
+        for window in self.sums:
+            self.sums[window] += count
+        self.total += count
+
+    def count(self, window: float, now: float) -> int:
+        """最近 window 秒内的事件数"""
+        self._advance(now)
+        return self.sums[window]
+
+    def reset(self):
+        self.buckets = [0] * self.n_buckets
+        self.sums = {window: 0 for window in self.spans}
+        self.current = None
+        self.total = 0
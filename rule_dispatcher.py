@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+防御规则异步下发
+检测线程只负责入队，后台线程把安装/删除请求合并成批次发送给 Flow 规则后端，
+跟踪每条规则的确认结果，失败时按指数退避重试
+
+同一规则在下发前的多次请求会被合并：重复安装只发送最新版本，
+尚未安装的规则被删除时两个请求一起取消。
+
+待发送的请求按入队顺序保存在 OrderedDict 中，取批次时从队首逐条弹出，开销只与批次大小有关；
+退避中的重试请求单独保存在按可重试时间排序的堆中，到期后才移入待发送队列，不参与扫描。
+"""
+
+import time
+import heapq
+import itertools
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from flow_table_emulator import FlowRuleBackend, FlowTableEmulator
+
+logger = logging.getLogger(__name__)
+
+INSTALL = 'install'
+REMOVE = 'remove'
+
+
+class RuleDispatcher:
+    """批量规则下发队列"""
+
+    def __init__(self, backend: FlowRuleBackend = None, max_batch: int = 256,
+                 max_delay: float = 0.005, max_retries: int = 3, retry_backoff: float = 0.01,
+                 autostart: bool = True):
+        """
+        Args:
+            backend: Flow 规则后端，默认进程内 FlowTableEmulator
+            max_batch: 单个批次的最大规则数
+            max_delay: 凑批的最长等待时间（秒）
+            max_retries: 单条规则的最大重试次数
+            retry_backoff: 首次重试的退避时间（秒），之后每次翻倍
+            autostart: 是否立即启动后台下发线程
+        """
+        self.backend = backend or FlowTableEmulator()
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # rule_id -> (操作, 规则, 已重试次数, 最早发送时间, 入队时间)，保持入队顺序
+        self._pending: OrderedDict = OrderedDict()
+        # 退避中的重试: rule_id -> (序号, 请求)；堆中为 (最早发送时间, 序号, rule_id)，
+        # 序号与 _retrying 不一致的堆项已被新请求取代
+        self._retrying: Dict[str, tuple] = {}
+        self._retry_heap = []
+        self._retry_seq = itertools.count()
+        # rule_id -> 'pending' / 'installed' / 'failed'
+        self.rule_state: Dict[str, str] = {}
+        self._cond = threading.Condition()
+        self._in_flight = 0
+
+        self.running = False
+        self.thread = None
+
+        self.stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'batches': 0,
+            'installs_acked': 0,
+            'removes_acked': 0,
+            'retries': 0,
+            'failed': 0,
+            'backend_errors': 0,
+            'max_pending': 0,
+            'max_batch_size': 0,
+            'total_ack_latency': 0.0,
+            'max_ack_latency': 0.0
+        }
+
+        if autostart:
+            self.start()
+
+    # ---- 入队（检测线程调用，O(1)） ----
+
+    def submit_install(self, rule: Dict[str, Any]):
+        """请求安装或更新规则（入队时复制规则，之后对原规则的修改需重新提交）"""
+        self._submit(rule['id'], INSTALL, dict(rule))
+
+    def submit_remove(self, rule_id: str):
+        """请求删除规则"""
+        with self._cond:
+            pending = self._pending.get(rule_id)
+            if pending is None and rule_id in self._retrying:
+                pending = self._retrying[rule_id][1]
+            if pending is not None and pending[0] == INSTALL and self.rule_state.get(rule_id) == 'pending':
+                # 规则还未下发过，直接取消
+                self._pending.pop(rule_id, None)
+                self._retrying.pop(rule_id, None)
+                self.rule_state.pop(rule_id, None)
+                self.stats['coalesced'] += 1
+                self.stats['submitted'] += 1
+                self._cond.notify_all()
+                return
+        self._submit(rule_id, REMOVE, None)
+
+    def _submit(self, rule_id: str, op: str, rule: Optional[Dict[str, Any]]):
+        now = time.perf_counter()
+        with self._cond:
+            if rule_id in self._pending:
+                self.stats['coalesced'] += 1
+                del self._pending[rule_id]
+            elif self._retrying.pop(rule_id, None) is not None:
+                self.stats['coalesced'] += 1
+            self._pending[rule_id] = (op, rule, 0, 0.0, now)
+            if op == INSTALL and self.rule_state.get(rule_id) != 'installed':
+                self.rule_state[rule_id] = 'pending'
+            self.stats['submitted'] += 1
+            self.stats['max_pending'] = max(self.stats['max_pending'], len(self._pending) + len(self._retrying))
+            self._cond.notify()
+
+    def _queued(self, rule_id: str) -> bool:
+        """规则是否还有未发送的请求（待发送或退避中）"""
+        return rule_id in self._pending or rule_id in self._retrying
+
+    def _promote_retries(self, now: float = None):
+        """把到期（now 为 None 时全部）的重试请求移入待发送队列"""
+        heap = self._retry_heap
+        while heap and (now is None or heap[0][0] <= now):
+            _, seq, rule_id = heapq.heappop(heap)
+            retry = self._retrying.get(rule_id)
+            if retry is not None and retry[0] == seq:
+                del self._retrying[rule_id]
+                self._pending[rule_id] = retry[1]
+
+    def _next_retry_delay(self) -> Optional[float]:
+        """距最早的重试请求到期的时间，没有重试请求时返回 None"""
+        heap = self._retry_heap
+        while heap:
+            not_before, seq, rule_id = heap[0]
+            retry = self._retrying.get(rule_id)
+            if retry is not None and retry[0] == seq:
+                return max(0.0, not_before - time.perf_counter())
+            # 已被新请求取代的堆项
+            heapq.heappop(heap)
+        return None
+
+    # ---- 下发 ----
+
+    def start(self):
+        """启动后台下发线程"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='rule-dispatcher')
+        self.thread.start()
+
+    def stop(self, drain: bool = True, timeout: float = 5.0):
+        """停止下发线程，drain 为 True 时先发送完队列中的请求"""
+        if drain:
+            self.flush(timeout)
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        self.backend.close()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列中的请求全部得到确认，返回是否在超时前完成"""
+        if not self.running:
+            while self._take_batch(time.perf_counter(), wait=False):
+                pass
+            return not self._pending and not self._retrying
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while self._pending or self._retrying or self._in_flight:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running:
+                    self._promote_retries(time.perf_counter())
+                    if self._pending:
+                        break
+                    # 只有退避中的重试时等到最早的一条到期
+                    self._cond.wait(self._next_retry_delay())
+                if not self.running:
+                    return
+                # 凑批：等待到批次满或最早的请求等待超过 max_delay
+                first_enqueued = next(iter(self._pending.values()))[4]
+                while self.running and len(self._pending) < self.max_batch:
+                    remaining = first_enqueued + self.max_delay - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self._take_batch(time.perf_counter(), wait=True)
+
+    def _take_batch(self, now: float, wait: bool) -> bool:
+        """取出一个批次并下发，返回是否发送了请求（wait 为 False 时不等待重试退避）"""
+        installs, removes = [], []
+        with self._cond:
+            self._promote_retries(now if wait else None)
+            while self._pending and len(installs) + len(removes) < self.max_batch:
+                rule_id, entry = self._pending.popitem(last=False)
+                (installs if entry[0] == INSTALL else removes).append((rule_id, entry))
+            self._in_flight += len(installs) + len(removes)
+        if not installs and not removes:
+            return False
+
+        try:
+            install_acks = self._call(self.backend.install_batch, [e[1] for _, e in installs]) if installs else {}
+            remove_acks = self._call(self.backend.remove_batch, [rule_id for rule_id, _ in removes]) if removes else {}
+            self._handle_acks(installs, install_acks, INSTALL)
+            self._handle_acks(removes, remove_acks, REMOVE)
+            with self._cond:
+                self.stats['batches'] += 1
+                self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(installs) + len(removes))
+        finally:
+            with self._cond:
+                self._in_flight -= len(installs) + len(removes)
+                self._cond.notify_all()
+        return True
+
+    def _call(self, method, payload) -> Dict[str, bool]:
+        try:
+            return method(payload)
+        except Exception as e:
+            with self._cond:
+                self.stats['backend_errors'] += 1
+            logger.error(f"Flow rule backend error: {e}")
+            return {}
+
+    def _handle_acks(self, entries, acks: Dict[str, bool], op: str):
+        now = time.perf_counter()
+        with self._cond:
+            for rule_id, (_, rule, attempts, _, enqueued) in entries:
+                if acks.get(rule_id, False):
+                    latency = now - enqueued
+                    self.stats['total_ack_latency'] += latency
+                    self.stats['max_ack_latency'] = max(self.stats['max_ack_latency'], latency)
+                    if op == INSTALL:
+                        self.stats['installs_acked'] += 1
+                        if not self._queued(rule_id):
+                            self.rule_state[rule_id] = 'installed'
+                    else:
+                        self.stats['removes_acked'] += 1
+                        if not self._queued(rule_id):
+                            self.rule_state.pop(rule_id, None)
+                elif self._queued(rule_id):
+                    # 已有更新的请求，失败的旧请求不再重试
+                    continue
+                elif attempts < self.max_retries:
+                    self.stats['retries'] += 1
+                    not_before = now + self.retry_backoff * (2 ** attempts)
+                    seq = next(self._retry_seq)
+                    self._retrying[rule_id] = (seq, (op, rule, attempts + 1, not_before, enqueued))
+                    heapq.heappush(self._retry_heap, (not_before, seq, rule_id))
+                    self._cond.notify_all()
+                else:
+                    self.stats['failed'] += 1
+                    self.rule_state[rule_id] = 'failed'
+                    logger.warning(f"Rule {op} failed after {attempts} retries: {rule_id}")
+
+    # ---- 查询 ----
+
+    def get_rule_state(self, rule_id: str) -> Optional[str]:
+        """规则的下发状态: pending / installed / failed，已删除或未知时返回 None"""
+        with self._cond:
+            return self.rule_state.get(rule_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = self.stats.copy()
+            stats['pending'] = len(self._pending) + len(self._retrying)
+            stats['in_flight'] = self._in_flight
+        acked = stats['installs_acked'] + stats['removes_acked']
+        stats['avg_ack_latency'] = stats['total_ack_latency'] / acked if acked else 0.0
+        stats['avg_batch_size'] = acked / stats['batches'] if stats['batches'] else 0.0
+        return stats
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+规则引擎
+从配置加载风险评分阈值表，编译为数组查找表，提供单条和批量评估
+
+编译后的 CompiledRuleTable 不可变，热更新时整体替换引用，
+正在进行的评估始终使用同一张表，不会看到半更新状态。
+"""
+
+import os
+import json
+import copy
+import logging
+import operator
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Any, Tuple, Optional
+
+import numpy as np
+
+from telemetry_format import METRIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'configs', 'detection_rules.json')
+
+# 规则条件可引用的特征：9 个原始指标 + 派生的加密流量占比
+RULE_FEATURES = METRIC_FIELDS + ('encryption_ratio',)
+
+_OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq
+}
+
+# 内置默认规则（与 configs/detection_rules.json 一致）
+DEFAULT_RULES = {
+    'version': 1,
+    'risk_threshold': 30.0,
+    'anomaly_threshold': 40.0,
+    'defense_penalty': 60,
+    'max_score': 100.0,
+    'score_ladders': [
+        {'metric': 'dropped_packets', 'thresholds': [2, 5, 10, 20], 'points': [2, 8, 15, 25, 40]},
+        {'metric': 'active_connections', 'thresholds': [50, 100, 200, 500], 'points': [3, 8, 15, 25, 35]},
+        {'metric': 'cpu_usage', 'thresholds': [40, 50, 60, 70], 'points': [2, 6, 12, 20, 30]},
+        {'metric': 'error_count', 'thresholds': [0, 2, 5, 10], 'points': [2, 8, 15, 25, 35]}
+    ],
+    'traffic_surge': {
+        'window': 3,
+        'ratios': [1.2, 1.5, 2.0],
+        'points': [3, 10, 20, 30]
+    },
+    'classification': [
+        {'type': 'ddos_attack', 'match': 'all',
+         'conditions': [['packets_per_sec', '>', 5000], ['active_connections', '>', 500]]},
+        {'type': 'resource_exhaustion', 'match': 'any',
+         'conditions': [['cpu_usage', '>', 80.0], ['memory_usage', '>', 85.0], ['error_count', '>', 20]]},
+        {'type': 'packet_loss', 'match': 'all', 'conditions': [['dropped_packets', '>', 50]]},
+        {'type': 'suspicious_behavior', 'match': 'all', 'conditions': [['encryption_ratio', '>', 0.8]]}
+    ],
+    'risk_bands': {
+        'thresholds': [40, 60, 80, 90],
+        'labels': ['normal', 'low_risk_anomaly', 'medium_risk_anomaly', 'high_risk_anomaly', 'critical_anomaly']
+    },
+    'confidence': {
+        'base': 0.5,
+        'history_length': 5,
+        'history_counts': [1, 3],
+        'history_bonus': [0.0, 0.1, 0.3],
+        'risk_thresholds': [70, 80, 90],
+        'risk_bonus': [0.0, 0.1, 0.2, 0.3],
+        'type_bonus': {
+            'ddos_attack': 0.2,
+            'resource_exhaustion': 0.2,
+            'packet_loss': 0.1,
+            'suspicious_behavior': 0.1
+        }
+    }
+}
+
+
+@dataclass(frozen=True)
+class CompiledRuleTable:
+    """编译后的规则表（不可变）"""
+    version: int
+    risk_threshold: float
+    anomaly_threshold: float
+    defense_penalty: float
+    max_score: float
+    # 分段评分: (列下标, 阈值元组, 得分元组)，x > 阈值[i] 的个数即为得分下标
+    ladders: Tuple[Tuple[int, Tuple[float, ...], Tuple[float, ...]], ...]
+    ladder_arrays: Tuple[Tuple[int, np.ndarray, np.ndarray], ...]
+    surge_window: int
+    surge_ratios: Tuple[float, ...]
+    surge_points: Tuple[float, ...]
+    surge_points_array: np.ndarray
+    # 分类规则: (类型, 是否全部满足, ((特征下标, 比较函数, 阈值), ...))，按顺序匹配
+    patterns: Tuple[Tuple[str, bool, Tuple[Tuple[int, Any, float], ...]], ...]
+    band_thresholds: Tuple[float, ...]
+    band_labels: Tuple[str, ...]
+    band_labels_array: np.ndarray
+    confidence_base: float
+    confidence_history_length: int
+    history_counts: Tuple[int, ...]
+    history_bonus: Tuple[float, ...]
+    risk_thresholds: Tuple[float, ...]
+    risk_bonus: Tuple[float, ...]
+    type_bonus: Dict[str, float]
+    config: Dict[str, Any]
+
+
+def compile_rules(config: Dict[str, Any]) -> CompiledRuleTable:
+    """将规则配置编译为查找表，配置有误时抛出 ValueError"""
+    try:
+        ladders = []
+        for ladder in config['score_ladders']:
+            thresholds = tuple(ladder['thresholds'])
+            points = tuple(ladder['points'])
+            if len(points) != len(thresholds) + 1:
+                raise ValueError(f"{ladder['metric']}: 得分数必须比阈值数多 1")
+            if list(thresholds) != sorted(thresholds):
+                raise ValueError(f"{ladder['metric']}: 阈值必须递增")
+            ladders.append((METRIC_FIELDS.index(ladder['metric']), thresholds, points))
+
+        surge = config['traffic_surge']
+        surge_ratios = tuple(surge['ratios'])
+        surge_points = tuple(surge['points'])
+        if len(surge_points) != len(surge_ratios) + 1 or list(surge_ratios) != sorted(surge_ratios):
+            raise ValueError("traffic_surge: 倍率必须递增且得分数比倍率数多 1")
+        if surge['window'] < 1:
+            raise ValueError("traffic_surge: window 必须 >= 1")
+
+        patterns = []
+        for pattern in config['classification']:
+            if pattern['match'] not in ('all', 'any'):
+                raise ValueError(f"{pattern['type']}: match 必须为 all 或 any")
+            if not pattern['conditions']:
+                raise ValueError(f"{pattern['type']}: conditions 不能为空")
+            conditions = tuple(
+                (RULE_FEATURES.index(name), _OPERATORS[op], value)
+                for name, op, value in pattern['conditions']
+            )
+            patterns.append((pattern['type'], pattern['match'] == 'all', conditions))
+
+        bands = config['risk_bands']
+        if len(bands['labels']) != len(bands['thresholds']) + 1:
+            raise ValueError("risk_bands: 标签数必须比阈值数多 1")
+
+        confidence = config['confidence']
+        if len(confidence['history_bonus']) != len(confidence['history_counts']) + 1:
+            raise ValueError("confidence: history_bonus 数必须比 history_counts 数多 1")
+        if len(confidence['risk_bonus']) != len(confidence['risk_thresholds']) + 1:
+            raise ValueError("confidence: risk_bonus 数必须比 risk_thresholds 数多 1")
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"规则配置无效: {e!r}") from e
+
+    return CompiledRuleTable(
+        version=config.get('version', 1),
+        risk_threshold=float(config['risk_threshold']),
+        anomaly_threshold=float(config['anomaly_threshold']),
+        defense_penalty=config['defense_penalty'],
+        max_score=float(config['max_score']),
+        ladders=tuple(ladders),
+        ladder_arrays=tuple((column, np.asarray(thresholds, dtype=np.float64), np.asarray(points))
+                            for column, thresholds, points in ladders),
+        surge_window=int(surge['window']),
+        surge_ratios=surge_ratios,
+        surge_points=surge_points,
+        surge_points_array=np.asarray(surge_points),
+        patterns=tuple(patterns),
+        band_thresholds=tuple(bands['thresholds']),
+        band_labels=tuple(bands['labels']),
+        band_labels_array=np.asarray(bands['labels']),
+        confidence_base=confidence['base'],
+        confidence_history_length=int(confidence['history_length']),
+        history_counts=tuple(confidence['history_counts']),
+        history_bonus=tuple(confidence['history_bonus']),
+        risk_thresholds=tuple(confidence['risk_thresholds']),
+        risk_bonus=tuple(confidence['risk_bonus']),
+        type_bonus=dict(confidence['type_bonus']),
+        config=copy.deepcopy(config)
+    )
+
+
+class RuleEngine:
+    """规则引擎：持有当前编译表，支持原子热更新"""
+
+    def __init__(self, config_path: str = None, config: Dict[str, Any] = None):
+        """
+        Args:
+            config_path: 规则配置文件，默认 configs/detection_rules.json，不存在时使用内置默认规则
+            config: 直接传入规则配置（优先于 config_path）
+        """
+        self._swap_lock = threading.Lock()
+        self.config_path = config_path or DEFAULT_RULES_PATH
+
+        if config is None:
+            config = self._read_config(self.config_path)
+        self._table = compile_rules(config)
+
+        logger.info(f"Rule engine loaded rules version {self._table.version}")
+
+    @property
+    def table(self) -> CompiledRuleTable:
+        """当前规则表（评估开始时取一次引用，保证同一次评估使用同一张表）"""
+        return self._table
+
+    @staticmethod
+    def _read_config(config_path: str) -> Dict[str, Any]:
+        """读取规则配置，缺失字段使用内置默认值"""
+        config = copy.deepcopy(DEFAULT_RULES)
+        if config_path and os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                config.update(json.load(f))
+        else:
+            logger.warning(f"Rule config not found: {config_path}, using built-in rules")
+        return config
+
+    def swap(self, config: Dict[str, Any]) -> CompiledRuleTable:
+        """编译新规则并原子替换当前规则表，编译失败时保留旧表并抛出 ValueError"""
+        with self._swap_lock:
+            table = self._table = compile_rules(config)
+        logger.info(f"Rule table swapped to version {table.version}")
+        return table
+
+    def reload(self, config_path: str = None) -> CompiledRuleTable:
+        """从文件重新加载规则"""
+        if config_path:
+            self.config_path = config_path
+        return self.swap(self._read_config(self.config_path))
+
+    def update(self, **overrides) -> CompiledRuleTable:
+        """基于当前规则覆盖部分顶层字段（如阈值）后替换（读取、合并和编译在同一次加锁内完成，并发更新不会丢失）"""
+        with self._swap_lock:
+            config = copy.deepcopy(self._table.config)
+            config.update(overrides)
+            table = self._table = compile_rules(config)
+        logger.info(f"Rule table swapped to version {table.version}")
+        return table
+
+    # ---- 单条评估 ----
+
+    @staticmethod
+    def feature_values(metrics: Dict[str, Any]) -> list:
+        """按 RULE_FEATURES 顺序提取特征值"""
+        values = [metrics[name] for name in METRIC_FIELDS]
+        total_crypto = values[4] + values[5]
+        values.append(values[4] / total_crypto if total_crypto > 0 else 0.0)
+        return values
+
+    @staticmethod
+    def static_score(values, table: CompiledRuleTable) -> float:
+        """与历史无关的风险分量之和（丢包、连接数、CPU、错误等分段评分）"""
+        score = 0.0
+        for column, thresholds, points in table.ladders:
+            score += points[bisect_left(thresholds, values[column])]
+        return score
+
+    @staticmethod
+    def surge_score(current: float, recent_avg: Optional[float], table: CompiledRuleTable) -> float:
+        """流量突增风险分量，recent_avg 为 None 表示历史不足"""
+        if recent_avg is None:
+            return table.surge_points[0]
+        level = 0
+        for ratio in table.surge_ratios:
+            if current > recent_avg * ratio:
+                level += 1
+        return table.surge_points[level]
+
+    @staticmethod
+    def classify(values, risk_score: float, table: CompiledRuleTable) -> str:
+        """分类异常类型（按配置顺序匹配，未命中时按风险分段）"""
+        if risk_score <= table.anomaly_threshold:
+            return 'normal'
+        for anomaly_type, match_all, conditions in table.patterns:
+            if match_all:
+                matched = all(op(values[column], value) for column, op, value in conditions)
+            else:
+                matched = any(op(values[column], value) for column, op, value in conditions)
+            if matched:
+                return anomaly_type
+        return table.band_labels[bisect_left(table.band_thresholds, risk_score)]
+
+    @staticmethod
+    def confidence(risk_score: float, anomaly_type: str, recent_anomalies: Optional[int],
+                   table: CompiledRuleTable) -> float:
+        """计算置信度，recent_anomalies 为 None 表示历史不足"""
+        confidence = table.confidence_base
+        if recent_anomalies is not None:
+            confidence += table.history_bonus[bisect_right(table.history_counts, recent_anomalies)]
+        confidence += table.risk_bonus[bisect_left(table.risk_thresholds, risk_score)]
+        confidence += table.type_bonus.get(anomaly_type, 0.0)
+        return min(1.0, confidence)
+
+    # ---- 批量评估 ----
+
+    @staticmethod
+    def batch_features(samples: np.ndarray) -> np.ndarray:
+        """(N, 9) 指标矩阵扩展为 (N, 10) 特征矩阵（追加加密流量占比）"""
+        features = np.empty((len(samples), len(RULE_FEATURES)), dtype=np.float64)
+        features[:, :len(METRIC_FIELDS)] = samples
+        total_crypto = samples[:, 4] + samples[:, 5]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features[:, -1] = np.where(total_crypto > 0, samples[:, 4] / total_crypto, 0.0)
+        return features
+
+    @staticmethod
+    def batch_static_scores(samples: np.ndarray, table: CompiledRuleTable) -> np.ndarray:
+        """批量计算分段评分之和"""
+        scores = np.zeros(len(samples), dtype=np.float64)
+        for column, thresholds, points in table.ladder_arrays:
+            scores += points[np.digitize(samples[:, column], thresholds, right=True)]
+        return scores
+
+    @staticmethod
+    def batch_surge_scores(current: np.ndarray, recent_avg: np.ndarray, table: CompiledRuleTable) -> np.ndarray:
+        """批量计算流量突增风险分量"""
+        level = np.zeros(len(current), dtype=np.intp)
+        for ratio in table.surge_ratios:
+            level += current > recent_avg * ratio
+        return table.surge_points_array[level]
+
+    @staticmethod
+    def batch_classify(features: np.ndarray, risk_score: np.ndarray, table: CompiledRuleTable) -> np.ndarray:
+        """批量分类异常类型（匹配顺序与 classify 一致）"""
+        conditions = [risk_score <= table.anomaly_threshold]
+        choices = ['normal']
+        for anomaly_type, match_all, pattern_conditions in table.patterns:
+            combine = np.logical_and if match_all else np.logical_or
+            matched = None
+            for column, op, value in pattern_conditions:
+                result = op(features[:, column], value)
+                matched = result if matched is None else combine(matched, result)
+            conditions.append(matched)
+            choices.append(anomaly_type)
+        bands = table.band_labels_array[np.digitize(risk_score, table.band_thresholds, right=True)]
+        return np.select(conditions, choices, bands)
+
+    @staticmethod
+    def batch_confidence(risk_score: np.ndarray, anomaly_type: np.ndarray, recent_anomalies: Optional[np.ndarray],
+                         has_history: Optional[np.ndarray], table: CompiledRuleTable) -> np.ndarray:
+        """批量计算置信度（加法顺序与 confidence 一致）"""
+        confidence = np.full(len(risk_score), table.confidence_base)
+        if recent_anomalies is not None:
+            bonus = np.asarray(table.history_bonus)[np.searchsorted(table.history_counts, recent_anomalies, side='right')]
+            confidence += np.where(has_history, bonus, 0.0)
+        confidence += np.asarray(table.risk_bonus)[np.digitize(risk_score, table.risk_thresholds, right=True)]
+        type_bonus = np.zeros(len(risk_score))
+        for anomaly, bonus in table.type_bonus.items():
+            type_bonus[anomaly_type == anomaly] = bonus
+        confidence += type_bonus
+        return np.minimum(1.0, confidence)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+防御规则存储
+按 ID 的字典索引 + 按过期时间的最小堆 + 按动作/优先级的二级索引
+
+    get/update/remove    O(1)
+    add                  O(log n)
+    expire               O(k log n)，k 为本次过期的规则数
+    按动作/优先级统计    O(动作种类数)
+
+堆采用惰性删除：规则被删除或过期时间被修改后，旧的堆条目在弹出时跳过。
+"""
+
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, Optional
+
+
+def id_sequence(rule_id: Any) -> int:
+    """规则 ID 中的序号（rule_<时间>_<序号>），无法解析时为 0"""
+    suffix = str(rule_id).rsplit('_', 1)[-1]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+class RuleStore:
+    """防御规则存储"""
+
+    def __init__(self, max_rules: int = 50000):
+        """
+        Args:
+            max_rules: 最大规则数，超出时淘汰最早加入的规则
+        """
+        self.max_rules = max_rules
+        self._sequence = itertools.count(1)
+
+        # 保持插入顺序，首个元素即最早加入的规则
+        # （OrderedDict 从头部弹出为 O(1)，普通 dict 在头部大量删除后 next(iter()) 会退化）
+        self.rules: Dict[str, Dict[str, Any]] = OrderedDict()
+        self._expiry_heap: List[tuple] = []
+        self.by_action: Dict[str, Dict[str, None]] = {}
+        self.by_priority: Dict[str, Dict[str, None]] = {}
+
+        self.stats = {
+            'added': 0,
+            'expired': 0,
+            'evicted': 0,
+            'removed': 0
+        }
+
+    def next_id(self, created_time: float) -> str:
+        """生成单调递增、全局唯一的规则 ID"""
+        return f"rule_{int(created_time)}_{next(self._sequence)}"
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __contains__(self, rule_id: str) -> bool:
+        return rule_id in self.rules
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.rules.values())
+
+    def _index(self, rule: Dict[str, Any]):
+        self.by_action.setdefault(rule['action'], {})[rule['id']] = None
+        self.by_priority.setdefault(rule['priority'], {})[rule['id']] = None
+
+    def _unindex(self, rule: Dict[str, Any]):
+        for index, key in ((self.by_action, rule['action']), (self.by_priority, rule['priority'])):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(rule['id'], None)
+                if not bucket:
+                    del index[key]
+
+    def _push_expiry(self, rule: Dict[str, Any]):
+        heapq.heappush(self._expiry_heap, (rule['expires_time'], next(self._sequence), rule['id']))
+        # 惰性删除累积的失效条目过多时重建堆
+        if len(self._expiry_heap) > 2 * len(self.rules) + 64:
+            self._expiry_heap = [(r['expires_time'], next(self._sequence), r['id']) for r in self.rules.values()]
+            heapq.heapify(self._expiry_heap)
+
+    def add(self, rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        加入规则（缺少 id 时自动分配）
+        Returns:
+            因容量限制被淘汰的规则，没有淘汰时返回 None
+        """
+        if 'id' not in rule:
+            rule['id'] = self.next_id(rule.get('created_time', 0))
+        if rule['id'] in self.rules:
+            self._pop(rule['id'])
+
+        self.rules[rule['id']] = rule
+        self._index(rule)
+        self._push_expiry(rule)
+        self.stats['added'] += 1
+
+        if len(self.rules) > self.max_rules:
+            self.stats['evicted'] += 1
+            rule_id, evicted = self.rules.popitem(last=False)
+            self._unindex(evicted)
+            return evicted
+        return None
+
+    def restore(self, rules: List[Dict[str, Any]], last_sequence: int = 0) -> List[Dict[str, Any]]:
+        """
+        加入从持久化恢复的规则，并把 ID 序号推进到已用序号之后，避免新规则 ID 冲突
+        Args:
+            rules: 恢复的有效规则
+            last_sequence: 持久化记录的已用最大序号（包括重启前已过期或删除的规则），
+                           只按有效规则推进会重新发出这些规则的 ID
+        Returns:
+            因容量限制被淘汰的规则
+        """
+        evicted = []
+        for rule in rules:
+            last_sequence = max(last_sequence, id_sequence(rule['id']))
+            removed = self.add(rule)
+            if removed is not None:
+                evicted.append(removed)
+        if last_sequence:
+            self._sequence = itertools.count(max(last_sequence + 1, next(self._sequence)))
+        return evicted
+
+    def get(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        return self.rules.get(rule_id)
+
+    def update(self, rule_id: str, updates: Dict[str, Any]) -> bool:
+        """更新规则字段，涉及索引的字段（动作、优先级、过期时间）同步更新索引"""
+        rule = self.rules.get(rule_id)
+        if rule is None:
+            return False
+        if 'id' in updates and updates['id'] != rule_id:
+            raise ValueError("不能修改规则 ID")
+
+        reindex = ('action' in updates and updates['action'] != rule['action']) or \
+                  ('priority' in updates and updates['priority'] != rule['priority'])
+        if reindex:
+            self._unindex(rule)
+        expires_changed = 'expires_time' in updates and updates['expires_time'] != rule['expires_time']
+
+        rule.update(updates)
+
+        if reindex:
+            self._index(rule)
+        if expires_changed:
+            self._push_expiry(rule)
+        return True
+
+    def _pop(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        rule = self.rules.pop(rule_id, None)
+        if rule is not None:
+            self._unindex(rule)
+        return rule
+
+    def remove(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        """删除规则（堆中的条目惰性删除）"""
+        rule = self._pop(rule_id)
+        if rule is not None:
+            self.stats['removed'] += 1
+        return rule
+
+    def expire(self, current_time: float) -> List[Dict[str, Any]]:
+        """删除并返回所有 expires_time <= current_time 的规则"""
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= current_time:
+            expires_time, _, rule_id = heapq.heappop(heap)
+            rule = self.rules.get(rule_id)
+            # 跳过已删除或过期时间已被修改的失效条目
+            if rule is None or rule['expires_time'] != expires_time:
+                continue
+            self._pop(rule_id)
+            expired.append(rule)
+        self.stats['expired'] += len(expired)
+        return expired
+
+    def next_expiry(self) -> Optional[float]:
+        """最近一条规则的过期时间"""
+        heap = self._expiry_heap
+        while heap:
+            expires_time, _, rule_id = heap[0]
+            rule = self.rules.get(rule_id)
+            if rule is not None and rule['expires_time'] == expires_time:
+                return expires_time
+            heapq.heappop(heap)
+        return None
+
+    def rules_by_action(self, action: str) -> List[Dict[str, Any]]:
+        return [self.rules[rule_id] for rule_id in self.by_action.get(action, ())]
+
+    def rules_by_priority(self, priority: str) -> List[Dict[str, Any]]:
+        return [self.rules[rule_id] for rule_id in self.by_priority.get(priority, ())]
+
+    def count_by_action(self) -> Dict[str, int]:
+        return {action: len(ids) for action, ids in self.by_action.items()}
+
+    def count_by_priority(self) -> Dict[str, int]:
+        return {priority: len(ids) for priority, ids in self.by_priority.items()}
+
+    def clear(self):
+        """清空所有规则（ID 序号不重置，保证 ID 不重复）"""
+        self.rules.clear()
+        self._expiry_heap.clear()
+        self.by_action.clear()
+        self.by_priority.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'rules': len(self.rules),
+            'heap_entries': len(self._expiry_heap),
+            'max_rules': self.max_rules
+        }
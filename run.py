@@ -47,7 +47,8 @@ def start_system():
     
     try:
         # 启动Flask应用
-        from app import app
+        from app import app, open_defense_journal
+        open_defense_journal()
         print("🌐 系统已启动，访问地址: http://localhost:5002")
         print("📊 实时仪表板已就绪")
         print("\n控制说明:")
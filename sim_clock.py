@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+模拟时钟
+为模拟器、检测器和防御控制器提供可注入的时间源
+
+各组件的 clock 参数只要求具备 time() 和 sleep(seconds) 两个方法，
+默认直接使用标准库 time 模块（真实时间）。传入 VirtualClock 后，
+sleep 只推进虚拟时间而不阻塞，整个 模拟 → 检测 → 防御 循环
+即可以 CPU 允许的最快速度运行，用于浸泡测试和回归基准。
+"""
+
+import threading
+import time
+
+
+class VirtualClock:
+    """虚拟时钟：时间只在 sleep/advance 时前进"""
+
+    def __init__(self, start: float = None):
+        self._now = time.time() if start is None else float(start)
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        """获取当前虚拟时间"""
+        return self._now
+
+    def sleep(self, seconds: float):
+        """推进虚拟时间，不阻塞调用线程"""
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> float:
+        """推进虚拟时间并返回推进后的时间"""
+        if seconds < 0:
+            raise ValueError("虚拟时间不能倒退")
+        with self._lock:
+            self._now += seconds
+            return self._now
+
+    def set_time(self, timestamp: float):
+        """直接设置虚拟时间（仅允许向前）"""
+        with self._lock:
+            if timestamp < self._now:
+                raise ValueError("虚拟时间不能倒退")
+            self._now = float(timestamp)
+
+
+# 测试代码
+if __name__ == "__main__":
+    clock = VirtualClock(start=0)
+    start = time.perf_counter()
+    for _ in range(86400):
+        clock.sleep(1)
+    print(f"模拟 {clock.time():.0f} 秒耗时 {time.perf_counter() - start:.3f} 秒")
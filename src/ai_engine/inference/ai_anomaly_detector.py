@@ -19,6 +19,8 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from ai_engine.models.simple_lstm import AnomalyPredictor, ModelConfig
 from ai_engine.training.data_processor import DataProcessor, NetworkMetrics, RealTimeDataProcessor
+from ai_engine.training.feature_schema import FEATURE_SCHEMA
+from ai_engine.inference.streaming_inference import StreamingLSTMInference
 
 logger = logging.getLogger(__name__)
 
@@ -37,28 +39,56 @@ class AIAnomalyResult:
 class AIAnomalyDetector:
     """AI异常检测器"""
     
-    def __init__(self, model_path: str = None, config_path: str = None):
+    def __init__(self, model_path: str = None, config_path: str = None, clock=None,
+                 inference_server=None):
+        """
+        Args:
+            model_path: LSTM 模型文件
+            config_path: 配置文件
+            clock: 时间源，需提供 time()（默认真实时间）
+            inference_server: 共享的批量推理服务（BatchInferenceServer），多个设备的检测器共用时
+                              推理请求合批执行；为 None 时由本检测器的预测器逐条推理
+        """
         self.model_path = model_path
+        self.clock = clock or time
         self.config = self._load_config(config_path)
         
         # 初始化模型配置
         model_config = ModelConfig(
-            input_size=9,
+            input_size=FEATURE_SCHEMA.size,
             hidden_size=self.config.get('hidden_size', 64),
             num_layers=self.config.get('num_layers', 2),
             sequence_length=self.config.get('sequence_length', 10),
             dropout=self.config.get('dropout', 0.2)
         )
         
-        # 初始化AI预测器
-        self.predictor = AnomalyPredictor(model_path=model_path)
+        # 初始化AI预测器（使用批量推理服务时由服务持有模型）
+        self.inference_server = inference_server
+        self.predictor = inference_server.predictor if inference_server is not None else \
+            AnomalyPredictor(model_path=model_path, backend=self.config.get('backend', 'auto'))
         
         # 初始化数据处理器
         self.data_processor = RealTimeDataProcessor(
             sequence_length=model_config.sequence_length,
-            update_interval=self.config.get('update_interval', 1.0)
+            update_interval=self.config.get('update_interval', 1.0),
+            clock=self.clock
         )
         
+        # 流式推理：保存 LSTM 隐藏状态，每个样本只推进一步（配置 "streaming" 段）
+        streaming = self.config.get('streaming', {})
+        self.streaming = None
+        if streaming.get('enabled'):
+            self.streaming = StreamingLSTMInference(
+                self.predictor,
+                sequence_length=model_config.sequence_length,
+                resync_interval=streaming.get('resync_interval', 100),
+                verify_interval=streaming.get('verify_interval', 20),
+                tolerance=streaming.get('tolerance', 0.05)
+            )
+        
+        # 预分配的特征行，未由调用方传入特征时每个样本写入这一行
+        self._feature_row = FEATURE_SCHEMA.new_row()
+        
         # 预测缓存
         self.prediction_history = deque(maxlen=100)
         
@@ -86,6 +116,13 @@ class AIAnomalyDetector:
             'confidence_threshold': 0.6,
             'update_interval': 1.0,
             'prediction_window': 10,
+            'backend': 'auto',
+            'streaming': {
+                'enabled': False,
+                'resync_interval': 100,
+                'verify_interval': 20,
+                'tolerance': 0.05
+            },
             'anomaly_types': {
                 'ddos_attack': {'threshold': 0.8, 'weight': 1.0},
                 'resource_exhaustion': {'threshold': 0.7, 'weight': 0.8},
@@ -104,29 +141,48 @@ class AIAnomalyDetector:
         
         return default_config
     
-    def detect_anomaly(self, metrics: Dict, defense_controller=None) -> AIAnomalyResult:
+    def detect_anomaly(self, metrics: Dict, defense_controller=None,
+                       features: np.ndarray = None) -> AIAnomalyResult:
         """
         检测异常
         Args:
             metrics: 网络指标字典
             defense_controller: 防御控制器（可选）
+            features: 已按 FEATURE_SCHEMA 提取的特征行（由检测流水线传入时不再重复提取）
         Returns:
             AI异常检测结果
         """
         with self.lock:
-            # 转换为NetworkMetrics对象
-            network_metrics = self._dict_to_metrics(metrics)
+            # 特征只提取一次，写入预分配的行
+            if features is None:
+                features = FEATURE_SCHEMA.extract(metrics, out=self._feature_row)
             
             # 添加数据到处理器
-            sequence = self.data_processor.add_metrics_realtime(network_metrics)
+            timestamp = metrics.get('timestamp', int(self.clock.time()))
+            sequence = prediction_score = None
+            if self.streaming is not None:
+                # 流式推理：每个样本推进一步，窗口未填满时返回 None
+                self.data_processor.add_features(features, timestamp)
+                if self.model_loaded:
+                    prediction_score = self.streaming.update('local', features)
+                ready = prediction_score is not None
+            else:
+                sequence = self.data_processor.add_features_realtime(features, timestamp)
+                ready = self.model_loaded and sequence is not None
             
             # 如果模型未加载或数据不足，返回基础检测结果
-            if not self.model_loaded or sequence is None:
-                return self._fallback_detection(metrics)
-            
-            # AI预测
-            prediction_score = self.predictor.predict_anomaly(sequence)
-            
+            if not ready:
+                return self._fallback_detection(metrics, features)
+            feature_dict = FEATURE_SCHEMA.as_dict(features)
+        
+        # AI预测（不持有锁：使用批量推理服务时等待期间其他调用方可以继续入队）
+        if prediction_score is None:
+            if self.inference_server is not None:
+                prediction_score = self.inference_server.submit(sequence).result()
+            else:
+                prediction_score = self.predictor.predict_anomaly(sequence)
+        
+        with self.lock:
             # 计算风险评分
             risk_score = self._calculate_risk_score(prediction_score, metrics)
             
@@ -146,8 +202,8 @@ class AIAnomalyDetector:
                 confidence=confidence,
                 anomaly_type=anomaly_type,
                 prediction_score=prediction_score,
-                features=self._extract_features(metrics),
-                timestamp=int(time.time()),
+                features=feature_dict,
+                timestamp=int(self.clock.time()),
                 model_version=self.model_version
             )
             
@@ -161,22 +217,7 @@ class AIAnomalyDetector:
             
             return result
     
-    def _dict_to_metrics(self, metrics_dict: Dict) -> NetworkMetrics:
-        """将字典转换为NetworkMetrics对象"""
-        return NetworkMetrics(
-            timestamp=metrics_dict.get('timestamp', int(time.time())),
-            packets_per_sec=metrics_dict.get('packets_per_sec', 0),
-            bytes_per_sec=metrics_dict.get('bytes_per_sec', 0),
-            active_connections=metrics_dict.get('active_connections', 0),
-            dropped_packets=metrics_dict.get('dropped_packets', 0),
-            encryption_hits=metrics_dict.get('encryption_hits', 0),
-            decryption_hits=metrics_dict.get('decryption_hits', 0),
-            cpu_usage=metrics_dict.get('cpu_usage', 0.0),
-            memory_usage=metrics_dict.get('memory_usage', 0.0),
-            error_count=metrics_dict.get('error_count', 0)
-        )
-    
-    def _fallback_detection(self, metrics: Dict) -> AIAnomalyResult:
+    def _fallback_detection(self, metrics: Dict, features: np.ndarray) -> AIAnomalyResult:
         """基础检测（当AI模型不可用时）"""
         # 简单的基于阈值的检测
         risk_score = 0
@@ -200,8 +241,8 @@ class AIAnomalyDetector:
             confidence=0.5,  # 基础检测置信度较低
             anomaly_type='unknown',
             prediction_score=risk_score / 100,
-            features=self._extract_features(metrics),
-            timestamp=int(time.time()),
+            features=FEATURE_SCHEMA.as_dict(features),
+            timestamp=int(self.clock.time()),
             model_version='fallback'
         )
     
@@ -262,20 +303,6 @@ class AIAnomalyDetector:
         else:
             return 'unknown'
     
-    def _extract_features(self, metrics: Dict) -> Dict[str, float]:
-        """提取特征"""
-        return {
-            'packets_per_sec': float(metrics.get('packets_per_sec', 0)),
-            'bytes_per_sec': float(metrics.get('bytes_per_sec', 0)),
-            'active_connections': float(metrics.get('active_connections', 0)),
-            'dropped_packets': float(metrics.get('dropped_packets', 0)),
-            'encryption_hits': float(metrics.get('encryption_hits', 0)),
-            'decryption_hits': float(metrics.get('decryption_hits', 0)),
-            'cpu_usage': float(metrics.get('cpu_usage', 0)),
-            'memory_usage': float(metrics.get('memory_usage', 0)),
-            'error_count': float(metrics.get('error_count', 0))
-        }
-    
     def train_model(self, training_data_path: str = None):
         """训练模型"""
         try:
@@ -308,6 +335,16 @@ class AIAnomalyDetector:
             logger.error(f"Model training failed: {e}")
             return False
     
+    def observe(self, metrics: Dict, features: np.ndarray = None):
+        """只记录样本、不做推理（跳过 AI 推理的样本仍记入序列，保持连续）"""
+        with self.lock:
+            if features is None:
+                features = FEATURE_SCHEMA.extract(metrics, out=self._feature_row)
+            timestamp = metrics.get('timestamp', int(self.clock.time()))
+            self.data_processor.add_features(features, timestamp)
+            if self.streaming is not None:
+                self.streaming.observe('local', features)
+    
     def get_prediction_history(self, window_size: int = 50) -> List[Dict]:
         """获取预测历史"""
         return list(self.prediction_history)[-window_size:]
@@ -320,6 +357,7 @@ class AIAnomalyDetector:
             'model_path': self.model_path,
             'data_samples': self.data_processor.get_stats(),
             'prediction_history_size': len(self.prediction_history),
+            'streaming': self.streaming.get_stats() if self.streaming is not None else None,
             'config': self.config
         }
     
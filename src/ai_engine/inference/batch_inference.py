@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+批量推理服务
+多个设备的检测器把待推理序列提交到同一个队列，后台线程凑批后对 SimpleLSTM 做一次批量前向计算，
+通过 Future 把各自的异常概率返回给调用方
+
+凑批策略与 RuleDispatcher 相同：批次满 max_batch_size 或最早的请求等待超过 max_wait 即执行。
+同一批次中序列形状不同（序列长度不同）时按形状分组，每组一次前向计算。
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from ..models.simple_lstm import AnomalyPredictor
+
+logger = logging.getLogger(__name__)
+
+
+class BatchInferenceServer:
+    """AnomalyPredictor 的微批量推理服务"""
+
+    def __init__(self, predictor: AnomalyPredictor = None, model_path: str = None,
+                 max_batch_size: int = 64, max_wait: float = 0.002, autostart: bool = True,
+                 backend: str = 'auto'):
+        """
+        Args:
+            predictor: 异常预测器，为 None 时从 model_path 加载
+            model_path: LSTM 模型文件
+            max_batch_size: 单次前向计算的最大序列数
+            max_wait: 凑批的最长等待时间（秒）
+            autostart: 是否立即启动后台推理线程；不启动时由 flush() 在调用线程中同步执行
+            backend: 从 model_path 加载时使用的推理后端（见 AnomalyPredictor）
+        """
+        self.predictor = predictor or AnomalyPredictor(model_path=model_path, backend=backend)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        # (序列, Future, 入队时间)，按入队顺序
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+
+        self.running = False
+        self.thread = None
+
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'batches': 0,
+            'forward_passes': 0,
+            'max_batch_size': 0,
+            'max_pending': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+            'total_forward_time': 0.0
+        }
+
+        if autostart:
+            self.start()
+
+    # ---- 提交（检测线程调用） ----
+
+    def submit(self, sequence: np.ndarray) -> Future:
+        """
+        提交一个序列
+        Args:
+            sequence: (sequence_length, 特征数) 序列（调用方之后不应再修改）
+        Returns:
+            Future，结果为异常概率（float）
+        """
+        future = Future()
+        with self._cond:
+            self._pending.append((sequence, future, time.perf_counter()))
+            self.stats['submitted'] += 1
+            self.stats['max_pending'] = max(self.stats['max_pending'], len(self._pending))
+            self._cond.notify()
+        return future
+
+    def predict(self, sequence: np.ndarray, timeout: float = None) -> float:
+        """提交并等待结果（未启动后台线程时在当前线程执行）"""
+        future = self.submit(sequence)
+        if not self.running:
+            self.flush()
+        return future.result(timeout)
+
+    # ---- 推理 ----
+
+    def start(self):
+        """启动后台推理线程"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='batch-inference')
+        self.thread.start()
+
+    def stop(self, drain: bool = True, timeout: float = 5.0):
+        """停止推理线程，drain 为 True 时先完成队列中的请求，否则取消它们"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        if drain:
+            self.flush()
+        else:
+            with self._cond:
+                pending, self._pending = list(self._pending), deque()
+            for _, future, _ in pending:
+                future.cancel()
+
+    def flush(self):
+        """在调用线程中执行队列中的全部请求（后台线程未启动时使用）"""
+        while self._run_batch():
+            pass
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running and not self._pending:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                # 凑批：等待到批次满或最早的请求等待超过 max_wait
+                first_enqueued = self._pending[0][2]
+                while self.running and len(self._pending) < self.max_batch_size:
+                    remaining = first_enqueued + self.max_wait - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self._run_batch()
+
+    def _take_batch(self) -> List[Tuple[np.ndarray, Future, float]]:
+        batch = []
+        with self._cond:
+            while self._pending and len(batch) < self.max_batch_size:
+                entry = self._pending.popleft()
+                # 调用方已取消的请求不再计算
+                if entry[1].set_running_or_notify_cancel():
+                    batch.append(entry)
+        return batch
+
+    def _run_batch(self) -> bool:
+        """取出一个批次并执行，返回是否取到了请求"""
+        batch = self._take_batch()
+        if not batch:
+            return False
+
+        # 按序列形状分组，每组一次前向计算
+        groups: Dict[tuple, List[int]] = {}
+        for i, (sequence, _, _) in enumerate(batch):
+            groups.setdefault(np.shape(sequence), []).append(i)
+
+        failed = 0
+        start = time.perf_counter()
+        for indices in groups.values():
+            try:
+                scores = self.predictor.predict_batch(np.stack([batch[i][0] for i in indices]))
+            except Exception as e:
+                logger.error(f"Batch inference failed: {e}")
+                for i in indices:
+                    batch[i][1].set_exception(e)
+                failed += len(indices)
+                continue
+            for i, score in zip(indices, scores.tolist()):
+                batch[i][1].set_result(score)
+
+        now = time.perf_counter()
+        with self._cond:
+            self.stats['batches'] += 1
+            self.stats['forward_passes'] += len(groups)
+            self.stats['completed'] += len(batch) - failed
+            self.stats['failed'] += failed
+            self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+            self.stats['total_forward_time'] += now - start
+            for _, _, enqueued in batch:
+                latency = now - enqueued
+                self.stats['total_latency'] += latency
+                self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+        return True
+
+    # ---- 查询 ----
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = self.stats.copy()
+            stats['pending'] = len(self._pending)
+        completed = stats['completed']
+        stats['avg_latency'] = stats['total_latency'] / completed if completed else 0.0
+        stats['avg_batch_size'] = completed / stats['batches'] if stats['batches'] else 0.0
+        stats['forward_time_per_sample'] = stats['total_forward_time'] / completed if completed else 0.0
+        return stats
@@ -7,36 +7,37 @@ import json
 
 from ..models.simple_lstm import AnomalyPredictor
 from ..training.data_processor import DataProcessor
+from ..training.feature_schema import FEATURE_SCHEMA
 
 logger = logging.getLogger(__name__)
 
 class PredictiveAnalyzer:
     """预测性分析器"""
     
-    def __init__(self, model_path: str = None):
-        self.predictor = AnomalyPredictor(model_path=model_path)
+    def __init__(self, model_path: str = None, clock=None, backend: str = 'auto'):
+        # 时间源，需提供 time()（默认真实时间）
+        self.clock = clock or time
+        self.predictor = AnomalyPredictor(model_path=model_path, backend=backend)
         self.data_processor = DataProcessor()
         self.historical_data = []
         self.prediction_cache = {}
         self.cache_duration = 300  # 5分钟缓存
         
-    def add_metrics(self, metrics: Dict):
-        """添加新的指标数据"""
-        # 转换为numpy数组，处理来自遥测模拟器的实际数据
-        metrics_array = np.array([
-            float(metrics.get('cpu_usage', 0)),
-            float(metrics.get('memory_usage', 0)),
-            float(metrics.get('bytes_per_sec', 0)) / 1000000.0,  # 网络吞吐量，转换为MB/s
-            float(metrics.get('dropped_packets', 0)),  # 丢包率
-            float(metrics.get('error_count', 0)),  # 延迟/错误
-            float(metrics.get('active_connections', 0)),  # 连接数
-            float(metrics.get('error_count', 0)) / max(1, float(metrics.get('packets_per_sec', 1))),  # 错误率
-            float(metrics.get('bytes_per_sec', 0)) / 1000000.0,  # 带宽利用率
-            float(metrics.get('active_connections', 0))  # 活跃连接数
-        ])
+    def add_metrics(self, metrics: Dict, features: np.ndarray = None):
+        """
+        添加新的指标数据
+        Args:
+            metrics: 网络指标
+            features: 已按 FEATURE_SCHEMA 提取的特征行（由检测流水线传入时不再重复提取）
+        """
+        # 与模型训练使用同一特征模式，预测输入与检查点一致
+        if features is None:
+            metrics_array = FEATURE_SCHEMA.extract(metrics)
+        else:
+            metrics_array = np.array(features, dtype=np.float32)
         
         # 添加时间戳
-        current_time = time.time()
+        current_time = self.clock.time()
         data_point = {
             'timestamp': current_time,
             'metrics': metrics_array,
@@ -70,7 +71,7 @@ class PredictiveAnalyzer:
         # 检查缓存
         if cache_key in self.prediction_cache:
             cache_time, cache_data = self.prediction_cache[cache_key]
-            if time.time() - cache_time < self.cache_duration:
+            if self.clock.time() - cache_time < self.cache_duration:
                 return cache_data
         
         if len(self.historical_data) < 10:
@@ -91,7 +92,7 @@ class PredictiveAnalyzer:
             
             # 添加时间戳和元数据
             result = {
-                "timestamp": int(time.time()),
+                "timestamp": int(self.clock.time()),
                 "prediction_hours": hours,
                 "data_points_used": len(self.historical_data),
                 "predictions": prediction_result['predictions'],
@@ -101,7 +102,7 @@ class PredictiveAnalyzer:
             }
             
             # 缓存结果
-            self.prediction_cache[cache_key] = (time.time(), result)
+            self.prediction_cache[cache_key] = (self.clock.time(), result)
             
             return result
             
@@ -109,7 +110,7 @@ class PredictiveAnalyzer:
             logger.error(f"Prediction failed: {e}")
             return {
                 "error": f"Prediction failed: {str(e)}",
-                "timestamp": int(time.time())
+                "timestamp": int(self.clock.time())
             }
     
     def get_attack_timeline(self, hours: int = 24) -> Dict:
@@ -178,7 +179,7 @@ class PredictiveAnalyzer:
             return {"error": prediction_24h["error"]}
         
         insights = {
-            "timestamp": int(time.time()),
+            "timestamp": int(self.clock.time()),
             "short_term_risk": self._analyze_short_term_risk(prediction_6h),
             "long_term_trend": self._analyze_long_term_trend(prediction_24h),
             "recommendations": self._generate_recommendations(prediction_24h),
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+流式 LSTM 推理
+窗口推理每个 tick 把最近 sequence_length 个样本从零状态重新送入 LSTM，其中 sequence_length-1 步
+上一个 tick 已经算过。流式推理为每个设备保存各层的 (h, c)，每个新样本只推进一步。
+
+与窗口推理的关系:
+    两者并不严格相等。窗口推理只看最近 sequence_length 个样本，流式状态包含窗口之前的全部历史，
+    差异取决于 LSTM 遗忘门对旧输入的衰减。为此:
+    - 窗口首次填满时用窗口推理初始化状态（此刻输出与窗口推理完全相同）；
+    - 每推进 resync_interval 步用当前窗口重新计算状态（重新同步），限制窗口外历史的影响；
+    - 每推进 verify_interval 步用窗口推理校验一次，两者输出差超过 tolerance 时立即重新同步，
+      校验的最大误差和触发次数记录在统计信息中。
+    resync_interval=1 时每步都重新计算，退化为窗口推理。
+
+只记录不推理的样本（observe，如级联检测跳过模型的 tick）不立即推进状态，下一次 update 时
+从保存的状态连同新样本一起推进（k 步）；积压达到 sequence_length 时直接用窗口推理重新初始化，
+计算量不超过一次窗口推理。
+
+多个设备的推进在 update_batch 中按步数分组，每组合成一次批量前向计算。
+"""
+
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+from ..models.simple_lstm import AnomalyPredictor
+
+logger = logging.getLogger(__name__)
+
+
+class _DeviceStream:
+    """单个设备的流式状态"""
+    __slots__ = ('window', 'h', 'c', 'steps', 'pending', 'last_score')
+
+    def __init__(self, sequence_length: int):
+        self.window = deque(maxlen=sequence_length)
+        # 各为 (num_layers, hidden_size)，None 表示尚未初始化
+        self.h = None
+        self.c = None
+        # 自上次同步以来推进的步数
+        self.steps = 0
+        # 已记录但尚未推进到状态中的样本数（窗口末尾的 pending 个样本）
+        self.pending = 0
+        self.last_score = None
+
+
+class StreamingLSTMInference:
+    """按设备保存隐藏状态的流式 LSTM 推理"""
+
+    def __init__(self, predictor: AnomalyPredictor, sequence_length: int = 10, resync_interval: int = 100,
+                 verify_interval: int = 20, tolerance: float = 0.05):
+        """
+        Args:
+            predictor: 异常预测器（需提供 predict_with_state）
+            sequence_length: 窗口长度，与窗口推理一致
+            resync_interval: 每推进多少步用当前窗口重新计算状态
+            verify_interval: 每推进多少步与窗口推理比对一次，0 表示不校验
+            tolerance: 校验时允许的异常概率最大差，超过时立即重新同步
+        """
+        if sequence_length < 1 or resync_interval < 1:
+            raise ValueError("sequence_length 和 resync_interval 必须 >= 1")
+        self.predictor = predictor
+        self.sequence_length = sequence_length
+        self.resync_interval = resync_interval
+        self.verify_interval = verify_interval
+        self.tolerance = tolerance
+
+        self._devices: Dict[Any, _DeviceStream] = {}
+
+        self.stats = {
+            'steps': 0,
+            'catchup_steps': 0,
+            'window_passes': 0,
+            'resyncs': 0,
+            'verifications': 0,
+            'drift_resyncs': 0,
+            'max_drift': 0.0,
+            'total_time': 0.0
+        }
+
+    def update(self, device_id: Any, features: np.ndarray) -> Optional[float]:
+        """
+        加入一个设备的新样本并推进一步
+        Returns:
+            异常概率，窗口未填满时返回 None
+        """
+        return self.update_batch([device_id], np.asarray(features)[None, :])[0]
+
+    def update_batch(self, device_ids: Sequence[Any], features: np.ndarray) -> List[Optional[float]]:
+        """
+        多个设备各加入一个新样本
+        Args:
+            device_ids: 设备标识
+            features: (len(device_ids), 特征数) 特征矩阵，行顺序与 device_ids 一致
+        Returns:
+            各设备的异常概率，窗口未填满的设备为 None
+        """
+        start = time.perf_counter()
+        features = np.asarray(features, dtype=np.float32)
+        results: List[Optional[float]] = [None] * len(device_ids)
+        streams = []
+        # 推进步数 -> 设备行号（积压样本 + 新样本）
+        stepping: Dict[int, List[int]] = {}
+        windowed = []
+        for i, device_id in enumerate(device_ids):
+            stream = self._devices.get(device_id)
+            if stream is None:
+                stream = self._devices[device_id] = _DeviceStream(self.sequence_length)
+            stream.window.append(features[i].copy())
+            streams.append(stream)
+            if len(stream.window) < self.sequence_length:
+                continue
+            k = stream.pending + 1
+            if stream.h is None or k >= self.sequence_length or stream.steps + k >= self.resync_interval:
+                windowed.append(i)
+            else:
+                stepping.setdefault(k, []).append(i)
+
+        # 从保存的状态推进 k 步：同一步数的设备合成一次批量前向计算
+        verifying = []
+        for k, rows in stepping.items():
+            state = (np.stack([streams[i].h for i in rows], axis=1),
+                     np.stack([streams[i].c for i in rows], axis=1))
+            if k == 1:
+                sequences = features[rows][:, None, :]
+            else:
+                sequences = np.stack([np.stack(list(streams[i].window)[-k:]) for i in rows])
+            scores, (h, c) = self.predictor.predict_with_state(sequences, state)
+            for j, i in enumerate(rows):
+                stream = streams[i]
+                stream.h, stream.c = h[:, j], c[:, j]
+                due = self.verify_interval and \
+                    (stream.steps + k) // self.verify_interval > stream.steps // self.verify_interval
+                stream.steps += k
+                stream.pending = 0
+                stream.last_score = results[i] = float(scores[j])
+                if due:
+                    verifying.append(i)
+            self.stats['steps'] += len(rows)
+            self.stats['catchup_steps'] += (k - 1) * len(rows)
+
+        # 窗口推理：首次初始化、定期重新同步和校验
+        if windowed or verifying:
+            rows = windowed + verifying
+            scores, (h, c) = self.predictor.predict_with_state(
+                np.stack([np.stack(streams[i].window) for i in rows]))
+            self.stats['window_passes'] += len(rows)
+            for j, i in enumerate(rows):
+                stream = streams[i]
+                score = float(scores[j])
+                if j >= len(windowed):
+                    drift = abs(score - stream.last_score)
+                    self.stats['verifications'] += 1
+                    self.stats['max_drift'] = max(self.stats['max_drift'], drift)
+                    if drift <= self.tolerance:
+                        continue
+                    self.stats['drift_resyncs'] += 1
+                    logger.debug(f"Streaming state drifted {drift:.4f} from window for {device_ids[i]}, resyncing")
+                elif stream.h is not None:
+                    self.stats['resyncs'] += 1
+                stream.h, stream.c = h[:, j], c[:, j]
+                stream.steps = 0
+                stream.pending = 0
+                stream.last_score = results[i] = score
+
+        self.stats['total_time'] += time.perf_counter() - start
+        return results
+
+    def observe(self, device_id: Any, features: np.ndarray):
+        """
+        只记录样本、不推理（级联检测跳过模型时调用），O(1)。
+        状态保留，下一次 update 时连同积压的样本一起推进
+        """
+        stream = self._devices.get(device_id)
+        if stream is None:
+            stream = self._devices[device_id] = _DeviceStream(self.sequence_length)
+        stream.window.append(np.array(features, dtype=np.float32))
+        if stream.h is not None:
+            stream.pending += 1
+
+    def reset(self, device_id: Any = None):
+        """清除一个设备（默认全部设备）的状态"""
+        if device_id is None:
+            self._devices.clear()
+        else:
+            self._devices.pop(device_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['devices'] = len(self._devices)
+        # 相对窗口推理（每次推理 sequence_length 步）的 LSTM 计算量
+        ticks = stats['steps'] + stats['window_passes'] - stats['verifications']
+        computed = stats['steps'] + stats['catchup_steps'] + stats['window_passes'] * self.sequence_length
+        stats['compute_ratio'] = computed / (ticks * self.sequence_length) if ticks else 0.0
+        return stats
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+NumPy LSTM 推理后端
+与 SimpleLSTM（PyTorch）结构和参数布局相同的纯 NumPy 前向计算，只用于推理，不导入 torch。
+
+- 四个门（输入、遗忘、候选、输出，顺序与 nn.LSTM 相同）的权重在加载时合并并转置，每层一次矩阵乘法
+  算出全部门；输入投影对整个序列一次完成，逐步循环中只剩隐藏状态投影；全部使用 float32。
+- 权重来源:
+    .npz  由 save_npz 导出（state_dict 各张量 + JSON 元数据），np.load 直接读取
+    .pth  torch.save 的 zip 格式检查点，由 load_torch_checkpoint 解析 data.pkl 和张量存储，
+          只还原张量、OrderedDict 和 numpy 数组/标量（固定的重建函数白名单），其他对象（如 ModelConfig）
+          以占位对象代替，不导入其模块
+"""
+
+import json
+import pickle
+import zipfile
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Tuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.float32
+
+# torch 存储类型 -> NumPy 类型
+_STORAGE_DTYPES = {
+    'FloatStorage': np.float32,
+    'DoubleStorage': np.float64,
+    'HalfStorage': np.float16,
+    'LongStorage': np.int64,
+    'IntStorage': np.int32,
+    'ShortStorage': np.int16,
+    'CharStorage': np.int8,
+    'ByteStorage': np.uint8,
+    'BoolStorage': np.bool_
+}
+
+# 检查点中允许还原的 NumPy 对象（pickle 保存的数组、标量和 dtype 的重建函数），
+# 其他全局名一律以占位对象代替，不导入、不调用
+_ALLOWED_GLOBALS = {
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', 'scalar'),
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('_codecs', 'encode')
+}
+
+# npz 中保存检查点元数据的键
+_NPZ_METADATA_KEY = '__checkpoint__'
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    # tanh 形式，不会因 exp 溢出
+    return 0.5 * np.tanh(0.5 * x) + 0.5
+
+
+class NumpyLSTM:
+    """SimpleLSTM 的 NumPy 推理实现（LSTM + 全连接 + Sigmoid）"""
+
+    def __init__(self, input_size: int, hidden_size: int = 64, num_layers: int = 2, output_size: int = 1):
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.output_size = output_size
+
+        # 与 nn.LSTM / nn.Linear 相同的初始化 U(-1/sqrt(H), 1/sqrt(H))，未加载模型时与 PyTorch 后端行为一致
+        bound = 1.0 / np.sqrt(hidden_size)
+        rng = np.random.default_rng()
+        state_dict = OrderedDict()
+        for layer in range(num_layers):
+            layer_input = input_size if layer == 0 else hidden_size
+            for name, shape in ((f'lstm.weight_ih_l{layer}', (4 * hidden_size, layer_input)),
+                                (f'lstm.weight_hh_l{layer}', (4 * hidden_size, hidden_size)),
+                                (f'lstm.bias_ih_l{layer}', (4 * hidden_size,)),
+                                (f'lstm.bias_hh_l{layer}', (4 * hidden_size,))):
+                state_dict[name] = rng.uniform(-bound, bound, shape)
+        state_dict['fc.weight'] = rng.uniform(-bound, bound, (output_size, hidden_size))
+        state_dict['fc.bias'] = rng.uniform(-bound, bound, (output_size,))
+        self.load_state_dict(state_dict)
+
+    def _expected_shapes(self) -> Dict[str, tuple]:
+        shapes = {}
+        gates = 4 * self.hidden_size
+        for layer in range(self.num_layers):
+            layer_input = self.input_size if layer == 0 else self.hidden_size
+            shapes[f'lstm.weight_ih_l{layer}'] = (gates, layer_input)
+            shapes[f'lstm.weight_hh_l{layer}'] = (gates, self.hidden_size)
+            shapes[f'lstm.bias_ih_l{layer}'] = (gates,)
+            shapes[f'lstm.bias_hh_l{layer}'] = (gates,)
+        shapes['fc.weight'] = (self.output_size, self.hidden_size)
+        shapes['fc.bias'] = (self.output_size,)
+        return shapes
+
+    def load_state_dict(self, state_dict: Dict[str, np.ndarray]):
+        """
+        加载 SimpleLSTM 的 state_dict（键和形状必须完全一致，与 nn.Module.load_state_dict 的严格模式相同）
+        Args:
+            state_dict: 参数名 -> 数组
+        """
+        expected = self._expected_shapes()
+        missing = [k for k in expected if k not in state_dict]
+        unexpected = [k for k in state_dict if k not in expected]
+        if missing or unexpected:
+            raise ValueError(f"Error(s) in loading state_dict: missing keys {missing}, unexpected keys {unexpected}")
+        for name, shape in expected.items():
+            if tuple(np.shape(state_dict[name])) != shape:
+                raise ValueError(f"Size mismatch for {name}: checkpoint {tuple(np.shape(state_dict[name]))}, "
+                                 f"model {shape}")
+
+        self._state = OrderedDict((k, np.array(state_dict[k], dtype=DTYPE)) for k in expected)
+        # 合并四个门：(输入维度, 4H) 的转置权重和合并后的偏置
+        self._w_ih, self._w_hh, self._bias = [], [], []
+        for layer in range(self.num_layers):
+            self._w_ih.append(np.ascontiguousarray(self._state[f'lstm.weight_ih_l{layer}'].T))
+            self._w_hh.append(np.ascontiguousarray(self._state[f'lstm.weight_hh_l{layer}'].T))
+            self._bias.append(self._state[f'lstm.bias_ih_l{layer}'] + self._state[f'lstm.bias_hh_l{layer}'])
+        self._w_fc = np.ascontiguousarray(self._state['fc.weight'].T)
+        self._b_fc = self._state['fc.bias']
+
+    def state_dict(self) -> Dict[str, np.ndarray]:
+        """参数（与 SimpleLSTM.state_dict 相同的键和布局）"""
+        return OrderedDict((k, v.copy()) for k, v in self._state.items())
+
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        return self.forward_with_state(x)[0]
+
+    def forward_with_state(self, x: np.ndarray, state: Tuple[np.ndarray, np.ndarray] = None
+                           ) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        前向计算并返回最后的 (h, c)
+        Args:
+            x: (batch, steps, input_size) 序列
+            state: (h, c)，各为 (num_layers, batch, hidden_size)，None 表示零状态
+        Returns:
+            ((batch, output_size) 异常概率, (h, c))
+        """
+        x = np.asarray(x, dtype=DTYPE)
+        batch, steps, _ = x.shape
+        hidden = self.hidden_size
+        h_out = np.empty((self.num_layers, batch, hidden), dtype=DTYPE)
+        c_out = np.empty((self.num_layers, batch, hidden), dtype=DTYPE)
+
+        layer_input = x
+        for layer in range(self.num_layers):
+            if state is None:
+                h = np.zeros((batch, hidden), dtype=DTYPE)
+                c = np.zeros((batch, hidden), dtype=DTYPE)
+            else:
+                h = np.array(state[0][layer], dtype=DTYPE)
+                c = np.array(state[1][layer], dtype=DTYPE)
+            # 整个序列的输入投影一次完成：(batch, steps, 4H)
+            projected = layer_input @ self._w_ih[layer]
+            projected += self._bias[layer]
+            w_hh = self._w_hh[layer]
+            last_layer = layer == self.num_layers - 1
+            outputs = None if last_layer else np.empty((batch, steps, hidden), dtype=DTYPE)
+            for t in range(steps):
+                gates = projected[:, t]
+                gates += h @ w_hh
+                i = _sigmoid(gates[:, :hidden])
+                f = _sigmoid(gates[:, hidden:2 * hidden])
+                g = np.tanh(gates[:, 2 * hidden:3 * hidden])
+                o = _sigmoid(gates[:, 3 * hidden:])
+                c = f * c + i * g
+                h = o * np.tanh(c)
+                if outputs is not None:
+                    outputs[:, t] = h
+            h_out[layer], c_out[layer] = h, c
+            layer_input = outputs
+
+        output = _sigmoid(h_out[-1] @ self._w_fc + self._b_fc)
+        return output, (h_out, c_out)
+
+
+# ---- 检查点读写（不依赖 torch） ----
+
+class _UnpickledObject:
+    """检查点中非张量对象的占位（只保留其状态字典）"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+
+
+class _TorchUnpickler(pickle.Unpickler):
+    """解析 torch.save 的 data.pkl，张量还原为 NumPy 数组"""
+
+    def __init__(self, archive: zipfile.ZipFile, prefix: str, byteorder: str):
+        super().__init__(archive.open(f'{prefix}/data.pkl'))
+        self._archive = archive
+        self._prefix = prefix
+        self._byteorder = '<' if byteorder == 'little' else '>'
+        self._storages: Dict[str, np.ndarray] = {}
+
+    def find_class(self, module: str, name: str):
+        if module == 'torch._utils' and name == '_rebuild_tensor_v2':
+            return _rebuild_tensor
+        if module == 'torch._utils' and name == '_rebuild_parameter':
+            return lambda data, requires_grad, backward_hooks: data
+        if module == 'torch' and name in _STORAGE_DTYPES:
+            return np.dtype(_STORAGE_DTYPES[name])
+        if module == 'collections' and name == 'OrderedDict':
+            return OrderedDict
+        if (module, name) in _ALLOWED_GLOBALS:
+            return super().find_class(module, name)
+        return type(name, (_UnpickledObject,), {'__module__': module})
+
+    def persistent_load(self, pid):
+        # ('storage', 存储类型, 键, 设备, 元素数)
+        if not (isinstance(pid, tuple) and pid and pid[0] == 'storage'):
+            raise pickle.UnpicklingError(f"Unsupported persistent id: {pid!r}")
+        dtype, key = pid[1], pid[2]
+        if not isinstance(dtype, np.dtype):
+            raise pickle.UnpicklingError(f"Unsupported storage type: {dtype!r}")
+        if key not in self._storages:
+            data = self._archive.read(f'{self._prefix}/data/{key}')
+            self._storages[key] = np.frombuffer(data, dtype=dtype.newbyteorder(self._byteorder))
+        return self._storages[key]
+
+
+def _rebuild_tensor(storage, storage_offset, size, stride, requires_grad=False, backward_hooks=None,
+                    metadata=None) -> np.ndarray:
+    itemsize = storage.dtype.itemsize
+    view = np.lib.stride_tricks.as_strided(storage[storage_offset:], shape=tuple(size),
+                                           strides=tuple(s * itemsize for s in stride))
+    return view.astype(storage.dtype.newbyteorder('='))
+
+
+def load_torch_checkpoint(path: str) -> Any:
+    """
+    不导入 torch 读取 torch.save 保存的检查点（PyTorch 1.6 起的 zip 格式）
+    Args:
+        path: .pth 文件
+    Returns:
+        检查点对象，其中的张量为 NumPy 数组
+    """
+    if not zipfile.is_zipfile(path):
+        raise ValueError(f"{path} is not a zip-format torch checkpoint; export it with save_npz")
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        prefix = names[0].split('/')[0]
+        byteorder = 'little'
+        if f'{prefix}/byteorder' in names:
+            byteorder = archive.read(f'{prefix}/byteorder').decode().strip()
+        return _TorchUnpickler(archive, prefix, byteorder).load()
+
+
+def save_npz(path: str, state_dict: Dict[str, np.ndarray], **metadata):
+    """
+    导出 .npz 检查点
+    Args:
+        path: 输出文件
+        state_dict: 参数名 -> 数组
+        metadata: 可 JSON 序列化的元数据（model_version、feature_schema 等）
+    """
+    arrays = {name: np.asarray(value) for name, value in state_dict.items()}
+    arrays[_NPZ_METADATA_KEY] = np.array(json.dumps(metadata))
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_npz(path: str) -> Dict[str, Any]:
+    """
+    读取 save_npz 导出的检查点
+    Returns:
+        {'model_state_dict': 参数, 以及导出时写入的元数据}
+    """
+    with np.load(path, allow_pickle=False) as data:
+        checkpoint = json.loads(str(data[_NPZ_METADATA_KEY])) if _NPZ_METADATA_KEY in data.files else {}
+        checkpoint['model_state_dict'] = OrderedDict(
+            (name, data[name]) for name in data.files if name != _NPZ_METADATA_KEY)
+    return checkpoint
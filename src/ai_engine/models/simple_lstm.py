@@ -2,11 +2,14 @@
 """
 简单的LSTM异常检测模型
 用于网络流量异常预测
+
+推理后端（AnomalyPredictor 的 backend 参数）:
+    torch  SimpleLSTM（PyTorch），训练和推理均可用
+    numpy  NumpyLSTM，只用于推理，整个过程不导入 torch；可加载 .pth 检查点或导出的 .npz
+    auto   已安装 PyTorch 时使用 torch，否则使用 numpy（默认）
 """
 
-import torch
-import torch.nn as nn
-import torch.optim as optim
+import importlib.util
 import numpy as np
 import json
 import os
@@ -15,12 +18,34 @@ from dataclasses import dataclass
 import logging
 import time
 
+from ..training.feature_schema import FEATURE_SCHEMA
+from .numpy_lstm import NumpyLSTM, load_torch_checkpoint, load_npz, save_npz
+
 logger = logging.getLogger(__name__)
 
+BACKENDS = ('auto', 'torch', 'numpy')
+
+# PyTorch 在首次使用 torch 后端时导入（见 _import_torch）
+torch = None
+
+def _import_torch():
+    global torch
+    if torch is None:
+        import torch as torch_module
+        torch = torch_module
+    return torch
+
+def __getattr__(name):
+    # SimpleLSTM 依赖 PyTorch，访问时才导入
+    if name == 'SimpleLSTM':
+        from .torch_lstm import SimpleLSTM
+        return SimpleLSTM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 @dataclass
 class ModelConfig:
     """模型配置"""
-    input_size: int = 9  # 特征数量
+    input_size: int = FEATURE_SCHEMA.size  # 特征数量
     hidden_size: int = 64
     num_layers: int = 2
     output_size: int = 1  # 异常分数
@@ -30,31 +55,30 @@ class ModelConfig:
     batch_size: int = 32
     epochs: int = 100
 
-class SimpleLSTM(nn.Module):
-    """简单的LSTM模型"""
-    
-    def __init__(self, input_size=9, hidden_size=64, num_layers=2, output_size=1, dropout=0.2):
-        super(SimpleLSTM, self).__init__()
-        self.hidden_size = hidden_size
-        self.num_layers = num_layers
-        
-        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, 
-                           batch_first=True, dropout=dropout)
-        self.fc = nn.Linear(hidden_size, output_size)
-        self.sigmoid = nn.Sigmoid()
-        
-    def forward(self, x):
-        lstm_out, _ = self.lstm(x)
-        last_output = lstm_out[:, -1, :]
-        output = self.fc(last_output)
-        return self.sigmoid(output)
-
 class AnomalyPredictor:
     """异常预测器"""
     
-    def __init__(self, model_path: str = None, device: str = 'cpu'):
+    def __init__(self, model_path: str = None, device: str = 'cpu', backend: str = 'auto'):
+        """
+        Args:
+            model_path: 模型文件（.pth 或 .npz）
+            device: PyTorch 设备（numpy 后端忽略）
+            backend: 推理后端，'auto'、'torch' 或 'numpy'
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"backend 必须是 {BACKENDS} 之一: {backend}")
+        if backend == 'auto':
+            backend = 'torch' if importlib.util.find_spec('torch') is not None else 'numpy'
+        self.backend = backend
         self.device = device
-        self.model = SimpleLSTM().to(device)
+        # 输入特征模式，检查点中记录的模式必须与之一致
+        self.feature_schema = FEATURE_SCHEMA
+        if backend == 'numpy':
+            self.model = NumpyLSTM(input_size=self.feature_schema.size)
+        else:
+            _import_torch()
+            from .torch_lstm import SimpleLSTM
+            self.model = SimpleLSTM(input_size=self.feature_schema.size).to(device)
         self.model_version = "1.0"
         
         if model_path and os.path.exists(model_path):
@@ -63,25 +87,92 @@ class AnomalyPredictor:
         else:
             logger.warning(f"Model file not found: {model_path}")
         
-        logger.info(f"AnomalyPredictor initialized on device: {device}")
+        logger.info(f"AnomalyPredictor initialized with {backend} backend on device: {device}")
     
     def load_model(self, model_path: str):
-        """加载模型"""
+        """加载模型（.npz 为导出的 NumPy 检查点，其他按 torch.save 检查点读取）"""
         try:
-            checkpoint = torch.load(model_path, map_location=self.device)
-            self.model.load_state_dict(checkpoint['model_state_dict'])
-            self.model.eval()
+            if model_path.endswith('.npz'):
+                checkpoint = load_npz(model_path)
+            elif self.backend == 'numpy':
+                checkpoint = load_torch_checkpoint(model_path)
+            else:
+                checkpoint = torch.load(model_path, map_location=self.device)
+            # 模式引入前保存的检查点没有 feature_schema，按版本 1 处理
+            self.feature_schema.check(checkpoint.get('feature_schema'), model_path)
+            state_dict = checkpoint['model_state_dict']
+            if self.backend == 'numpy':
+                self.model.load_state_dict(state_dict)
+            else:
+                self.model.load_state_dict({name: torch.as_tensor(value) for name, value in state_dict.items()})
+                self.model.eval()
             logger.info(f"Model loaded from {model_path}")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
     
+    def save_model(self, model_path: str):
+        """保存模型（连同特征模式，加载时校验）；.npz 路径导出供 numpy 后端加载的检查点"""
+        os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+        if model_path.endswith('.npz'):
+            state_dict = self.model.state_dict()
+            if self.backend != 'numpy':
+                state_dict = {name: value.cpu().numpy() for name, value in state_dict.items()}
+            save_npz(model_path, state_dict, model_version=self.model_version,
+                     feature_schema=self.feature_schema.to_dict())
+        elif self.backend == 'numpy':
+            raise ValueError("numpy 后端只能导出 .npz 检查点")
+        else:
+            torch.save({
+                'model_state_dict': self.model.state_dict(),
+                'model_version': self.model_version,
+                'feature_schema': self.feature_schema.to_dict()
+            }, model_path)
+        logger.info(f"Model saved to {model_path}")
+    
     def predict_anomaly(self, sequence: np.ndarray) -> float:
         """预测异常概率"""
+        if self.backend == 'numpy':
+            return float(self.model.forward(np.asarray(sequence, dtype=np.float32)[None])[0, 0])
         with torch.no_grad():
             sequence_tensor = torch.FloatTensor(sequence).unsqueeze(0).to(self.device)
             prediction = self.model(sequence_tensor)
             return prediction.item()
     
+    def predict_batch(self, sequences: np.ndarray) -> np.ndarray:
+        """
+        批量预测异常概率（一次前向计算）
+        Args:
+            sequences: (batch, sequence_length, 特征数) 序列
+        Returns:
+            (batch,) 异常概率
+        """
+        if self.backend == 'numpy':
+            return self.model.forward(sequences).reshape(-1)
+        with torch.no_grad():
+            batch = torch.from_numpy(np.ascontiguousarray(sequences, dtype=np.float32)).to(self.device)
+            return self.model(batch).reshape(-1).cpu().numpy()
+    
+    def predict_with_state(self, sequences: np.ndarray,
+                           state: Tuple[np.ndarray, np.ndarray] = None) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        批量前向计算并返回最后的隐藏状态
+        Args:
+            sequences: (batch, steps, 特征数) 序列，流式推理每次 steps=1
+            state: 上一步的 (h, c)，各为 (num_layers, batch, hidden_size)，None 表示零状态
+        Returns:
+            ((batch,) 异常概率, (h, c))
+        """
+        if self.backend == 'numpy':
+            output, state = self.model.forward_with_state(sequences, state)
+            return output.reshape(-1), state
+        with torch.no_grad():
+            x = torch.from_numpy(np.ascontiguousarray(sequences, dtype=np.float32)).to(self.device)
+            if state is not None:
+                state = tuple(torch.from_numpy(np.ascontiguousarray(s, dtype=np.float32)).to(self.device)
+                              for s in state)
+            output, (h, c) = self.model.forward_with_state(x, state)
+            return output.reshape(-1).cpu().numpy(), (h.cpu().numpy(), c.cpu().numpy())
+    
     def predict_future_anomalies(self, historical_data: List[np.ndarray], 
                                prediction_hours: int = 24) -> Dict:
         """预测未来异常情况"""
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+LSTM 模型的 PyTorch 实现
+仅在 AnomalyPredictor 使用 PyTorch 后端时导入
+"""
+
+import torch
+import torch.nn as nn
+
+from ..training.feature_schema import FEATURE_SCHEMA
+
+class SimpleLSTM(nn.Module):
+    """简单的LSTM模型"""
+
+    def __init__(self, input_size=FEATURE_SCHEMA.size, hidden_size=64, num_layers=2, output_size=1, dropout=0.2):
+        super(SimpleLSTM, self).__init__()
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+
+        self.lstm = nn.LSTM(input_size, hidden_size, num_layers,
+                           batch_first=True, dropout=dropout)
+        self.fc = nn.Linear(hidden_size, output_size)
+        self.sigmoid = nn.Sigmoid()
+
+    def forward(self, x):
+        return self.forward_with_state(x)[0]
+
+    def forward_with_state(self, x, state=None):
+        """前向计算并返回最后的 (h, c)；传入 state 时从该状态继续（流式推理逐步推进）"""
+        lstm_out, state = self.lstm(x, state)
+        last_output = lstm_out[:, -1, :]
+        output = self.fc(last_output)
+        return self.sigmoid(output), state
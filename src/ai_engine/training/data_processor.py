@@ -13,6 +13,8 @@ import logging
 from dataclasses import dataclass
 import time
 
+from .feature_schema import FEATURE_SCHEMA, FeatureSchema
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -34,11 +36,12 @@ class DataProcessor:
     
     def __init__(self, sequence_length: int = 10, feature_names: List[str] = None):
         self.sequence_length = sequence_length
-        self.feature_names = feature_names or [
-            'packets_per_sec', 'bytes_per_sec', 'active_connections',
-            'dropped_packets', 'encryption_hits', 'decryption_hits',
-            'cpu_usage', 'memory_usage', 'error_count'
-        ]
+        # 默认使用与模型检查点一致的特征模式
+        if feature_names is None:
+            self.schema = FEATURE_SCHEMA
+        else:
+            self.schema = FeatureSchema(version=FEATURE_SCHEMA.version, fields=tuple(feature_names))
+        self.feature_names = list(self.schema.fields)
         
         # 数据缓存
         self.data_buffer = deque(maxlen=1000)
@@ -59,13 +62,19 @@ class DataProcessor:
             metrics: 网络指标
             is_anomaly: 是否为异常数据
         """
-        # 转换为特征向量
-        features = self._extract_features(metrics)
-        
-        # 添加到缓存
+        self.add_features(self._extract_features(metrics), metrics.timestamp, is_anomaly)
+    
+    def add_features(self, features: np.ndarray, timestamp: int, is_anomaly: bool = False):
+        """
+        添加已按特征模式提取的特征行
+        Args:
+            features: 特征行（复制后缓存，调用方可继续复用该行）
+            timestamp: 样本时间戳
+            is_anomaly: 是否为异常数据
+        """
         self.data_buffer.append({
-            'features': features,
-            'timestamp': metrics.timestamp,
+            'features': np.array(features, dtype=np.float32),
+            'timestamp': timestamp,
             'is_anomaly': is_anomaly
         })
         
@@ -77,19 +86,8 @@ class DataProcessor:
             self.stats['normal_samples'] += 1
     
     def _extract_features(self, metrics: NetworkMetrics) -> np.ndarray:
-        """提取特征向量"""
-        features = [
-            metrics.packets_per_sec,
-            metrics.bytes_per_sec,
-            metrics.active_connections,
-            metrics.dropped_packets,
-            metrics.encryption_hits,
-            metrics.decryption_hits,
-            metrics.cpu_usage,
-            metrics.memory_usage,
-            metrics.error_count
-        ]
-        return np.array(features, dtype=np.float32)
+        """按特征模式提取特征向量"""
+        return self.schema.extract(metrics)
     
     def create_sequences(self) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -192,6 +190,7 @@ class DataProcessor:
             'sequences': [seq.tolist() for seq in self.data_buffer],
             'stats': self.stats,
             'feature_names': self.feature_names,
+            'feature_schema': self.schema.to_dict(),
             'sequence_length': self.sequence_length
         }
         
@@ -205,6 +204,8 @@ class DataProcessor:
         with open(filepath, 'r') as f:
             data = json.load(f)
         
+        # 旧文件没有 feature_schema，按版本 1 处理
+        self.schema.check(data.get('feature_schema'), filepath)
         self.data_buffer = deque(data['sequences'], maxlen=1000)
         self.stats = data['stats']
         self.feature_names = data['feature_names']
@@ -229,20 +230,26 @@ class DataProcessor:
 class RealTimeDataProcessor(DataProcessor):
     """实时数据处理器"""
     
-    def __init__(self, sequence_length: int = 10, update_interval: float = 1.0):
+    def __init__(self, sequence_length: int = 10, update_interval: float = 1.0, clock=None):
         super().__init__(sequence_length)
         self.update_interval = update_interval
-        self.last_update = time.time()
+        # 时间源，需提供 time()（默认真实时间）
+        self.clock = clock or time
+        self.last_update = self.clock.time()
         
         # 实时预测缓存
         self.prediction_cache = deque(maxlen=100)
         
     def add_metrics_realtime(self, metrics: NetworkMetrics, is_anomaly: bool = False):
         """实时添加指标数据"""
-        self.add_metrics(metrics, is_anomaly)
+        return self.add_features_realtime(self._extract_features(metrics), metrics.timestamp, is_anomaly)
+    
+    def add_features_realtime(self, features: np.ndarray, timestamp: int, is_anomaly: bool = False):
+        """实时添加已提取的特征行，到达更新间隔时返回最新序列"""
+        self.add_features(features, timestamp, is_anomaly)
         
         # 检查是否需要更新
-        current_time = time.time()
+        current_time = self.clock.time()
         if current_time - self.last_update >= self.update_interval:
             self.last_update = current_time
             return self.get_latest_sequence()
@@ -255,16 +262,13 @@ class RealTimeDataProcessor(DataProcessor):
             return None
         
         # 获取最新的序列
-        latest_sequence = []
-        for i in range(len(self.data_buffer) - self.sequence_length, len(self.data_buffer)):
-            latest_sequence.append(self.data_buffer[i]['features'])
-        
-        return np.array(latest_sequence)
+        start = len(self.data_buffer) - self.sequence_length
+        return np.stack([self.data_buffer[i]['features'] for i in range(start, len(self.data_buffer))])
     
     def add_prediction(self, prediction: float, timestamp: int = None):
         """添加预测结果到缓存"""
         if timestamp is None:
-            timestamp = int(time.time())
+            timestamp = int(self.clock.time())
         
         self.prediction_cache.append({
             'prediction': prediction,
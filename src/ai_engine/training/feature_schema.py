@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+特征模式
+训练（DataProcessor）、实时推理（AIAnomalyDetector）和预测分析（PredictiveAnalyzer）共用的特征定义。
+每个样本按 FEATURE_SCHEMA.fields 的顺序一次写入 float32 行，调用方可传入预分配的行反复复用。
+
+模式带版本号并写入模型检查点和训练数据文件，加载时校验，避免训练与推理的特征顺序不一致。
+修改字段或顺序时必须递增 FEATURE_SCHEMA_VERSION 并重新训练模型。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Any, Tuple, Optional
+
+import numpy as np
+
+FEATURE_SCHEMA_VERSION = 1
+
+# 与 telemetry_format.METRIC_FIELDS 的顺序一致（原始指标，不做单位换算）
+FEATURE_FIELDS = (
+    'packets_per_sec', 'bytes_per_sec', 'active_connections',
+    'dropped_packets', 'encryption_hits', 'decryption_hits',
+    'cpu_usage', 'memory_usage', 'error_count'
+)
+
+FEATURE_DTYPE = np.float32
+
+
+@dataclass(frozen=True)
+class FeatureSchema:
+    """特征模式（不可变）"""
+    version: int
+    fields: Tuple[str, ...]
+
+    @property
+    def size(self) -> int:
+        return len(self.fields)
+
+    def new_row(self) -> np.ndarray:
+        """预分配一行特征"""
+        return np.zeros(self.size, dtype=FEATURE_DTYPE)
+
+    def extract(self, metrics: Any, out: np.ndarray = None) -> np.ndarray:
+        """
+        将一个样本写入特征行
+        Args:
+            metrics: 指标字典或带同名属性的对象（如 NetworkMetrics），缺失字段记为 0
+            out: 预分配的特征行，为 None 时新建
+        Returns:
+            特征行（传入 out 时即为 out）
+        """
+        if out is None:
+            out = np.empty(self.size, dtype=FEATURE_DTYPE)
+        if isinstance(metrics, dict):
+            out[:] = [metrics.get(name, 0) for name in self.fields]
+        else:
+            out[:] = [getattr(metrics, name, 0) for name in self.fields]
+        return out
+
+    def as_dict(self, row: np.ndarray) -> Dict[str, float]:
+        """特征行转换为 {字段名: 值}"""
+        return dict(zip(self.fields, row.tolist()))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """写入检查点 / 数据文件的模式描述"""
+        return {'version': self.version, 'fields': list(self.fields)}
+
+    def check(self, metadata: Optional[Dict[str, Any]], source: str):
+        """
+        校验检查点或数据文件记录的模式，不一致时抛出 ValueError
+        Args:
+            metadata: 记录的模式描述，为 None 时视为模式引入前的旧文件（版本 1）
+            source: 文件名，用于错误信息
+        """
+        if metadata is None:
+            metadata = {'version': 1, 'fields': list(FEATURE_FIELDS)}
+        if metadata.get('version') != self.version or tuple(metadata.get('fields', ())) != self.fields:
+            raise ValueError(f"{source}: 特征模式 v{metadata.get('version')} 与当前 v{self.version} 不一致，"
+                             f"需要用当前特征重新训练")
+
+
+FEATURE_SCHEMA = FeatureSchema(version=FEATURE_SCHEMA_VERSION, fields=FEATURE_FIELDS)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+防御策略编译器
+从配置加载防御策略和各动作的条件/参数模板，编译为不可变模板，
+生成规则时每个动作只做一次按风险评分的参数填充
+
+模板取值的写法:
+    常量                                   -> 原样使用（列表/字典每次复制）
+    {"base": b, "coef": c, "divisor": d,
+     "min": lo, "max": hi}                  -> clamp(b + risk * c / d, lo, hi)，divisor 默认 1
+    {"above": t, "then": x, "else": y}      -> risk > t 时取 x，否则取 y
+"""
+
+import os
+import json
+import copy
+import logging
+from bisect import bisect_left
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Any, Tuple, Callable, Mapping
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRATEGIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'configs',
+                                       'defense_strategies.json')
+
+# 内置默认策略（与 configs/defense_strategies.json 一致）
+DEFAULT_STRATEGIES = {
+    'version': 1,
+    'strategies': {
+        'ddos_attack': {
+            'actions': ['rate_limit', 'connection_limit', 'drop_suspicious'],
+            'priority': 'high',
+            'duration': 300  # 5分钟
+        },
+        'resource_exhaustion': {
+            'actions': ['cpu_throttle', 'memory_limit', 'error_monitoring'],
+            'priority': 'medium',
+            'duration': 180  # 3分钟
+        },
+        'packet_loss': {
+            'actions': ['retry_mechanism', 'buffer_optimization'],
+            'priority': 'low',
+            'duration': 120  # 2分钟
+        },
+        'suspicious_behavior': {
+            'actions': ['traffic_analysis', 'encryption_monitoring'],
+            'priority': 'medium',
+            'duration': 240  # 4分钟
+        }
+    },
+    # 未知异常类型时按风险评分选择策略: risk > thresholds[i] 的个数即为下标
+    'fallback': {
+        'thresholds': [70, 80, 90],
+        'strategies': ['suspicious_behavior', 'packet_loss', 'resource_exhaustion', 'ddos_attack']
+    },
+    'actions': {
+        'rate_limit': {
+            'conditions': {
+                'packets_per_sec_threshold': {'base': 1000, 'coef': 10},
+                'bytes_per_sec_threshold': {'base': 1000000, 'coef': 10000}
+            },
+            'parameters': {
+                'limit_type': 'packet_rate',
+                'limit_value': {'base': 1000, 'coef': -5, 'min': 100}
+            }
+        },
+        'connection_limit': {
+            'conditions': {
+                'max_connections': {'base': 200, 'coef': -2, 'min': 50},
+                'connection_timeout': 30
+            },
+            'parameters': {
+                'limit_type': 'connection_count',
+                'limit_value': {'base': 100, 'coef': -1, 'min': 10}
+            }
+        },
+        'drop_suspicious': {
+            'conditions': {
+                'suspicious_patterns': ['high_frequency', 'large_packets', 'encrypted_traffic'],
+                'drop_probability': {'divisor': 100, 'max': 0.8}
+            },
+            'parameters': {
+                'drop_type': 'selective',
+                'drop_rate': {'divisor': 100, 'max': 0.9}
+            }
+        },
+        'cpu_throttle': {
+            'conditions': {
+                'max_cpu_usage': {'base': 80, 'coef': -0.5, 'min': 30},
+                'throttle_duration': 60
+            },
+            'parameters': {
+                'throttle_type': 'percentage',
+                'throttle_value': {'coef': 0.5, 'max': 50}
+            }
+        },
+        'memory_limit': {
+            'conditions': {
+                'max_memory_usage': {'base': 70, 'coef': -0.3, 'min': 40},
+                'cleanup_interval': 30
+            },
+            'parameters': {
+                'limit_type': 'percentage',
+                'limit_value': {'coef': 0.3, 'max': 30}
+            }
+        },
+        'error_monitoring': {
+            'conditions': {
+                'error_threshold': {'base': 20, 'coef': -0.2, 'min': 5},
+                'monitoring_interval': 10
+            },
+            'parameters': {
+                'monitoring_type': 'real_time',
+                'alert_threshold': {'base': 10, 'coef': -0.1, 'min': 1}
+            }
+        },
+        'retry_mechanism': {
+            'conditions': {
+                'max_retries': 3,
+                'retry_delay': 1
+            },
+            'parameters': {
+                'retry_type': 'exponential_backoff',
+                'max_delay': 5
+            }
+        },
+        'buffer_optimization': {
+            'conditions': {
+                'buffer_size': {'base': 8192, 'coef': -50, 'min': 1024},
+                'optimization_interval': 15
+            },
+            'parameters': {
+                'optimization_type': 'dynamic',
+                'target_efficiency': 0.8
+            }
+        },
+        'traffic_analysis': {
+            'conditions': {
+                'analysis_depth': {'above': 80, 'then': 'deep', 'else': 'normal'},
+                'sampling_rate': {'base': 1.0, 'coef': -1, 'divisor': 100, 'min': 0.1}
+            },
+            'parameters': {
+                'analysis_type': 'behavioral',
+                'learning_rate': 0.1
+            }
+        },
+        'encryption_monitoring': {
+            'conditions': {
+                'encryption_ratio_threshold': 0.7,
+                'monitoring_interval': 5
+            },
+            'parameters': {
+                'monitoring_type': 'ratio_based',
+                'alert_threshold': 0.8
+            }
+        }
+    }
+}
+
+
+@dataclass(frozen=True)
+class ActionTemplate:
+    """单个动作的规则模板（不可变）"""
+    action: str
+    # (字段名, 风险评分 -> 字段值)
+    conditions: Tuple[Tuple[str, Callable[[float], Any]], ...]
+    parameters: Tuple[Tuple[str, Callable[[float], Any]], ...]
+
+    def fill_conditions(self, risk_score: float) -> Dict[str, Any]:
+        return {name: value(risk_score) for name, value in self.conditions}
+
+    def fill_parameters(self, risk_score: float) -> Dict[str, Any]:
+        return {name: value(risk_score) for name, value in self.parameters}
+
+
+@dataclass(frozen=True)
+class StrategyTemplate:
+    """防御策略模板（不可变）"""
+    name: str
+    actions: Tuple[ActionTemplate, ...]
+    priority: str
+    duration: float
+    # 对外展示的策略描述（状态接口、规则历史中引用）
+    spec: Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class CompiledStrategySet:
+    """编译后的策略集合（不可变）"""
+    version: int
+    strategies: Mapping[str, StrategyTemplate]
+    fallback_thresholds: Tuple[float, ...]
+    fallback_strategies: Tuple[StrategyTemplate, ...]
+    config: Dict[str, Any]
+
+    def select(self, anomaly_type: str, risk_score: float) -> StrategyTemplate:
+        """按异常类型选择策略，未知类型时按风险评分选择"""
+        strategy = self.strategies.get(anomaly_type) if anomaly_type else None
+        if strategy is None:
+            strategy = self.fallback_strategies[bisect_left(self.fallback_thresholds, risk_score)]
+        return strategy
+
+
+def _compile_value(name: str, spec: Any) -> Callable[[float], Any]:
+    """将模板取值编译为风险评分的函数"""
+    if isinstance(spec, dict) and 'above' in spec:
+        threshold, then, otherwise = spec['above'], spec['then'], spec['else']
+        return lambda risk_score: then if risk_score > threshold else otherwise
+
+    if isinstance(spec, dict) and spec and {'base', 'coef', 'divisor', 'min', 'max'} >= spec.keys():
+        base = spec.get('base', 0)
+        coef = spec.get('coef', 1)
+        divisor = spec.get('divisor', 1)
+        low, high = spec.get('min'), spec.get('max')
+        if divisor == 0:
+            raise ValueError(f"{name}: divisor 不能为 0")
+        if divisor == 1:
+            linear = lambda risk_score: base + risk_score * coef
+        else:
+            linear = lambda risk_score: base + risk_score * coef / divisor
+        if low is not None and high is not None:
+            return lambda risk_score: min(high, max(low, linear(risk_score)))
+        if low is not None:
+            return lambda risk_score: max(low, linear(risk_score))
+        if high is not None:
+            return lambda risk_score: min(high, linear(risk_score))
+        return linear
+
+    if isinstance(spec, (list, dict)):
+        # 可变常量每次复制，避免规则之间共享同一对象
+        constant = copy.deepcopy(spec)
+        return lambda risk_score: copy.deepcopy(constant)
+    return lambda risk_score: spec
+
+
+def _compile_fields(action: str, fields: Dict[str, Any]) -> Tuple[Tuple[str, Callable[[float], Any]], ...]:
+    return tuple((name, _compile_value(f"{action}.{name}", spec)) for name, spec in fields.items())
+
+
+def compile_strategies(config: Dict[str, Any]) -> CompiledStrategySet:
+    """将策略配置编译为模板，配置有误时抛出 ValueError"""
+    try:
+        actions = {}
+        for action, template in config['actions'].items():
+            actions[action] = ActionTemplate(
+                action=action,
+                conditions=_compile_fields(action, template.get('conditions', {})),
+                parameters=_compile_fields(action, template.get('parameters', {}))
+            )
+
+        strategies = {}
+        for name, strategy in config['strategies'].items():
+            # 没有模板的动作仍可下发，条件和参数为空
+            strategy_actions = tuple(actions.get(action) or ActionTemplate(action, (), ())
+                                     for action in strategy['actions'])
+            if not strategy_actions:
+                raise ValueError(f"{name}: 策略至少包含一个动作")
+            spec = {
+                'actions': list(strategy['actions']),
+                'priority': strategy['priority'],
+                'duration': strategy['duration']
+            }
+            strategies[name] = StrategyTemplate(
+                name=name,
+                actions=strategy_actions,
+                priority=strategy['priority'],
+                duration=strategy['duration'],
+                spec=spec
+            )
+
+        fallback = config['fallback']
+        thresholds = tuple(fallback['thresholds'])
+        if len(fallback['strategies']) != len(thresholds) + 1 or list(thresholds) != sorted(thresholds):
+            raise ValueError("fallback: 阈值必须递增且策略数比阈值数多 1")
+        fallback_strategies = tuple(strategies[name] for name in fallback['strategies'])
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"防御策略配置无效: {e!r}") from e
+
+    return CompiledStrategySet(
+        version=config.get('version', 1),
+        strategies=MappingProxyType(strategies),
+        fallback_thresholds=thresholds,
+        fallback_strategies=fallback_strategies,
+        config=copy.deepcopy(config)
+    )
+
+
+def load_strategies(config_path: str = None) -> CompiledStrategySet:
+    """
+    读取并编译策略配置
+    Args:
+        config_path: 策略配置文件，默认 configs/defense_strategies.json，不存在时使用内置默认策略
+    """
+    config_path = config_path or DEFAULT_STRATEGIES_PATH
+    config = copy.deepcopy(DEFAULT_STRATEGIES)
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            loaded = json.load(f)
+        # 策略和动作模板按名称合并，配置中只需写新增或修改的部分
+        for key in ('strategies', 'actions'):
+            config[key].update(loaded.pop(key, {}))
+        config.update(loaded)
+    else:
+        logger.warning(f"Strategy config not found: {config_path}, using built-in strategies")
+    return compile_strategies(config)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Telemetry 二进制格式定义
+与 src/dpu_apps/telemetry/telemetry_collector.c 中的 network_metrics_t 保持一致
+"""
+
+import struct
+from typing import Dict, Any
+
+import numpy as np
+
+# 指标列顺序，与 DataProcessor.feature_names 及 network_metrics_t 字段顺序一致
+METRIC_FIELDS = (
+    'packets_per_sec', 'bytes_per_sec', 'active_connections',
+    'dropped_packets', 'encryption_hits', 'decryption_hits',
+    'cpu_usage', 'memory_usage', 'error_count'
+)
+
+# 整数类型字段（C 端为 uint64_t）
+INTEGER_FIELDS = tuple(name for name in METRIC_FIELDS if name not in ('cpu_usage', 'memory_usage'))
+
+# network_metrics_t 布局：全部为 8 字节字段，无填充，共 80 字节（小端）
+NETWORK_METRICS_DTYPE = np.dtype([
+    ('timestamp', '<u8'),
+    ('packets_per_sec', '<u8'),
+    ('bytes_per_sec', '<u8'),
+    ('active_connections', '<u8'),
+    ('dropped_packets', '<u8'),
+    ('encryption_hits', '<u8'),
+    ('decryption_hits', '<u8'),
+    ('cpu_usage', '<f8'),
+    ('memory_usage', '<f8'),
+    ('error_count', '<u8')
+])
+NETWORK_METRICS_STRUCT = struct.Struct('<7Q2dQ')
+RECORD_SIZE = NETWORK_METRICS_STRUCT.size
+
+assert NETWORK_METRICS_DTYPE.itemsize == RECORD_SIZE
+
+
+def metrics_to_record(metrics: Dict[str, Any]) -> tuple:
+    """将指标字典转换为 network_metrics_t 字段元组"""
+    return (
+        int(metrics.get('timestamp', 0)),
+        int(metrics['packets_per_sec']),
+        int(metrics['bytes_per_sec']),
+        int(metrics['active_connections']),
+        int(metrics['dropped_packets']),
+        int(metrics['encryption_hits']),
+        int(metrics['decryption_hits']),
+        float(metrics['cpu_usage']),
+        float(metrics['memory_usage']),
+        int(metrics['error_count'])
+    )
+
+
+def pack_metrics(metrics: Dict[str, Any]) -> bytes:
+    """将指标字典打包为 network_metrics_t 二进制结构"""
+    return NETWORK_METRICS_STRUCT.pack(*metrics_to_record(metrics))
+
+
+def records_from_matrix(matrix: np.ndarray, timestamp: float) -> np.ndarray:
+    """将 (n, 9) 指标矩阵转换为 network_metrics_t 结构化数组"""
+    records = np.empty(len(matrix), dtype=NETWORK_METRICS_DTYPE)
+    records['timestamp'] = int(timestamp)
+    for i, name in enumerate(METRIC_FIELDS):
+        records[name] = matrix[:, i]
+    return records
+
+
+def records_to_matrix(records: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """将 network_metrics_t 结构化数组转换为 (n, 9) float64 指标矩阵"""
+    if out is None:
+        out = np.empty((len(records), len(METRIC_FIELDS)), dtype=np.float64)
+    for i, name in enumerate(METRIC_FIELDS):
+        out[:, i] = records[name]
+    return out
+
+
+def record_to_metrics(record) -> Dict[str, Any]:
+    """将单条 network_metrics_t 记录转换为指标字典"""
+    values = record.tolist() if hasattr(record, 'tolist') else tuple(record)
+    return dict(zip(NETWORK_METRICS_DTYPE.names, values))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Telemetry 二进制接入
+接收 DOCA 采集器发送的 network_metrics_t 批量数据报（UDP 或 Unix 域套接字）
+
+数据报格式:
+    8 字节批次头: device_id(I) + record_count(I)（小端）
+    record_count 条 80 字节 network_metrics_t 记录
+"""
+
+import os
+import socket
+import struct
+import threading
+import logging
+from typing import Callable, Dict, Any, Iterable, Tuple, Union
+
+import numpy as np
+
+from telemetry_format import (
+    NETWORK_METRICS_DTYPE, NETWORK_METRICS_STRUCT, RECORD_SIZE,
+    metrics_to_record, record_to_metrics
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_HEADER_STRUCT = struct.Struct('<II')
+BATCH_HEADER_SIZE = BATCH_HEADER_STRUCT.size
+MAX_DATAGRAM_SIZE = 65507  # UDP 最大载荷
+MAX_RECORDS_PER_DATAGRAM = (MAX_DATAGRAM_SIZE - BATCH_HEADER_SIZE) // RECORD_SIZE
+
+Address = Union[Tuple[str, int], str]
+
+
+def encode_batch(device_id: int, records: np.ndarray) -> bytes:
+    """将 network_metrics_t 结构化数组编码为数据报"""
+    records = np.ascontiguousarray(records, dtype=NETWORK_METRICS_DTYPE)
+    return BATCH_HEADER_STRUCT.pack(device_id, len(records)) + records.tobytes()
+
+
+def decode_batch(buffer, nbytes: int = None) -> Tuple[int, np.ndarray]:
+    """
+    解码数据报
+    Args:
+        buffer: 数据报缓冲区（bytes/bytearray/memoryview）
+        nbytes: 有效长度，默认为整个缓冲区
+    Returns:
+        (device_id, records)，records 为直接引用 buffer 的零拷贝结构化数组
+    """
+    if nbytes is None:
+        nbytes = len(buffer)
+    if nbytes < BATCH_HEADER_SIZE:
+        raise ValueError(f"数据报过短: {nbytes} 字节")
+
+    device_id, count = BATCH_HEADER_STRUCT.unpack_from(buffer, 0)
+    if nbytes != BATCH_HEADER_SIZE + count * RECORD_SIZE:
+        raise ValueError(f"数据报长度与记录数不符: {nbytes} 字节, {count} 条记录")
+
+    records = np.frombuffer(buffer, dtype=NETWORK_METRICS_DTYPE, count=count, offset=BATCH_HEADER_SIZE)
+    return device_id, records
+
+
+def decode_single(buffer) -> Tuple[int, Dict[str, Any]]:
+    """解码仅包含一条记录的数据报为指标字典（逐条处理时避免创建数组）"""
+    device_id, count = BATCH_HEADER_STRUCT.unpack_from(buffer, 0)
+    if count != 1:
+        raise ValueError(f"期望 1 条记录，实际 {count} 条")
+    values = NETWORK_METRICS_STRUCT.unpack_from(buffer, BATCH_HEADER_SIZE)
+    return device_id, dict(zip(NETWORK_METRICS_DTYPE.names, values))
+
+
+def _create_socket(family: str) -> socket.socket:
+    if family == 'udp':
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if family == 'unix':
+        return socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    raise ValueError(f"不支持的套接字类型: {family}")
+
+
+class TelemetryIngestListener:
+    """Telemetry 数据报监听器"""
+
+    def __init__(self, address: Address, handler: Callable[[int, np.ndarray], None],
+                 family: str = 'udp', recv_buffer_size: int = 4 * 1024 * 1024):
+        """
+        Args:
+            address: UDP 为 (host, port)，Unix 为套接字文件路径
+            handler: 回调 handler(device_id, records)；records 引用接收缓冲区，
+                     仅在回调期间有效，需要保留时请自行 copy()
+            family: 'udp' 或 'unix'
+            recv_buffer_size: 内核接收缓冲区大小
+        """
+        self.address = address
+        self.handler = handler
+        self.family = family
+
+        self.sock = _create_socket(family)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buffer_size)
+        if family == 'unix' and os.path.exists(address):
+            os.unlink(address)
+        self.sock.bind(address)
+        self.sock.settimeout(0.5)
+
+        # 预分配接收缓冲区，recv_into 直接写入
+        self._buffer = bytearray(MAX_DATAGRAM_SIZE)
+        self._view = memoryview(self._buffer)
+
+        self.running = False
+        self.thread = None
+
+        self.stats = {
+            'datagrams': 0,
+            'records': 0,
+            'malformed': 0,
+            'handler_errors': 0
+        }
+
+    @property
+    def bound_address(self) -> Address:
+        """实际绑定地址（端口为 0 时由系统分配）"""
+        return self.sock.getsockname()
+
+    def poll_once(self) -> int:
+        """接收并处理一个数据报，返回记录数（超时返回 0）"""
+        try:
+            nbytes = self.sock.recv_into(self._buffer)
+        except socket.timeout:
+            return 0
+
+        self.stats['datagrams'] += 1
+        try:
+            device_id, records = decode_batch(self._view[:nbytes])
+        except ValueError as e:
+            self.stats['malformed'] += 1
+            logger.warning(f"Malformed telemetry datagram: {e}")
+            return 0
+
+        self.stats['records'] += len(records)
+        try:
+            self.handler(device_id, records)
+        except Exception as e:
+            self.stats['handler_errors'] += 1
+            logger.error(f"Telemetry handler failed: {e}")
+        return len(records)
+
+    def serve_forever(self):
+        """接收循环"""
+        while self.running:
+            try:
+                self.poll_once()
+            except OSError as e:
+                if self.running:
+                    logger.error(f"Telemetry listener error: {e}")
+                break
+
+    def start(self):
+        """在后台线程中启动监听"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Telemetry listener started on {self.family}:{self.bound_address}")
+
+    def stop(self):
+        """停止监听并关闭套接字"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        self.sock.close()
+        if self.family == 'unix' and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取接收统计"""
+        return self.stats.copy()
+
+
+class TelemetrySender:
+    """本地替身发送端：模拟 DOCA 采集器发送 network_metrics_t 数据报"""
+
+    def __init__(self, address: Address, device_id: int = 0, family: str = 'udp'):
+        self.address = address
+        self.device_id = device_id
+        self.sock = _create_socket(family)
+
+    def send_records(self, records: np.ndarray, device_id: int = None):
+        """发送结构化数组，超过单个数据报容量时自动分片"""
+        device_id = self.device_id if device_id is None else device_id
+        for start in range(0, len(records), MAX_RECORDS_PER_DATAGRAM):
+            chunk = records[start:start + MAX_RECORDS_PER_DATAGRAM]
+            self.sock.sendto(encode_batch(device_id, chunk), self.address)
+
+    def send_metrics(self, metrics_list: Iterable[Dict[str, Any]], device_id: int = None):
+        """发送指标字典列表"""
+        records = np.array([metrics_to_record(m) for m in metrics_list], dtype=NETWORK_METRICS_DTYPE)
+        self.send_records(records, device_id)
+
+    def close(self):
+        """关闭套接字"""
+        self.sock.close()
+
+
+# 测试代码
+if __name__ == "__main__":
+    import time
+    from telemetry_simulator import FleetTelemetrySimulator
+    from telemetry_format import records_from_matrix
+    from anomaly_detector import AnomalyDetector
+
+    n_cards = 200
+    detectors = [AnomalyDetector() for _ in range(n_cards)]
+    alerts = []
+
+    def handle(device_id: int, records: np.ndarray):
+        detector = detectors[device_id]
+        for record in records:
+            result = detector.detect_anomaly(record_to_metrics(record))
+            if result['is_anomaly']:
+                alerts.append((device_id, result['anomaly_type']))
+
+    listener = TelemetryIngestListener(('127.0.0.1', 0), handle)
+    listener.start()
+
+    fleet = FleetTelemetrySimulator(n_devices=n_cards, seed=0)
+    fleet.trigger_anomaly('ddos', device_ids=[7])
+    sender = TelemetrySender(listener.bound_address)
+
+    # 每张卡 10 Hz，每秒打包发送一次
+    start = time.perf_counter()
+    for second in range(5):
+        per_card = [[] for _ in range(n_cards)]
+        for step in range(10):
+            timestamp = time.time() + second + step / 10
+            records = records_from_matrix(fleet.get_metrics(timestamp), timestamp)
+            for card in range(n_cards):
+                per_card[card].append(records[card])
+        for card in range(n_cards):
+            sender.send_records(np.array(per_card[card], dtype=NETWORK_METRICS_DTYPE), card)
+
+    time.sleep(0.5)
+    listener.stop()
+    sender.close()
+    print(f"接收统计: {listener.get_stats()}, 耗时 {time.perf_counter() - start:.2f} 秒")
+    print(f"告警设备: {sorted(set(device for device, _ in alerts))}")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Telemetry 录制与回放
+以 network_metrics_t 定长二进制记录持久化指标流，回放时内存映射文件
+
+文件布局:
+    16 字节文件头: magic(4s) + version(H) + record_size(H) + n_devices(I) + 保留(4x)
+    N 条 80 字节 network_metrics_t 记录（小端）
+"""
+
+import os
+import struct
+import logging
+from typing import Dict, Any, Iterator, Optional
+
+import numpy as np
+
+from telemetry_format import (
+    METRIC_FIELDS, NETWORK_METRICS_DTYPE, RECORD_SIZE, pack_metrics,
+    records_from_matrix, records_to_matrix, record_to_metrics
+)
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b'DPUT'
+FILE_VERSION = 1
+HEADER_STRUCT = struct.Struct('<4sHHI4x')
+HEADER_SIZE = HEADER_STRUCT.size
+
+
+class TelemetryRecorder:
+    """Telemetry 录制器：向文件追加定长记录"""
+
+    def __init__(self, filepath: str, n_devices: int = 1):
+        """
+        Args:
+            filepath: 录制文件路径（已存在时追加）
+            n_devices: 每个 tick 的记录数（集群录制时为设备数）
+        """
+        self.filepath = filepath
+        self.n_devices = n_devices
+
+        size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+        exists = size >= HEADER_SIZE
+        if exists:
+            with open(filepath, 'rb') as f:
+                header = _read_header(f.read(HEADER_SIZE))
+            if header['n_devices'] != n_devices:
+                raise ValueError(f"录制文件设备数不一致: {header['n_devices']} != {n_devices}")
+            # 截掉上次录制中断留下的不完整记录，否则之后追加的记录全部错位
+            torn = (size - HEADER_SIZE) % RECORD_SIZE
+            if torn:
+                logger.warning(f"Truncating {torn} bytes of torn record from {filepath}")
+                os.truncate(filepath, size - torn)
+        elif size:
+            # 文件头本身不完整：文件中不可能有完整记录，重写文件头
+            logger.warning(f"Discarding {size} bytes of incomplete header in {filepath}")
+
+        self._file = open(filepath, 'ab' if exists else 'wb')
+        if not exists:
+            self._file.write(HEADER_STRUCT.pack(FILE_MAGIC, FILE_VERSION, RECORD_SIZE, n_devices))
+
+        self.records_written = 0
+
+    def append(self, metrics: Dict[str, Any]):
+        """追加一条指标字典"""
+        self._file.write(pack_metrics(metrics))
+        self.records_written += 1
+
+    def append_records(self, records: np.ndarray):
+        """追加 network_metrics_t 结构化数组"""
+        self._file.write(np.ascontiguousarray(records, dtype=NETWORK_METRICS_DTYPE).tobytes())
+        self.records_written += len(records)
+
+    def append_block(self, matrix: np.ndarray, timestamp: float):
+        """追加一个 (n_devices, 9) 指标矩阵（如 FleetTelemetrySimulator 的一次 tick）"""
+        self.append_records(records_from_matrix(matrix, timestamp))
+
+    def flush(self):
+        """刷新到磁盘"""
+        self._file.flush()
+
+    def close(self):
+        """关闭录制文件"""
+        if not self._file.closed:
+            self._file.close()
+            logger.info(f"Recorded {self.records_written} records to {self.filepath}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TelemetryReplayer:
+    """Telemetry 回放器：内存映射录制文件，提供零拷贝 NumPy 视图"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+        with open(filepath, 'rb') as f:
+            header = _read_header(f.read(HEADER_SIZE))
+        self.n_devices = header['n_devices']
+
+        # 末尾不完整的记录（录制中断）直接忽略
+        count = (os.path.getsize(filepath) - HEADER_SIZE) // RECORD_SIZE
+        if count > 0:
+            self.records = np.memmap(filepath, dtype=NETWORK_METRICS_DTYPE, mode='r',
+                                     offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=NETWORK_METRICS_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def field(self, name: str) -> np.ndarray:
+        """获取单个字段的零拷贝视图"""
+        return self.records[name]
+
+    def ticks(self) -> np.ndarray:
+        """按 tick 组织的零拷贝视图，形状 (n_ticks, n_devices)"""
+        n_ticks = len(self.records) // self.n_devices
+        return self.records[:n_ticks * self.n_devices].reshape(n_ticks, self.n_devices)
+
+    def matrix(self, start: int = 0, stop: Optional[int] = None,
+               out: np.ndarray = None) -> np.ndarray:
+        """将记录区间转换为 (n, 9) float64 指标矩阵，可复用 out 缓冲区"""
+        return records_to_matrix(self.records[start:stop], out)
+
+    def iter_batches(self, batch_size: int = 65536) -> Iterator[np.ndarray]:
+        """分批产出 (batch, 9) 指标矩阵，批间复用同一缓冲区"""
+        buffer = np.empty((batch_size, len(METRIC_FIELDS)), dtype=np.float64)
+        for start in range(0, len(self.records), batch_size):
+            chunk = self.records[start:start + batch_size]
+            yield records_to_matrix(chunk, buffer[:len(chunk)])
+
+    def iter_metrics(self) -> Iterator[Dict[str, Any]]:
+        """逐条产出指标字典，用于驱动基于字典的检测器"""
+        for record in self.records:
+            yield record_to_metrics(record)
+
+    def replay(self, detector, defense_controller=None) -> int:
+        """将录制数据逐条送入检测器（如 HybridAnomalyDetector），返回处理条数"""
+        count = 0
+        for metrics in self.iter_metrics():
+            detector.detect_anomaly(metrics, defense_controller)
+            count += 1
+        return count
+
+    def close(self):
+        """释放内存映射"""
+        mmap_obj = getattr(self.records, '_mmap', None)
+        self.records = np.empty(0, dtype=NETWORK_METRICS_DTYPE)
+        if mmap_obj is not None:
+            mmap_obj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _read_header(data: bytes) -> Dict[str, Any]:
+    """解析并校验文件头"""
+    if len(data) < HEADER_SIZE:
+        raise ValueError("录制文件头不完整")
+    magic, version, record_size, n_devices = HEADER_STRUCT.unpack(data)
+    if magic != FILE_MAGIC:
+        raise ValueError(f"不是 Telemetry 录制文件: magic={magic!r}")
+    if version != FILE_VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"不支持的录制文件版本: version={version}, record_size={record_size}")
+    return {'version': version, 'record_size': record_size, 'n_devices': n_devices}
+
+
+# 测试代码
+if __name__ == "__main__":
+    import time
+    import tempfile
+    from telemetry_simulator import FleetTelemetrySimulator
+
+    path = os.path.join(tempfile.gettempdir(), 'telemetry_demo.bin')
+    if os.path.exists(path):
+        os.remove(path)
+
+    fleet = FleetTelemetrySimulator(n_devices=1000, seed=0)
+    with TelemetryRecorder(path, n_devices=fleet.n_devices) as recorder:
+        for tick in range(600):
+            timestamp = 1700000000 + tick
+            recorder.append_block(fleet.get_metrics(timestamp), timestamp)
+
+    with TelemetryReplayer(path) as replayer:
+        start = time.perf_counter()
+        rows = sum(len(batch) for batch in replayer.iter_batches())
+        elapsed = time.perf_counter() - start
+        print(f"回放 {rows} 条记录，耗时 {elapsed:.3f} 秒 ({rows / elapsed:,.0f} 条/秒)")
+        print(f"tick 视图形状: {replayer.ticks().shape}")
@@ -7,12 +7,20 @@ DPU Telemetry 数据模拟器
 import random
 import time
 import math
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+from telemetry_format import METRIC_FIELDS, INTEGER_FIELDS
+from rolling_stats import RollingStats
 
 class TelemetrySimulator:
     """DPU Telemetry 数据模拟器"""
     
-    def __init__(self):
+    def __init__(self, clock=None):
+        # 时间源（默认真实时间，可注入 sim_clock.VirtualClock）
+        self.clock = clock or time
+        
         # 基础参数
         self.base_packets_per_sec = 1000
         self.base_bytes_per_sec = 1000000
@@ -30,12 +38,16 @@ class TelemetrySimulator:
         self.time_series = []
         self.max_history = 100
         
+        # 最近 20 个数据点的滚动统计（get_statistics 使用，每个点 O(1) 更新）
+        self.stats_window = 20
+        self.rolling_stats = RollingStats(windows=(self.stats_window,))
+        
         # 初始化历史数据
         self._initialize_history()
     
     def _initialize_history(self):
         """初始化历史数据"""
-        current_time = time.time()
+        current_time = self.clock.time()
         for i in range(self.max_history):
             timestamp = current_time - (self.max_history - i)
             self.time_series.append({
@@ -50,10 +62,11 @@ class TelemetrySimulator:
                 'memory_usage': self.base_memory_usage + random.uniform(-3, 3),
                 'error_count': random.randint(0, 2)
             })
+            self.rolling_stats.update_metrics(self.time_series[-1])
     
     def get_metrics(self) -> Dict[str, Any]:
         """获取当前网络指标"""
-        current_time = time.time()
+        current_time = self.clock.time()
         
         # 检查异常模式是否结束
         if self.anomaly_mode and (current_time - self.anomaly_start_time) > self.anomaly_duration:
@@ -72,6 +85,7 @@ class TelemetrySimulator:
         
         # 更新历史数据
         self.time_series.append(metrics)
+        self.rolling_stats.update_metrics(metrics)
         if len(self.time_series) > self.max_history:
             self.time_series.pop(0)
         
@@ -160,7 +174,7 @@ class TelemetrySimulator:
         
         self.anomaly_mode = True
         self.anomaly_type = anomaly_type
-        self.anomaly_start_time = time.time()
+        self.anomaly_start_time = self.clock.time()
         
         # 新增：通知防御控制器有新的异常
         if hasattr(self, 'defense_controller') and self.defense_controller:
@@ -177,20 +191,17 @@ class TelemetrySimulator:
         if not self.time_series:
             return {}
         
-        recent_data = self.time_series[-20:]  # 最近20个数据点
-        
-        packets = [d['packets_per_sec'] for d in recent_data]
-        bytes_data = [d['bytes_per_sec'] for d in recent_data]
-        connections = [d['active_connections'] for d in recent_data]
-        cpu = [d['cpu_usage'] for d in recent_data]
+        stats = self.rolling_stats
+        window = stats.window(self.stats_window)
+        pps_column = stats.field_index['packets_per_sec']
         
         return {
-            'avg_packets_per_sec': sum(packets) / len(packets),
-            'avg_bytes_per_sec': sum(bytes_data) / len(bytes_data),
-            'avg_connections': sum(connections) / len(connections),
-            'avg_cpu_usage': sum(cpu) / len(cpu),
-            'max_packets_per_sec': max(packets),
-            'min_packets_per_sec': min(packets),
+            'avg_packets_per_sec': stats.mean(self.stats_window, 'packets_per_sec'),
+            'avg_bytes_per_sec': stats.mean(self.stats_window, 'bytes_per_sec'),
+            'avg_connections': stats.mean(self.stats_window, 'active_connections'),
+            'avg_cpu_usage': stats.mean(self.stats_window, 'cpu_usage'),
+            'max_packets_per_sec': int(window.maximum()[pps_column]),
+            'min_packets_per_sec': int(window.minimum()[pps_column]),
             'anomaly_mode': self.anomaly_mode,
             'anomaly_type': self.anomaly_type
         }
@@ -200,6 +211,192 @@ class TelemetrySimulator:
         """设置防御控制器引用，用于通知异常触发"""
         self.defense_controller = defense_controller
 
+class FleetTelemetrySimulator:
+    """
+    DPU 集群 Telemetry 模拟器（向量化）
+
+    每个设备的基础参数和异常状态都保存在 NumPy 数组中，
+    每次 tick 生成一个 (n_devices, 9) 的指标矩阵，列顺序见 METRIC_FIELDS。
+    各生成器与 TelemetrySimulator 中的单设备版本保持相同的数值模型。
+    """
+
+    ANOMALY_CODES = {
+        'normal': 0,
+        'ddos': 1,
+        'resource_exhaustion': 2,
+        'packet_loss': 3
+    }
+
+    def __init__(self, n_devices: int = 500, seed: Optional[int] = None,
+                 base_jitter: float = 0.0, clock=None):
+        self.n_devices = n_devices
+        self.clock = clock or time
+        self.rng = np.random.default_rng(seed)
+
+        # 基础参数（每设备一份，base_jitter 控制设备间差异）
+        self.base_packets_per_sec = 1000 * self._jitter(base_jitter)
+        self.base_bytes_per_sec = 1000000 * self._jitter(base_jitter)
+        self.base_connections = 100 * self._jitter(base_jitter)
+        self.base_cpu_usage = 30.0 * self._jitter(base_jitter)
+        self.base_memory_usage = 50.0 * self._jitter(base_jitter)
+
+        # 异常状态
+        self.anomaly_code = np.zeros(n_devices, dtype=np.int8)
+        self.anomaly_start_time = np.zeros(n_devices, dtype=np.float64)
+        self.anomaly_duration = 30  # 异常持续30秒
+
+        # 输出缓冲区，每次 tick 原地覆盖
+        self.metrics = np.zeros((n_devices, len(METRIC_FIELDS)), dtype=np.float64)
+        self.last_timestamp = 0.0
+
+    def _jitter(self, base_jitter: float) -> np.ndarray:
+        """生成每设备的基础参数扰动系数"""
+        if base_jitter <= 0:
+            return np.ones(self.n_devices)
+        return 1 + self.rng.uniform(-base_jitter, base_jitter, self.n_devices)
+
+    def get_metrics(self, timestamp: float = None) -> np.ndarray:
+        """
+        获取当前所有设备的网络指标
+        Returns:
+            (n_devices, 9) 指标矩阵（内部缓冲区，下一次 tick 会被覆盖）
+        """
+        current_time = self.clock.time() if timestamp is None else timestamp
+
+        # 检查异常模式是否结束
+        elapsed = current_time - self.anomaly_start_time
+        expired = (self.anomaly_code != 0) & (elapsed > self.anomaly_duration)
+        if expired.any():
+            self.anomaly_code[expired] = 0
+
+        # 先整体生成正常指标，再覆盖处于异常状态的设备
+        self._generate_normal_block(current_time)
+
+        if self.anomaly_code.any():
+            intensity = np.minimum(1.0, elapsed / 5.0)  # 5秒内达到最大强度
+            for generator, code in ((self._generate_ddos_block, 1),
+                                    (self._generate_resource_block, 2),
+                                    (self._generate_packet_loss_block, 3)):
+                rows = np.flatnonzero(self.anomaly_code == code)
+                if rows.size:
+                    generator(rows, intensity[rows])
+
+        self.last_timestamp = current_time
+        return self.metrics
+
+    def _randint(self, low: int, high: int, size: int) -> np.ndarray:
+        """闭区间 [low, high] 的整数随机数（对应 random.randint）"""
+        return self.rng.integers(low, high + 1, size=size)
+
+    def _generate_normal_block(self, timestamp: float):
+        """生成正常指标"""
+        n = self.n_devices
+        out = self.metrics
+        time_factor = math.sin(timestamp / 60) * 0.1  # 每分钟的周期性变化
+
+        noise = self.rng.uniform(-1.0, 1.0, size=(5, n))
+        out[:, 0] = np.trunc(self.base_packets_per_sec * (1 + time_factor + 0.1 * noise[0]))
+        out[:, 1] = np.trunc(self.base_bytes_per_sec * (1 + time_factor + 0.1 * noise[1]))
+        out[:, 2] = np.trunc(self.base_connections * (1 + time_factor + 0.2 * noise[2]))
+        out[:, 3] = self._randint(0, 5, n)
+        out[:, 4] = self._randint(50, 150, n)
+        out[:, 5] = self._randint(50, 150, n)
+        out[:, 6] = np.clip(self.base_cpu_usage + 5 * noise[3], 0, 100)
+        out[:, 7] = np.clip(self.base_memory_usage + 3 * noise[4], 0, 100)
+        out[:, 8] = self._randint(0, 2, n)
+
+    def _generate_ddos_block(self, rows: np.ndarray, intensity: np.ndarray):
+        """生成DDoS攻击指标"""
+        out = self.metrics
+        multiplier = 1 + intensity * 10  # 流量增加10倍
+
+        out[rows, 0] = np.trunc(self.base_packets_per_sec[rows] * multiplier)
+        out[rows, 1] = np.trunc(self.base_bytes_per_sec[rows] * multiplier)
+        out[rows, 2] = np.trunc(self.base_connections[rows] * multiplier * 2)
+        out[rows, 3] = np.trunc(50 * intensity)
+        out[rows, 6] = np.minimum(100, self.base_cpu_usage[rows] + intensity * 40)
+        out[rows, 7] = np.minimum(100, self.base_memory_usage[rows] + intensity * 20)
+        out[rows, 8] = np.trunc(10 * intensity)
+
+    def _generate_resource_block(self, rows: np.ndarray, intensity: np.ndarray):
+        """生成资源耗尽指标"""
+        out = self.metrics
+
+        out[rows, 0] = np.trunc(self.base_packets_per_sec[rows] * (1 - intensity * 0.5))
+        out[rows, 1] = np.trunc(self.base_bytes_per_sec[rows] * (1 - intensity * 0.5))
+        out[rows, 2] = np.trunc(self.base_connections[rows] * (1 - intensity * 0.3))
+        out[rows, 3] = np.trunc(20 * intensity)
+        out[rows, 6] = np.minimum(100, self.base_cpu_usage[rows] + intensity * 50)
+        out[rows, 7] = np.minimum(100, self.base_memory_usage[rows] + intensity * 30)
+        out[rows, 8] = np.trunc(20 * intensity)
+
+    def _generate_packet_loss_block(self, rows: np.ndarray, intensity: np.ndarray):
+        """生成丢包异常指标"""
+        out = self.metrics
+
+        out[rows, 0] = np.trunc(self.base_packets_per_sec[rows] * (1 + intensity * 0.5))
+        out[rows, 1] = np.trunc(self.base_bytes_per_sec[rows] * (1 + intensity * 0.5))
+        out[rows, 2] = np.trunc(self.base_connections[rows] * (1 + intensity * 0.3))
+        out[rows, 3] = np.trunc(100 * intensity)
+        out[rows, 6] = np.minimum(100, self.base_cpu_usage[rows] + intensity * 20)
+        out[rows, 7] = np.minimum(100, self.base_memory_usage[rows] + intensity * 10)
+        out[rows, 8] = np.trunc(15 * intensity)
+
+    def trigger_anomaly(self, anomaly_type: str = "random",
+                        device_ids: Sequence[int] = None, timestamp: float = None):
+        """
+        触发异常场景
+        Args:
+            anomaly_type: 异常类型，"random" 表示每个设备随机选择
+            device_ids: 目标设备下标，None 表示全部设备
+        """
+        rows = np.arange(self.n_devices) if device_ids is None else np.asarray(device_ids)
+
+        if anomaly_type == "random":
+            codes = self.rng.integers(1, len(self.ANOMALY_CODES), size=rows.size)
+        elif anomaly_type in self.ANOMALY_CODES:
+            codes = self.ANOMALY_CODES[anomaly_type]
+        else:
+            raise ValueError(f"未知的异常类型: {anomaly_type}")
+
+        self.anomaly_code[rows] = codes
+        self.anomaly_start_time[rows] = self.clock.time() if timestamp is None else timestamp
+
+    def clear_anomaly(self, device_ids: Sequence[int] = None):
+        """结束异常场景"""
+        if device_ids is None:
+            self.anomaly_code[:] = 0
+        else:
+            self.anomaly_code[np.asarray(device_ids)] = 0
+
+    def get_device_metrics(self, device_id: int) -> Dict[str, Any]:
+        """以字典形式获取单个设备的最新指标（兼容单设备检测器）"""
+        row = self.metrics[device_id]
+        metrics = {name: row[i].item() for i, name in enumerate(METRIC_FIELDS)}
+        for name in INTEGER_FIELDS:
+            metrics[name] = int(metrics[name])
+        metrics['timestamp'] = self.last_timestamp
+        return metrics
+
+    def get_anomaly_types(self) -> List[str]:
+        """获取每个设备当前的异常类型"""
+        names = {code: name for name, code in self.ANOMALY_CODES.items()}
+        return [names[int(code)] for code in self.anomaly_code]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取集群统计信息（基于最近一次 tick）"""
+        metrics = self.metrics
+        return {
+            'n_devices': self.n_devices,
+            'avg_packets_per_sec': float(metrics[:, 0].mean()),
+            'avg_bytes_per_sec': float(metrics[:, 1].mean()),
+            'avg_connections': float(metrics[:, 2].mean()),
+            'avg_cpu_usage': float(metrics[:, 6].mean()),
+            'max_packets_per_sec': float(metrics[:, 0].max()),
+            'min_packets_per_sec': float(metrics[:, 0].min()),
+            'anomalous_devices': int(np.count_nonzero(self.anomaly_code))
+        }
+
 # 测试代码
 if __name__ == "__main__":
     simulator = TelemetrySimulator()